@@ -0,0 +1,3 @@
+# Benchmarks for PyGTV.
+#   - synthetic.py: generates synthetic layers (.shp, .shx, .dbf and .prj files)
+#   - run.py: times each stage of the export and compares the results against a baseline
@@ -0,0 +1,155 @@
+#! /usr/bin/env python
+# Times and measures the memory used by each stage of the export of synthetic
+# layers (see synthetic.py) and saves the results as a JSON file that can be
+# compared against a previous run.
+#
+# Stages:
+#   - shp_read:             FileShp.read
+#   - dbf_read:             FileDbf.read
+#   - get_records_as_lists: FileDbf.get_records_as_lists
+#   - get_columns:          FileDbf.get_columns
+#   - toVTK:                FileShp.toVTK (with the arrays returned by get_columns)
+#
+# Example:
+#   python -m benchmarks.run --types polygon point --sizes 1e3 1e5 --out new.json --baseline old.json
+########################################################################
+
+import os, sys, io, json, time, platform, tempfile, tracemalloc, contextlib
+from argparse import ArgumentParser
+
+import numpy as np
+
+from gtv.files.shp import FileShp
+from gtv.files.dbf import FileDbf
+from gtv.version import PYGTV_VERSION
+
+from .synthetic import LAYER_TYPES, make_layer
+
+STAGES = ["shp_read", "dbf_read", "get_records_as_lists", "get_columns", "toVTK"]
+
+def _measure(func, repeat):
+    """ Returns (result, best time in seconds, peak of traced memory in MB).
+        Time is measured without tracing memory, then func is called once more with tracemalloc.
+    """
+    times = []
+    for r in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):   # readers print a lot of information
+            t0 = time.perf_counter()
+            result = func()
+            times.append(time.perf_counter() - t0)
+        del result
+
+    tracemalloc.start()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = func()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, min(times), peak / 1.0e6
+
+def run_case(root, dst, engine = "numpy", workers = None, repeat = 3):
+    """ Runs all stages for one layer. Returns a dictionary {stage: {"time": ..., "peak_mb": ...}}.
+        A stage that fails stores the error instead, and the stages that depend on it are skipped.
+    """
+    results = {}
+    shp, dbf, columns = None, None, None
+
+    def run(stage, func):
+        try:
+            result, t, peak = _measure(func, repeat)
+            results[stage] = {"time" : t, "peak_mb" : peak}
+            return result
+        except Exception as e:
+            results[stage] = {"error" : "%s: %s"%(type(e).__name__, e)}
+            return None
+
+    shp = run("shp_read", lambda: FileShp.read(root + ".shp", engine = engine, workers = workers))
+    dbf = run("dbf_read", lambda: FileDbf.read(root + ".dbf", engine = engine))
+    if dbf is not None:
+        run("get_records_as_lists", dbf.get_records_as_lists)
+        columns = run("get_columns", dbf.get_columns)
+    if shp is not None and columns is not None:
+        vals, text = columns
+        run("toVTK", lambda: shp.toVTK(dst, vals = vals, text = text))
+    return results
+
+def compare(results, baseline, threshold = 0.1):
+    """ Prints the ratio new/old time of every case and stage that is present in both runs.
+        Returns the number of regressions (slower than baseline by more than threshold).
+    """
+    old = {(r["case"], r["stage"]) : r for r in baseline["results"]}
+    nregressions = 0
+    print("%-40s %-22s %10s %10s %8s"%("case", "stage", "old [s]", "new [s]", "ratio"))
+    for r in results["results"]:
+        o = old.get((r["case"], r["stage"]))
+        if o is None or "time" not in o or "time" not in r: continue
+        ratio = r["time"] / o["time"] if o["time"] > 0 else float("inf")
+        flag = ""
+        if ratio > 1.0 + threshold:
+            flag = "  <-- REGRESSION"
+            nregressions = nregressions + 1
+        print("%-40s %-22s %10.4f %10.4f %8.2f%s"%(r["case"], r["stage"], o["time"], r["time"], ratio, flag))
+    return nregressions
+
+def setup_cmd_parser():
+    parser = ArgumentParser(description = "PyGTV benchmarks. PyGTV version: " + PYGTV_VERSION)
+    parser.add_argument("--types", nargs = '+', default = list(LAYER_TYPES.keys()), choices = list(LAYER_TYPES.keys()),
+                        help = "layer types to benchmark")
+    parser.add_argument("--sizes", nargs = '+', type = float, default = [1e3, 1e4, 1e5],
+                        help = "number of vertices of each layer (e.g. 1e3 1e5 1e7)")
+    parser.add_argument("--fields", type = int, default = 8,
+                        help = "number of fields (attribute width) of the .dbf files")
+    parser.add_argument("--points-per-shape", dest = "points_per_shape", type = int, default = 100)
+    parser.add_argument("--parts-per-shape", dest = "parts_per_shape", type = int, default = 1)
+    parser.add_argument("--engine", default = "numpy", choices = ["python", "numpy"],
+                        help = "engine used to read .shp and .dbf files")
+    parser.add_argument("--workers", type = int, default = None,
+                        help = "number of processes used to read .shp files")
+    parser.add_argument("--repeat", type = int, default = 3, help = "timing runs per stage (best is kept)")
+    parser.add_argument("--data", default = None,
+                        help = "directory where synthetic layers are stored (default: temporary directory)")
+    parser.add_argument("--out", default = None, help = "path to JSON file with the results")
+    parser.add_argument("--baseline", default = None, help = "path to JSON file with results to compare against")
+    parser.add_argument("--threshold", type = float, default = 0.1,
+                        help = "relative slowdown reported as a regression (default: 0.1)")
+    return parser.parse_args()
+
+def main():
+    args = setup_cmd_parser()
+    data = args.data if args.data else tempfile.mkdtemp(prefix = "pygtv_bench_")
+    out_dir = tempfile.mkdtemp(prefix = "pygtv_vtk_")
+
+    results = { "meta" : { "pygtv" : PYGTV_VERSION, "python" : platform.python_version(),             \
+                           "numpy" : np.__version__, "platform" : platform.platform(),                \
+                           "engine" : args.engine, "workers" : args.workers, "fields" : args.fields,  \
+                           "date" : time.strftime("%Y-%m-%d %H:%M:%S") },                           \
+                "results" : [] }
+
+    for layer_type in args.types:
+        for size in args.sizes:
+            root = make_layer(data, layer_type, int(size), args.fields, args.points_per_shape, args.parts_per_shape)
+            case = os.path.basename(root)
+            stages = run_case(root, os.path.join(out_dir, case), args.engine, args.workers, args.repeat)
+            for stage in STAGES:
+                if stage not in stages: continue
+                r = dict(case = case, stage = stage, **stages[stage])
+                results["results"].append(r)
+                if "error" in r:
+                    print("%-40s %-22s ERROR: %s"%(case, stage, r["error"]))
+                else:
+                    print("%-40s %-22s %10.4f s %10.1f MB"%(case, stage, r["time"], r["peak_mb"]))
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent = 2)
+        print("Results saved to: " + args.out)
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold) > 0:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+# Generates synthetic layers (.shp, .shx and .dbf files) to benchmark PyGTV.
+#
+# All shapes in a layer have the same number of parts and points, so every
+# record has the same size and the whole file can be written at once through
+# a NumPy structured dtype. Shapes are regular polygons (or their vertices)
+# around random centers, and each part is a closed ring.
+# REFERENCE: ESRI Shapefile Technical Description
+########################################################################
+
+import os
+import struct
+
+import numpy as np
+
+# name: (shape type, has parts, has z)
+LAYER_TYPES = { "point"      : (1,  False, False), \
+                "multipoint" : (8,  False, False), \
+                "polyline"   : (3,  True,  False), \
+                "polygon"    : (5,  True,  False), \
+                "polygonz"   : (15, True,  True) }
+
+# fields of the .dbf file are created cycling over these descriptors: (type, length, decimals)
+FIELD_TYPES = [("N", 18, 6), ("N", 10, 0), ("C", 32, 0), ("D", 8, 0)]
+
+def _file_header(shape_type, length, bbox):
+    """ Header (100 bytes) shared by .shp and .shx files. length in bytes. """
+    xmin, xmax, ymin, ymax, zmin, zmax = bbox
+    h = struct.pack(">7i", 9994, 0, 0, 0, 0, 0, length // 2)
+    h = h + struct.pack("<2i", 1000, shape_type)
+    h = h + struct.pack("<8d", xmin, ymin, xmax, ymax, zmin, zmax, 0.0, 0.0)
+    return h
+
+def _rings(rng, nshapes, nparts, npoints_part, extent):
+    """ Returns (nshapes, nparts * npoints_part, 2) coordinates. Each part is a closed ring. """
+    centers = rng.random((nshapes, 1, 1, 2)) * extent
+    radius = extent / np.sqrt(nshapes) * 0.4 / np.arange(1, nparts + 1).reshape(1, nparts, 1, 1)
+    t = np.linspace(0.0, -2.0 * np.pi, npoints_part)          # clockwise, last point = first point
+    ring = np.stack((np.cos(t), np.sin(t)), axis = -1).reshape(1, 1, npoints_part, 2)
+    xy = centers + radius * ring
+    return xy.reshape(nshapes, nparts * npoints_part, 2)
+
+def write_shp(root, layer_type, nvertices, points_per_shape = 100, parts_per_shape = 1, extent = 1.0e5, seed = 0):
+    """ Writes root.shp and root.shx with about nvertices points.
+
+        :param layer_type: one of the keys of LAYER_TYPES
+        :param points_per_shape: points in each shape (ignored for points)
+        :param parts_per_shape: parts in each shape (only for polylines and polygons)
+        :return: number of shapes in the layer
+    """
+    shape_type, has_parts, has_z = LAYER_TYPES[layer_type]
+    rng = np.random.default_rng(seed)
+
+    if shape_type == 1:
+        nshapes, nparts, npp = nvertices, 1, 1
+    else:
+        nparts = parts_per_shape if has_parts else 1
+        npp = max(points_per_shape // nparts, 4 if has_parts else 1)
+        nshapes = max(nvertices // (nparts * npp), 1)
+    npoints = nparts * npp
+
+    if shape_type == 1:
+        xy = rng.random((nshapes, 1, 2)) * extent
+        fields = [("type", "<i4"), ("xy", "<f8", (2,))]
+    else:
+        xy = _rings(rng, nshapes, nparts, npp, extent)
+        fields = [("type", "<i4"), ("bbox", "<f8", (4,))]
+        if has_parts: fields.append(("nparts", "<i4"))
+        fields.append(("npoints", "<i4"))
+        if has_parts: fields.append(("parts", "<i4", (nparts,)))
+        fields.append(("xy", "<f8", (npoints, 2)))
+        if has_z:
+            fields = fields + [("zrange", "<f8", (2,)), ("z", "<f8", (npoints,)), \
+                               ("mrange", "<f8", (2,)), ("m", "<f8", (npoints,))]
+
+    content = np.dtype(fields)
+    rec = np.zeros(nshapes, dtype = np.dtype([("num", ">i4"), ("length", ">i4")] + fields))
+    rec["num"] = np.arange(1, nshapes + 1)
+    rec["length"] = content.itemsize // 2
+    rec["type"] = shape_type
+    if shape_type == 1:
+        rec["xy"] = xy[:, 0, :]
+    else:
+        mn, mx = xy.min(axis = 1), xy.max(axis = 1)
+        rec["bbox"] = np.column_stack((mn[:, 0], mn[:, 1], mx[:, 0], mx[:, 1]))
+        rec["npoints"] = npoints
+        rec["xy"] = xy
+        if has_parts:
+            rec["nparts"] = nparts
+            rec["parts"] = np.arange(nparts) * npp
+        if has_z:
+            z = rng.random((nshapes, npoints)) * 100.0
+            rec["z"] = z
+            rec["zrange"] = np.column_stack((z.min(axis = 1), z.max(axis = 1)))
+            rec["m"] = 0.0
+
+    flat = xy.reshape(-1, 2)
+    zmin, zmax = (0.0, 100.0) if has_z else (0.0, 0.0)
+    bbox = (flat[:, 0].min(), flat[:, 0].max(), flat[:, 1].min(), flat[:, 1].max(), zmin, zmax)
+
+    with open(root + ".shp", "wb") as f:
+        f.write(_file_header(shape_type, 100 + rec.nbytes, bbox))
+        rec.tofile(f)
+
+    # index: offset and content length of each record in 16-bit words
+    index = np.empty((nshapes, 2), dtype = ">i4")
+    index[:, 0] = (100 + np.arange(nshapes) * rec.dtype.itemsize) // 2
+    index[:, 1] = content.itemsize // 2
+    with open(root + ".shx", "wb") as f:
+        f.write(_file_header(shape_type, 100 + index.nbytes, bbox))
+        index.tofile(f)
+
+    return nshapes
+
+def write_dbf(root, nrecords, nfields = 8, seed = 0):
+    """ Writes root.dbf with nrecords records and nfields fields (see FIELD_TYPES). """
+    rng = np.random.default_rng(seed)
+    descriptors = [(("F%d"%i).encode("ascii"),) + FIELD_TYPES[i % len(FIELD_TYPES)] for i in range(nfields)]
+    size_record = 1 + sum(d[2] for d in descriptors)
+    size_header = 32 + 32 * nfields + 1
+
+    table = np.zeros(nrecords, dtype = np.dtype([("deleted", "S1")] + [("f%d"%i, "S%d"%d[2]) for i, d in enumerate(descriptors)]))
+    table["deleted"] = b" "
+    for i, (name, ftype, length, decimal) in enumerate(descriptors):
+        if ftype == "N":
+            v = rng.random(nrecords) * 1000.0
+            col = np.char.mod("%" + str(length) + "." + str(decimal) + "f", v)
+        elif ftype == "C":
+            col = np.char.ljust(np.char.mod("record %d", np.arange(nrecords)), length)
+        else:
+            days = rng.integers(0, 20000, nrecords).astype("datetime64[D]")
+            col = np.char.replace(days.astype("U10"), "-", "")
+        table["f%d"%i] = np.char.encode(col, "ascii")
+
+    with open(root + ".dbf", "wb") as f:
+        f.write(struct.pack("<4B", 3, 124, 1, 1))
+        f.write(struct.pack("<I2H", nrecords, size_header, size_record))
+        f.write(b"\x00" * 20)
+        for name, ftype, length, decimal in descriptors:
+            f.write(name.ljust(11, b"\x00") + ftype.encode("ascii") + b"\x00" * 4)
+            f.write(struct.pack("<2B", length, decimal) + b"\x00" * 14)
+        f.write(b"\x0d")
+        table.tofile(f)
+        f.write(b"\x1a")
+
+def make_layer(directory, layer_type, nvertices, nfields = 8, points_per_shape = 100, parts_per_shape = 1, seed = 0):
+    """ Writes a complete layer (.shp, .shx, .dbf and .prj files) and returns the path without extension.
+        Files are reused if they already exist.
+    """
+    name = "%s_%d_%d_%d_%d"%(layer_type, nvertices, nfields, points_per_shape, parts_per_shape)
+    root = os.path.join(directory, name)
+    if not os.path.exists(root + ".dbf"):
+        nshapes = write_shp(root, layer_type, nvertices, points_per_shape, parts_per_shape, seed = seed)
+        write_dbf(root, nshapes, nfields, seed = seed)
+        with open(root + ".prj", "w") as f:
+            f.write('LOCAL_CS["synthetic"]\n')
+    return root
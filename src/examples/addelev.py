@@ -17,9 +17,11 @@ else:
 print("Shape source: " + src)
 
 # Open existing shape file and reads point coordinates
-fs = FileShp.read(src)
+# Only the first shape is decoded, the rest of the file is not read
+fs = FileShp.open(src)
 poly = fs.shapes[0]    # assume we want to use first polygon 
 pts = poly.points
+fs.close()
 
 #--------------------------------------------------------------------------
 # Replace this part if you want to modify z in another way
@@ -0,0 +1,218 @@
+# Vectorized decoding of the records stored in a shape file (.shp).
+# The whole file is kept in memory as a bytes-like object and every field is
+# extracted for all records at once with np.frombuffer, instead of calling
+# struct.unpack once per coordinate.
+# REFERENCE: ESRI Shapefile Technical Description
+#
+# Record layouts (offsets relative to the start of the record contents, i.e.
+# after the 8 bytes of the record header):
+#   Point:       type, x, y [, z, m]
+#   Multipoint:  type, bbox, npoints, points [, zrange, z] [, mrange, m]
+#   Poly*:       type, bbox, nparts, npoints, parts, points [, zrange, z] [, mrange, m]
+########################################################################
+
+import struct
+
+import numpy as np
+
+from ..shapes.shape_types import TS, SHP_TYPES
+
+HEADER_SIZE = 100        # bytes in the main file header
+RECORD_HEADER_SIZE = 8   # record number and content length (big endian)
+
+_RECORD_HEADER = struct.Struct(">ii")
+
+POINT_TYPES      = (TS["POINT"], TS["POINTZ"])
+MULTIPOINT_TYPES = (TS["MULTIPOINT"], TS["MULTIPOINTZ"])
+MULTIPART_TYPES  = (TS["POLYLINE"], TS["POLYGON"], TS["POLYLINEZ"], TS["POLYGONZ"])
+Z_TYPES          = (TS["POINTZ"], TS["MULTIPOINTZ"], TS["POLYLINEZ"], TS["POLYGONZ"])
+
+def scan_records(buf, start = HEADER_SIZE, end = None):
+    """ Walks the record headers of a shape file stored in buf.
+        Only the two integers of each record header are decoded, the contents are skipped.
+
+        :param buf: bytes-like object with the contents of the file
+        :param start: position of the first record header
+        :param end: position where the scan should stop (default: end of buf)
+        :return: (offsets, lengths) as int64 arrays. Offsets point to the record header and
+                 lengths are the size of the record contents in bytes.
+    """
+    if end is None: end = len(buf)
+    offsets, lengths = [], []
+    pos = start
+    while (end - pos) >= RECORD_HEADER_SIZE:
+        idx, length = _RECORD_HEADER.unpack_from(buf, pos)
+        offsets.append(pos)
+        lengths.append(length * 2)  # length is stored in 16-bit words
+        pos = pos + RECORD_HEADER_SIZE + length * 2
+    return np.array(offsets, dtype = np.int64), np.array(lengths, dtype = np.int64)
+
+def gather(buf, pos, dtype, mask = None):
+    """ Returns an array with the values of type dtype stored at the (byte) positions pos of buf.
+        Records in a shape file are only aligned to 16-bit words, hence buf is viewed with
+        every possible shift and each value is taken from the view where it is aligned.
+        No copy of buf is made.
+
+        :param mask: if present, only positions where mask is True are read and
+                     the other values are set to zero.
+    """
+    dt = np.dtype(dtype)
+    size = dt.itemsize
+    pos = np.asarray(pos, dtype = np.int64)
+    if mask is not None:
+        out = np.zeros(len(pos), dtype = dt.newbyteorder("="))
+        out[mask] = gather(buf, pos[mask], dt)
+        return out
+    out = np.empty(len(pos), dtype = dt.newbyteorder("="))
+    if len(pos) == 0: return out
+    shift = pos % size
+    for k in np.unique(shift):
+        sel = (shift == k)
+        view = np.frombuffer(buf, dtype = dt, count = (len(buf) - k) // size, offset = int(k))
+        out[sel] = view[(pos[sel] - k) // size]
+    return out
+
+def _local_index(counts):
+    """ For counts = [2, 3] returns [0, 1, 0, 1, 2] and the start of each block ([0, 2, 5]). """
+    starts = np.zeros(len(counts) + 1, dtype = np.int64)
+    np.cumsum(counts, out = starts[1:])
+    local = np.arange(starts[-1], dtype = np.int64) - np.repeat(starts[:-1], counts)
+    return local, starts
+
+def _gather_blocks(buf, first, counts, dtype, stride):
+    """ Gathers consecutive blocks of counts[i] values starting at byte position first[i]. """
+    local, starts = _local_index(counts)
+    pos = np.repeat(first, counts) + stride * local
+    return gather(buf, pos, dtype), starts
+
+def count_points(buf, offsets, shape_type):
+    """ Returns the number of points in each record without decoding the records.
+        NULL records have no points.
+    """
+    c = np.asarray(offsets, dtype = np.int64) + RECORD_HEADER_SIZE
+    types = gather(buf, c, "<i4")
+    valid = (types != TS["NULL"])
+    if shape_type in POINT_TYPES:
+        return valid.astype(np.int64)
+    elif shape_type in MULTIPOINT_TYPES:
+        return gather(buf, c + 36, "<i4", valid).astype(np.int64)
+    elif shape_type in MULTIPART_TYPES:
+        return gather(buf, c + 40, "<i4", valid).astype(np.int64)
+    else:
+        assert False, "NOT IMPLEMENTED YET FOR TYPE: %d"%(shape_type)
+
+def read_bboxes(buf, offsets, shape_type):
+    """ Returns the (n, 4) bounding boxes of the records as (xmin, xmax, ymin, ymax) without decoding their points.
+        The bounding box of a point is the point itself. NULL records have NaN bounding boxes.
+    """
+    c = np.asarray(offsets, dtype = np.int64) + RECORD_HEADER_SIZE
+    types = gather(buf, c, "<i4")
+    valid = (types != TS["NULL"])
+    bbox = np.full((len(c), 4), np.nan)
+    if shape_type in POINT_TYPES:
+        x = gather(buf, c[valid] + 4, "<f8")
+        y = gather(buf, c[valid] + 12, "<f8")
+        bbox[valid] = np.column_stack((x, x, y, y))
+    elif shape_type in MULTIPOINT_TYPES or shape_type in MULTIPART_TYPES:
+        # stored as xmin, ymin, xmax, ymax
+        for j, col in enumerate((0, 2, 1, 3)):
+            bbox[valid, col] = gather(buf, c[valid] + 4 + 8 * j, "<f8")
+    else:
+        assert False, "NOT IMPLEMENTED YET FOR TYPE: %d"%(shape_type)
+    return bbox
+
+def decode_records(buf, offsets, lengths, shape_type):
+    """ Decodes the records of a shape file in a single vectorized pass.
+
+        :param buf: bytes-like object with the contents of the file
+        :param offsets: positions of the record headers (see scan_records)
+        :param lengths: size of the record contents in bytes
+        :param shape_type: shape type declared in the header of the file
+        :return: dictionary with the following arrays:
+                 - idx: record numbers (1-based)
+                 - types: shape type of each record (0 for NULL records)
+                 - bbox: (n, 4) bounding boxes as (xmin, xmax, ymin, ymax)
+                 - xy: (N, 2) coordinates of all points in the file
+                 - z, m: (N,) elevation and measures (None if not stored in the file)
+                 - zrange, mrange: (n, 2) ranges stored in each record (None if not stored)
+                 - shape_offsets: (n+1,) position of the first point of each shape in xy
+                 - parts: position of the first point of each part relative to its shape
+                 - part_offsets: (n+1,) position of the first part of each shape in parts
+    """
+    assert shape_type in SHP_TYPES, shape_type
+    offsets = np.asarray(offsets, dtype = np.int64)
+    lengths = np.asarray(lengths, dtype = np.int64)
+    n = len(offsets)
+    c = offsets + RECORD_HEADER_SIZE                   # start of record contents
+
+    idx   = gather(buf, offsets, ">i4")
+    types = gather(buf, c, "<i4")
+    valid = (types != TS["NULL"])
+    assert np.all(types[valid] == shape_type), "Mixed shape types in file"
+    hasZ = shape_type in Z_TYPES
+
+    if shape_type in POINT_TYPES:
+        npoints = valid.astype(np.int64)
+        nparts  = npoints.copy()
+        first   = c + 4
+        bbox    = None
+        zfirst  = first + 16
+        mfirst  = zfirst + 8
+        hasM    = hasZ and bool(np.all(lengths[valid] >= 36))
+
+    elif shape_type in MULTIPOINT_TYPES or shape_type in MULTIPART_TYPES:
+        multipart = shape_type in MULTIPART_TYPES
+        bbox = np.empty((n, 4))
+        bbox[:, 0] = gather(buf, c + 4,  "<f8", valid)   # xmin
+        bbox[:, 1] = gather(buf, c + 20, "<f8", valid)   # xmax
+        bbox[:, 2] = gather(buf, c + 12, "<f8", valid)   # ymin
+        bbox[:, 3] = gather(buf, c + 28, "<f8", valid)   # ymax
+        bbox[~valid] = np.nan
+        if multipart:
+            nparts  = gather(buf, c + 36, "<i4", valid).astype(np.int64)
+            npoints = gather(buf, c + 40, "<i4", valid).astype(np.int64)
+            first   = c + 44 + 4 * nparts
+        else:
+            npoints = gather(buf, c + 36, "<i4", valid).astype(np.int64)
+            nparts  = valid.astype(np.int64)
+            first   = c + 40
+        zfirst = first + 16 * npoints                  # z range followed by z values
+        mfirst = zfirst + (16 + 8 * npoints if hasZ else 0)
+        hasM   = hasZ and bool(np.all((mfirst + 16 + 8 * npoints - c)[valid] <= lengths[valid]))
+
+    else:
+        assert False, "NOT IMPLEMENTED YET FOR TYPE: %d"%(shape_type)
+
+    # point coordinates
+    xy = np.empty((int(npoints.sum()), 2))
+    xy[:, 0], shape_offsets = _gather_blocks(buf, first, npoints, "<f8", 16)
+    xy[:, 1], _ = _gather_blocks(buf, first + 8, npoints, "<f8", 16)
+
+    # parts (points and multipoints have a single part starting at 0)
+    if shape_type in MULTIPART_TYPES:
+        parts, part_offsets = _gather_blocks(buf, c + 44, nparts, "<i4", 4)
+    else:
+        parts = np.zeros(int(nparts.sum()), dtype = np.int32)
+        part_offsets = np.zeros(n + 1, dtype = np.int64)
+        np.cumsum(nparts, out = part_offsets[1:])
+
+    # elevation and measures
+    z, m, zrange, mrange = None, None, None, None
+    if hasZ:
+        if shape_type in POINT_TYPES:
+            z, _ = _gather_blocks(buf, zfirst, npoints, "<f8", 8)
+        else:
+            zrange = np.column_stack((gather(buf, zfirst, "<f8", valid), gather(buf, zfirst + 8, "<f8", valid)))
+            z, _ = _gather_blocks(buf, zfirst + 16, npoints, "<f8", 8)
+    if hasM:
+        if shape_type in POINT_TYPES:
+            m, _ = _gather_blocks(buf, mfirst, npoints, "<f8", 8)
+        else:
+            mrange = np.column_stack((gather(buf, mfirst, "<f8", valid), gather(buf, mfirst + 8, "<f8", valid)))
+            m, _ = _gather_blocks(buf, mfirst + 16, npoints, "<f8", 8)
+
+    return { "idx" : idx, "types" : types, "bbox" : bbox,          \
+             "xy" : xy, "z" : z, "m" : m,                          \
+             "zrange" : zrange, "mrange" : mrange,                 \
+             "shape_offsets" : shape_offsets,                      \
+             "parts" : parts, "part_offsets" : part_offsets }
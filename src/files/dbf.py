@@ -13,13 +13,17 @@
 # The file created by QGIS seems to follow the dBase III format
 ########################################################################
 
+import mmap
 import struct
 import binascii
 import datetime
 
+import numpy as np
+
 from ..helpers import _read_little_int, _read_big_int, _read_little_double, _read_big_double
 from ..helpers import _read_native_char, _read_native_ushort, _read_native_short
 from ..helpers import _read_native_int, _read_native_uint, _read_native_string, _read_native_uchar
+from ..profiling import timer
 
 # TODO: Check for repeated field names
 
@@ -49,6 +53,7 @@ class Field:
         self.type_desc = FIELD_TYPE[ftype]
         self.length = flength
         self.decimal = fdecimal
+        self.offset = None  # position of the field in the record (in bytes), set when the header is read
         
         # It seems QGIS exports every numeric field with the type N (which should be reserved for integers),
         # hence we set the type float for fields with decimal places > 0
@@ -78,6 +83,26 @@ class Field:
         else:
             assert False, "Not recognized type"
         
+    def values(self, col):
+        """ Vectorized version of value. Converts an array of fixed-width bytes (dtype S) to:
+              - N or F: float64 array (NaN for empty values)
+              - D: datetime64[D] array (NaT for empty values)
+              - other types: array of strings as stored in the file (with padding, as read_record)
+        """
+        if self.type != "N" and self.type != "F" and self.type != "D":
+            return np.char.decode(col, "ASCII")
+        col = np.char.strip(col)
+        empty = (col == b"")
+        if self.type == "N" or self.type == "F":
+            return np.where(empty, b"nan", col).astype(np.float64)
+        elif self.type == "D":
+            # YYYYMMDD -> YYYY-MM-DD
+            u = np.where(empty, b"00000000", col).astype("S8").view(np.uint8).reshape(-1, 8)
+            iso = np.full((len(col), 10), ord("-"), dtype = np.uint8)
+            iso[:, 0:4], iso[:, 5:7], iso[:, 8:10] = u[:, 0:4], u[:, 4:6], u[:, 6:8]
+            d = np.where(empty, b"NaT", iso.view("S10").ravel())
+            return d.astype("datetime64[D]")
+
     def __str__(self):
         s = "Field: %s\n"%self.name
         s = s + "  type[%s]: %s\n"%(self.type, self.type_desc)
@@ -126,19 +151,24 @@ class Field:
     
 class FileDbf:
     
-    def __init__(self, src, fields, num_records, size_record):
+    def __init__(self, src, fields, num_records, size_record, size_header = None):
         """
         :param src: full path to this file
         :param fields: list of Fields in the file 
         :param num_records: number of records in file
         :param size_record: size of each record in bytes
+        :param size_header: size of the header in bytes (position of the first record)
         """
         self.src = src
         self.fields = fields
         self.nfields = len(fields)
         self.num_records = num_records
         self.size_record = size_record
+        self.size_header = size_header
         self.records = []
+        self.columns = None   # dictionary of arrays, only set when the file is read with the numpy engine
+        self.deleted = None   # True for records marked as deleted (numpy engine)
+        self.rows = None      # positions (0-based) in the file of the records that were read (None: all records)
         
     def get_records_as_lists(self):
         """ Returns values in records as separate lists for each field in the dbf file. Lists are stored in two dictionaries with
@@ -148,6 +178,17 @@ class FileDbf:
         """
         values = {}
         text = {}
+        if self.columns is not None:
+            for f in self.fields:
+                col = self.columns[f.name]
+                if f.type == "N" or f.type == "F":
+                    values[f.name] = col.tolist()
+                elif f.type == "D":
+                    text[f.name] = [str(d) for d in col.astype("datetime64[s]").tolist()]
+                else:
+                    text[f.name] = np.char.strip(col).tolist()
+            return values, text
+
         for i in range(self.nfields):
             f = self.fields[i]
             #print(f)
@@ -171,11 +212,110 @@ class FileDbf:
                 text[f.name] = tt
         
         return values, text
+
+    def get_columns(self):
+        """ Same as get_records_as_lists, but numeric fields are returned as contiguous float64 arrays
+            and text fields as arrays of strings. If the file was read with the numpy engine, then the
+            arrays of numeric fields are the decoded columns themselves (no copy is made).
+        """
+        values = {}
+        text = {}
+        if self.columns is not None:
+            for f in self.fields:
+                col = self.columns[f.name]
+                if f.type == "N" or f.type == "F":
+                    values[f.name] = np.ascontiguousarray(col, dtype = np.float64)
+                elif f.type == "D":
+                    # same strings as get_records_as_lists: "YYYY-MM-DD hh:mm:ss" or "None"
+                    s = np.char.replace(np.datetime_as_string(col.astype("datetime64[s]")), "T", " ")
+                    text[f.name] = np.where(np.isnat(col), "None", s)
+                else:
+                    text[f.name] = np.char.strip(col)
+            return values, text
+
+        n = len(self.records)
+        for i in range(self.nfields):
+            f = self.fields[i]
+            if f.type == "N" or f.type == "F":
+                values[f.name] = np.fromiter((float(r[i][1]) for r in self.records), dtype = np.float64, count = n)
+            else:
+                text[f.name] = np.array([str(r[i][1]).strip() for r in self.records], dtype = "U")
+        return values, text
     
+    def record_dtype(self):
+        """ Returns a NumPy structured dtype that describes one record: the deletion flag
+            followed by one fixed-width bytes column (f0, f1, ...) for each field in self.fields.
+            Fields that are not selected (see select_fields) are skipped using their offsets.
+        """
+        names, formats, offsets = ["deleted"], ["S1"], [0]
+        for i in range(self.nfields):
+            f = self.fields[i]
+            names.append("f%d"%i)
+            formats.append("S%d"%f.length)
+            offsets.append(f.offset)
+        return np.dtype({"names" : names, "formats" : formats, "offsets" : offsets, "itemsize" : self.size_record})
+
+    def select_fields(self, names):
+        """ Keeps only the fields in the list names, so only those columns are decoded
+            when records are read.
+        """
+        fields = []
+        for name in names:
+            ff = [f for f in self.fields if f.name == name]
+            assert len(ff) > 0, "Field not found in %s: %s"%(self.src, name)
+            fields.append(ff[0])
+        self.fields = fields
+        self.nfields = len(fields)
+        return self
+
+    def decode_columns(self, raw, nrecords):
+        """ Decodes nrecords records stored in the bytes-like object raw and returns them as
+            a dictionary of arrays with the field name as key (see Field.values).
+            The whole block is viewed through record_dtype, so no Python code runs per record.
+        """
+        table = np.frombuffer(raw, dtype = self.record_dtype(), count = nrecords)
+        columns = {}
+        for i in range(self.nfields):
+            f = self.fields[i]
+            columns[f.name] = f.values(table["f%d"%i])
+        return columns
+
+    def iter_chunks(self, n):
+        """ Reads the records of this file in chunks of (at most) n records, so only one chunk
+            is kept in memory at a time. Each chunk is returned as a dictionary of arrays
+            (see decode_columns).
+        """
+        with open(self.src, "rb") as b:
+            b.seek(self.size_header)
+            for a in range(0, self.num_records, n):
+                nr = min(n, self.num_records - a)
+                raw = b.read(nr * self.size_record)
+                assert len(raw) == nr * self.size_record, "Truncated .dbf file"
+                yield self.decode_columns(raw, nr)
+
     def get_records(self):
         """ Returns a list of dictionaries that store information read from the .dbf file.
         """
+        if self.columns is not None and len(self.records) == 0:
+            self.records = self._records_from_columns()
         return self.records
+
+    def _records_from_columns(self):
+        """ Creates the list of records (same format as read_record) from self.columns. """
+        cols = []
+        for f in self.fields:
+            col = self.columns[f.name]
+            if (f.type == "N" or f.type == "F") and f.decimal == 0:
+                cols.append([int(v) if v == v else v for v in col.tolist()])
+            elif f.type == "D":
+                cols.append(col.astype("datetime64[s]").tolist())
+            else:
+                cols.append(col.tolist())
+        names = [f.name for f in self.fields]
+        records = []
+        for r in range(self.num_records):
+            records.append({i : (names[i], cols[i][r]) for i in range(self.nfields)})
+        return records
         
     def display(self):
         print(self.__str__())
@@ -187,8 +327,9 @@ class FileDbf:
             print(f)
     
     def print_records(self):
+        records = self.get_records()
         for r in range(self.num_records):
-            print_record(r, self.records[r])
+            print_record(r, records[r])
         
     def __str__(self):
         s = "="*40 + "\n"
@@ -207,14 +348,15 @@ class FileDbf:
         """ Given a byte stream reads a record using the field description
             stored in self.fields """
         #http://web.archive.org/web/20150323061445/http://ulisse.elettra.trieste.it/services/doc/dbase/DBFstruct.htm#C1
-        c = _read_native_char(b)    # space for not deleted, * for deleted
+        raw = b.read(self.size_record)
+        c = raw[0:1].decode("ASCII")    # space for not deleted, * for deleted
         #print("+++ " + c + " +++")
         
         r = {}
         for i in range(self.nfields):
             f = self.fields[i]
             #print("***" + f.name + "***")
-            s = _read_native_string(b, f.size())
+            s = raw[f.offset:f.offset + f.size()].decode("ASCII")
             
             # convert string to values
             if convert_str_to_values:
@@ -227,18 +369,10 @@ class FileDbf:
         return self
         
     @staticmethod
-    def read(src, convert_records = True):
+    def _read_header(b, src):
+        """ Reads the header and the field descriptors of a .dbf file and returns a FileDbf
+            object without records. After this call b points to the first record.
         """
-            Reads a .dbf file and returns a FileDbf object that stores the
-            list of fields and records as lists.
-            
-            :param src: path to .dbf file
-            :param convert_records: If true convert strings to values in records
-        """
-        print("Reading .dbf file from: ")
-        print(src)
-        
-        b = open(src, "rb")
         #0	1 byte	Valid dBASE for DOS file; bits 0-2 indicate version number, bit 3 indicates the presence of a dBASE for DOS memo file, bits 4-6 indicate the presence of a SQL table, bit 7 indicates the presence of any memo file (either dBASE m PLUS or dBASE for DOS)
         ver = binascii.hexlify(bytearray(b.read(1)))
         assert ver == b"03"
@@ -292,20 +426,103 @@ class FileDbf:
 
         #32-n[note 3][note 4]	32 bytes each	Field descriptor array (the structure of this array is shown in Table Database field descriptor bytes)
         fields = []
+        pos = 1   # first byte of each record is the deletion flag
         for f in range(nf):
             ff = Field._read_field_descriptor(b)
+            ff.offset = pos
+            pos = pos + ff.length
             fields.append(ff)
         
-        fdbf = FileDbf(src, fields, nr, nbr)
+        fdbf = FileDbf(src, fields, nr, nbr, nbh)
         #print(fdbf)
             
         #n +1	1 byte	0x0D as the field descriptor array terminator
         x = binascii.hexlify(bytearray(b.read(1)))
         assert x == b"0d", x
 
+        # records start after the header (there may be padding after the terminator)
+        b.seek(nbh)
+        return fdbf
+
+    @staticmethod
+    def open(src):
+        """ Reads only the header and field descriptors of a .dbf file.
+            Records can then be read in chunks with iter_chunks.
+        """
+        print("Opening .dbf file from: ")
+        print(src)
+
+        with open(src, "rb") as b:
+            fdbf = FileDbf._read_header(b, src)
+        return fdbf
+
+    @staticmethod
+    def read(src, convert_records = True, engine = "python", fields = None, stats = None, rows = None):
+        """
+            Reads a .dbf file and returns a FileDbf object that stores the
+            list of fields and records as lists.
+            
+            :param src: path to .dbf file
+            :param convert_records: If true convert strings to values in records
+            :param engine: "python" to read the file record by record, or "numpy" to read
+                           the whole block of records at once and decode it as a columnar
+                           table (see decode_columns). In the second case the table is stored
+                           in self.columns and records are only created if get_records is called.
+            :param fields: list with the names of the fields that should be read. If present, the
+                           bytes of other fields are never decoded. With the numpy engine the file is
+                           memory mapped and only the selected columns are copied.
+            :param stats: profiling.Stats where the time spent reading the header and decoding
+                          the records is added (stages "header" and "dbf"), or None.
+            :param rows: list with the positions (0-based) of the records that should be read
+                         (e.g. FileShp.selection). Other records are skipped without decoding them.
+                         If present, num_records is the number of records that were read.
+        """
+        print("Reading .dbf file from: ")
+        print(src)
+
+        with timer(stats, "dbf"):
+            return FileDbf._read(src, convert_records, engine, fields, stats, rows)
+
+    @staticmethod
+    def _read(src, convert_records, engine, fields, stats, rows):
+        b = open(src, "rb")
+        with timer(stats, "header"):
+            fdbf = FileDbf._read_header(b, src)
+        if fields is not None:
+            fdbf.select_fields(fields)
+        if rows is not None:
+            rows = np.asarray(rows, dtype = np.int64)
+            assert np.all((rows >= 0) & (rows < fdbf.num_records)), "Record out of range"
+
+        if engine == "numpy":
+            size = fdbf.size_header + fdbf.num_records * fdbf.size_record
+            buf = mmap.mmap(b.fileno(), 0, access = mmap.ACCESS_READ)
+            b.close()
+            assert len(buf) >= size, "Truncated .dbf file"
+            table = np.frombuffer(buf, dtype = fdbf.record_dtype(), count = fdbf.num_records, offset = fdbf.size_header)
+            if rows is not None:
+                table = table[rows]  # copy of the selected records
+            fdbf.deleted = (table["deleted"] == b"*")
+            fdbf.columns = {}
+            for i in range(fdbf.nfields):
+                f = fdbf.fields[i]
+                fdbf.columns[f.name] = f.values(table["f%d"%i])
+            del table                # release the view before closing the map
+            buf.close()
+            if rows is not None:
+                fdbf.rows, fdbf.num_records = rows, len(rows)
+            return fdbf
+        assert engine == "python", "Unknown engine: %s"%engine
+
         # read records
-        for i in range(nr):
-            fdbf.read_record(b, convert_records)
+        if rows is not None:
+            for i in rows:
+                b.seek(fdbf.size_header + int(i) * fdbf.size_record)
+                fdbf.read_record(b, convert_records)
+            fdbf.rows, fdbf.num_records = rows, len(rows)
+        else:
+            for i in range(fdbf.num_records):
+                fdbf.read_record(b, convert_records)
         
         b.close()
         
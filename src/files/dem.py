@@ -0,0 +1,218 @@
+# Reads digital elevation models (DEM) stored as rasters and samples the elevation at
+# arbitrary (x, y) locations by bilinear interpolation between the centers of the cells.
+#
+# Supported formats:
+#   - ESRI ASCII grid (.asc): a header with ncols, nrows, xllcorner (or xllcenter),
+#     yllcorner (or yllcenter), cellsize and optionally NODATA_value, followed by the
+#     values of each row from north to south. The values are converted once to a NumPy
+#     file next to the grid (src + CACHE_EXT), which is rebuilt when the grid changes. If
+#     that file cannot be written (e.g. read-only directory), they are parsed into memory.
+#   - NumPy (.npy): a 2D array with rows from north to south. The georeference is read
+#     from a header file with the same root and extension .hdr, which has the same
+#     format as the header of an ASCII grid (ncols and nrows can be omitted).
+#
+# Values are never loaded at once: the NumPy file is memory mapped and sample() visits
+# the grid in square tiles, loading only the tiles that contain query points, so DEMs
+# larger than the available memory can be used.
+# REFERENCE: https://desktop.arcgis.com/en/arcmap/latest/manage-data/raster-and-images/esri-ascii-raster-format.htm
+########################################################################
+
+import os
+
+import numpy as np
+
+CACHE_EXT = ".npy"
+TILE_SIZE = 1024              # rows and columns of the tiles loaded by sample
+CHUNK_SIZE = 16 * 1024 * 1024 # characters parsed at a time when converting ASCII grids
+
+_HEADER_KEYS = ["ncols", "nrows", "xllcorner", "yllcorner", "xllcenter", "yllcenter", "cellsize", "nodata_value"]
+
+def _parse_header(lines):
+    """ Returns a dictionary with the keys of an ASCII grid header (in lowercase) found in lines. """
+    h = {}
+    for line in lines:
+        v = line.split()
+        if len(v) == 2 and v[0].lower() in _HEADER_KEYS:
+            h[v[0].lower()] = float(v[1])
+    return h
+
+def _read_ascii_header(f):
+    """ Reads the header of an ASCII grid from the text file f, which is left at the first value. """
+    lines = []
+    while True:
+        pos = f.tell()
+        line = f.readline()
+        if not line or not line.split() or line.split()[0].lower() not in _HEADER_KEYS:
+            f.seek(pos)
+            break
+        lines.append(line)
+    return _parse_header(lines)
+
+def _convert_ascii(f, dst, nrows, ncols):
+    """ Parses the values of an ASCII grid from f in chunks and writes them to the NumPy file dst. """
+    tmp = dst + ".tmp"
+    out = np.lib.format.open_memmap(tmp, mode = "w+", dtype = np.float64, shape = (nrows, ncols))
+    flat = out.reshape(-1)
+    n, tail = 0, ""
+    while True:
+        s = f.read(CHUNK_SIZE)
+        text = tail + s
+        if s:   # the last number of the chunk may continue in the next one
+            cut = max(text.rfind(" "), text.rfind("\n"), text.rfind("\t"))
+            text, tail = text[:cut + 1], text[cut + 1:]
+        v = np.array(text.split(), dtype = np.float64)
+        assert n + len(v) <= len(flat), "Too many values in ASCII grid"
+        flat[n:n + len(v)] = v
+        n = n + len(v)
+        if not s: break
+    assert n == len(flat), "Expected %d values in ASCII grid, found %d"%(len(flat), n)
+    out.flush()
+    del out, flat
+    os.replace(tmp, dst)
+
+def source_files(src):
+    """ Returns the files a DEM is read from (see FileDem.read): the grid and its header or cache. """
+    root, ext = os.path.splitext(src)
+    if ext.lower() == ".npy":
+        return [src, root + ".hdr"]
+    return [src, src + CACHE_EXT]
+
+class FileDem:
+
+    def __init__(self, src, data, x0, y0, cellsize, nodata = None):
+        """
+        :param src: path to the DEM
+        :param data: (nrows, ncols) array (or memory map) with the elevations, first row is the northern one
+        :param x0, y0: coordinates of the lower left corner of the grid
+        :param cellsize: size of the (square) cells
+        :param nodata: value of cells without elevation, or None
+        """
+        self.src = src
+        self.data = data
+        self.x0, self.y0 = x0, y0
+        self.cellsize = cellsize
+        self.nodata = nodata
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    def bounds(self):
+        """ Returns (xmin, ymin, xmax, ymax) of the grid. """
+        nrows, ncols = self.data.shape
+        return self.x0, self.y0, self.x0 + ncols * self.cellsize, self.y0 + nrows * self.cellsize
+
+    def __str__(self):
+        s = "="*40 + "\n"
+        s = s + "DEM file: \n"
+        s = s + "  - Src: " + self.src + "\n"
+        s = s + "  - Size: %d rows x %d columns\n"%self.data.shape
+        s = s + "  - Bounds: %g, %g, %g, %g\n"%self.bounds()
+        s = s + "  - Cell size: %g\n"%self.cellsize
+        s = s + "="*40
+        return s
+
+    def sample(self, x, y, fill = np.nan, tile_size = TILE_SIZE):
+        """ Returns the elevation at the points (x, y) interpolated bilinearly between the centers of the cells.
+            Points outside the grid get the elevation of the nearest cells if they are less than half a cell
+            away from the grid, and fill otherwise. NODATA cells are excluded from the interpolation
+            (points surrounded only by NODATA cells also get fill).
+        """
+        x = np.asarray(x, dtype = np.float64)
+        y = np.asarray(y, dtype = np.float64)
+        nrows, ncols = self.data.shape
+        xmin, ymin, xmax, ymax = self.bounds()
+        z = np.full(len(x), fill, dtype = np.float64)
+
+        inside = np.nonzero((x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax))[0]
+        if len(inside) == 0:
+            return z
+
+        # position relative to the centers of the cells (row 0 is the northern one)
+        u = np.clip((x[inside] - xmin) / self.cellsize - 0.5, 0.0, ncols - 1)
+        v = np.clip((ymax - y[inside]) / self.cellsize - 0.5, 0.0, nrows - 1)
+        c0 = np.minimum(np.floor(u).astype(np.int64), max(ncols - 2, 0))
+        r0 = np.minimum(np.floor(v).astype(np.int64), max(nrows - 2, 0))
+        fu, fv = u - c0, v - r0
+
+        # visit the tiles that contain points
+        ntc = -(-ncols // tile_size)
+        key = (r0 // tile_size) * ntc + c0 // tile_size
+        order = np.argsort(key, kind = "stable")
+        keys, starts = np.unique(key[order], return_index = True)
+        ends = np.append(starts[1:], len(order))
+        for k, a, b in zip(keys, starts, ends):
+            p = order[a:b]
+            ta, tb = (k // ntc) * tile_size, (k % ntc) * tile_size
+            tile = np.array(self.data[ta:ta + tile_size + 1, tb:tb + tile_size + 1], dtype = np.float64)
+            if self.nodata is not None:
+                tile[tile == self.nodata] = np.nan
+            tr, tc = r0[p] - ta, c0[p] - tb
+            tr1 = np.minimum(tr + 1, tile.shape[0] - 1)
+            tc1 = np.minimum(tc + 1, tile.shape[1] - 1)
+            w = np.stack(((1 - fv[p]) * (1 - fu[p]), (1 - fv[p]) * fu[p], fv[p] * (1 - fu[p]), fv[p] * fu[p]))
+            val = np.stack((tile[tr, tc], tile[tr, tc1], tile[tr1, tc], tile[tr1, tc1]))
+            valid = ~np.isnan(val)
+            wsum = np.where(valid, w, 0.0).sum(axis = 0)
+            zsum = np.where(valid, w * np.where(valid, val, 0.0), 0.0).sum(axis = 0)
+            with np.errstate(invalid = "ignore", divide = "ignore"):
+                z[inside[p]] = np.where(wsum > 0, zsum / wsum, fill)
+        return z
+
+    @staticmethod
+    def _georeference(src, h, shape):
+        """ Returns (x0, y0, cellsize, nodata) from the header h of a grid with shape (nrows, ncols). """
+        assert "cellsize" in h, "Missing cellsize in header of " + src
+        cs = h["cellsize"]
+        for k, n in (("ncols", shape[1]), ("nrows", shape[0])):
+            assert k not in h or int(h[k]) == n, "%s in header of %s does not match the data"%(k, src)
+        if "xllcorner" in h and "yllcorner" in h:
+            x0, y0 = h["xllcorner"], h["yllcorner"]
+        else:
+            assert "xllcenter" in h and "yllcenter" in h, "Missing lower left corner in header of " + src
+            x0, y0 = h["xllcenter"] - 0.5 * cs, h["yllcenter"] - 0.5 * cs
+        return x0, y0, cs, h.get("nodata_value")
+
+    @staticmethod
+    def read(src, cache = True, verbose = False):
+        """ Opens a DEM stored as an ESRI ASCII grid (.asc) or a NumPy array (.npy with a .hdr file).
+            The values are memory mapped, not read.
+
+            :param cache: (only ASCII grids) if True, the values are converted to src + CACHE_EXT the first
+                          time (or when the grid is modified) and memory mapped from there. Otherwise, or if
+                          the cache cannot be written (e.g. read-only directory), they are parsed into memory.
+        """
+        root, ext = os.path.splitext(src)
+        if ext.lower() == ".npy":
+            data = np.load(src, mmap_mode = "r")
+            assert data.ndim == 2, "DEM should be a 2D array"
+            with open(root + ".hdr", "r") as f:
+                h = _parse_header(f.readlines())
+        else:
+            with open(src, "r") as f:
+                h = _read_ascii_header(f)
+                assert "ncols" in h and "nrows" in h, "Missing ncols or nrows in header of " + src
+                nrows, ncols = int(h["nrows"]), int(h["ncols"])
+                if cache:
+                    dst, start = src + CACHE_EXT, f.tell()
+                    try:
+                        if not os.path.exists(dst) or os.path.getmtime(dst) < os.path.getmtime(src):
+                            if verbose: print("Converting ASCII grid to: " + dst)
+                            _convert_ascii(f, dst, nrows, ncols)
+                        data = np.load(dst, mmap_mode = "r")
+                    except OSError as e:
+                        # e.g. read-only directory: the values are parsed into memory
+                        if verbose: print("ASCII grid not converted: %s"%e)
+                        try:
+                            os.remove(dst + ".tmp")
+                        except OSError:
+                            pass
+                        f.seek(start)
+                        cache = False
+                if not cache:
+                    data = np.array(f.read().split(), dtype = np.float64).reshape(nrows, ncols)
+
+        x0, y0, cs, nodata = FileDem._georeference(src, h, data.shape)
+        dem = FileDem(src, data, x0, y0, cs, nodata)
+        if verbose: print(dem)
+        return dem
@@ -0,0 +1,93 @@
+# Sequence of shapes that are decoded on demand from a shape file (.shp).
+# Only the positions of the records are kept in memory. Shapes are decoded
+# with bulk.decode_records when they are indexed or iterated, and the most
+# recently used ones are kept in a small LRU cache.
+########################################################################
+
+from collections import OrderedDict
+
+import numpy as np
+
+from ..shapes.geometry import GeometryArray
+from .bulk import scan_records, decode_records
+
+class LazyShapes:
+
+    def __init__(self, buf, shape_type, cache_size = 128, chunk_size = 1024):
+        """
+        :param buf: bytes-like object (e.g. mmap) with the contents of the file
+        :param shape_type: shape type declared in the header of the file
+        :param cache_size: number of decoded shapes kept in memory (0 to disable the cache)
+        :param chunk_size: number of records decoded at once while iterating
+        """
+        self.buf = buf
+        self.shape_type = shape_type
+        self.cache_size = cache_size
+        self.chunk_size = chunk_size
+        self.cache = OrderedDict()
+        self.attribs = None  # list with one record (see FileDbf.get_records) for each shape
+        self._offsets = None
+        self._lengths = None
+
+    def _scan(self):
+        """ Finds the position of the records the first time they are needed. """
+        if self._offsets is None:
+            self._offsets, self._lengths = scan_records(self.buf)
+
+    @property
+    def offsets(self):
+        self._scan()
+        return self._offsets
+
+    @property
+    def lengths(self):
+        self._scan()
+        return self._lengths
+
+    def set_offsets(self, offsets, lengths):
+        """ Sets the position of the records (e.g. from an index file) so the file does not need to be scanned. """
+        self._offsets = np.asarray(offsets, dtype = np.int64)
+        self._lengths = np.asarray(lengths, dtype = np.int64)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def set_attributes(self, records):
+        self.attribs = records
+        self.cache.clear()
+
+    def decode(self, a, b):
+        """ Decodes records [a, b) and returns them as a GeometryArray. """
+        rec = decode_records(self.buf, self.offsets[a:b], self.lengths[a:b], self.shape_type)
+        g = GeometryArray.from_records(self.shape_type, rec)
+        if self.attribs is not None:
+            g.attribs = self.attribs[a:b]
+        return g
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0: i = i + len(self)
+        if i < 0 or i >= len(self): raise IndexError("shape index out of range")
+
+        if i in self.cache:
+            self.cache.move_to_end(i)
+            return self.cache[i]
+
+        s = self.decode(i, i + 1)[0]
+        if self.cache_size > 0:
+            self.cache[i] = s
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last = False)
+        return s
+
+    def __iter__(self):
+        n = len(self)
+        for a in range(0, n, self.chunk_size):
+            b = min(a + self.chunk_size, n)
+            for s in self.decode(a, b):
+                yield s
+
+    def to_geometry(self):
+        """ Decodes all records at once. """
+        return self.decode(0, len(self))
@@ -0,0 +1,111 @@
+# Parallel decoding of a single shape file (.shp).
+# The range of records is split into contiguous slices with (roughly) the same
+# number of bytes. Each slice is decoded by a worker process with
+# bulk.decode_records and its coordinates are written directly into a shared
+# memory buffer, so only the small per-record arrays are sent back to the main
+# process, where the slices are stitched together.
+########################################################################
+
+import mmap
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from ..shapes.geometry import GeometryArray
+from .bulk import RECORD_HEADER_SIZE, count_points, decode_records
+
+# rows of the shared coordinate buffer
+_NROWS = 4   # x, y, z, m
+
+def split_records(lengths, nslices):
+    """ Splits records into (at most) nslices contiguous slices with about the same size in bytes.
+        Returns the list of (first, last + 1) record of each slice.
+    """
+    n = len(lengths)
+    nslices = max(1, min(nslices, n))
+    size = np.cumsum(lengths + RECORD_HEADER_SIZE)
+    bounds = np.searchsorted(size, size[-1] * np.arange(1, nslices) / nslices) if n > 0 else []
+    bounds = np.unique(np.concatenate(([0], bounds, [n]))).astype(np.int64)
+    return [(int(bounds[i]), int(bounds[i + 1])) for i in range(len(bounds) - 1)]
+
+def _decode_slice(args):
+    """ Worker: decodes a slice of records and writes its coordinates into the shared buffer.
+        Returns the per-record arrays of the slice (see decode_records) without xy, z and m.
+    """
+    src, shape_type, offsets, lengths, shm_name, npoints, first_point = args
+    shm = shared_memory.SharedMemory(name = shm_name)
+    try:
+        with open(src, "rb") as b:
+            buf = mmap.mmap(b.fileno(), 0, access = mmap.ACCESS_READ)
+        rec = decode_records(buf, offsets, lengths, shape_type)
+        buf.close()
+
+        out = np.ndarray((_NROWS, npoints), dtype = np.float64, buffer = shm.buf)
+        a, b = first_point, first_point + len(rec["xy"])
+        out[0, a:b] = rec["xy"][:, 0]
+        out[1, a:b] = rec["xy"][:, 1]
+        if rec["z"] is not None: out[2, a:b] = rec["z"]
+        if rec["m"] is not None: out[3, a:b] = rec["m"]
+        has_z, has_m = rec["z"] is not None, rec["m"] is not None
+        del out
+    finally:
+        shm.close()
+
+    for k in ("xy", "z", "m"): del rec[k]
+    rec["has_z"], rec["has_m"] = has_z, has_m
+    return rec
+
+def _concatenate_offsets(offsets):
+    """ Stitches (n_i + 1,) offset arrays of consecutive slices into a single array. """
+    out = [offsets[0]]
+    for o in offsets[1:]:
+        out.append(o[1:] + out[-1][-1])
+    return np.concatenate(out)
+
+def read_parallel(src, shape_type, offsets, lengths, workers):
+    """ Decodes the records of a shape file with a pool of worker processes.
+
+        :param src: path to .shp file
+        :param shape_type: shape type declared in the header of the file
+        :param offsets: positions of the record headers (from FileShx or bulk.scan_records)
+        :param lengths: size of the record contents in bytes
+        :param workers: number of worker processes
+        :return: GeometryArray with all the shapes in the file
+    """
+    with open(src, "rb") as b:
+        buf = mmap.mmap(b.fileno(), 0, access = mmap.ACCESS_READ)
+    counts = count_points(buf, offsets, shape_type)
+    buf.close()
+
+    npoints = int(counts.sum())
+    first_point = np.zeros(len(counts) + 1, dtype = np.int64)
+    np.cumsum(counts, out = first_point[1:])
+
+    slices = split_records(lengths, workers)
+    shm = shared_memory.SharedMemory(create = True, size = max(1, _NROWS * npoints * 8))
+    try:
+        tasks = [(src, shape_type, offsets[a:b], lengths[a:b], shm.name, npoints, int(first_point[a])) for a, b in slices]
+        with ProcessPoolExecutor(max_workers = len(tasks)) as pool:
+            parts = list(pool.map(_decode_slice, tasks))
+
+        def cat(key):
+            if parts[0][key] is None: return None
+            return np.concatenate([p[key] for p in parts])
+
+        coords = np.ndarray((_NROWS, npoints), dtype = np.float64, buffer = shm.buf)
+        has_z = parts[0]["has_z"]
+        has_m = all(p["has_m"] for p in parts)
+        rec = { "idx" : cat("idx"), "types" : cat("types"), "bbox" : cat("bbox"),                 \
+                "xy" : coords[:2].T, "z" : coords[2] if has_z else None,                         \
+                "m" : np.array(coords[3]) if has_m else None,                                    \
+                "zrange" : cat("zrange"), "mrange" : cat("mrange") if has_m else None,           \
+                "shape_offsets" : _concatenate_offsets([p["shape_offsets"] for p in parts]),     \
+                "parts" : cat("parts"),                                                          \
+                "part_offsets" : _concatenate_offsets([p["part_offsets"] for p in parts]) }
+        g = GeometryArray.from_records(shape_type, rec)   # copies the coordinates out of the shared buffer
+        del rec, coords
+    finally:
+        shm.close()
+        shm.unlink()
+    return g
@@ -0,0 +1,168 @@
+# Static R-tree over the bounding boxes of the records of a shape file (.shp).
+#
+# The tree is bulk loaded with the Sort-Tile-Recursive (STR) algorithm: boxes are
+# sorted by the x coordinate of their centers, split into vertical slices, sorted
+# by y inside each slice and packed into nodes of node_size entries. The same is
+# repeated with the nodes of each level until a single root node is left. Since the
+# children of every node are contiguous, a level is stored as three arrays
+# (bounding boxes and first/last + 1 child of each node) and queries visit a whole
+# level at once with vectorized NumPy operations.
+#
+# The tree can be saved to a sidecar file next to the .shp file (root + SIDECAR_EXT)
+# so it is not rebuilt on every run. The size and modification time of the .shp file
+# are stored with the tree to detect when it is out of date. Sidecar files that cannot
+# be loaded (truncated, corrupt or written by another version) are rebuilt.
+# REFERENCE: Leutenegger, Lopez and Edgington (1997), STR: A Simple and Efficient
+#            Algorithm for R-Tree Packing.
+########################################################################
+
+import zipfile
+
+import numpy as np
+
+from .bulk import _local_index
+
+SIDECAR_EXT = ".rtree"
+SIDECAR_VERSION = 1
+
+def _str_order(bbox, node_size):
+    """ Returns the order in which boxes are packed into nodes of node_size entries. """
+    n = len(bbox)
+    cx = 0.5 * (bbox[:, 0] + bbox[:, 1])
+    cy = 0.5 * (bbox[:, 2] + bbox[:, 3])
+    nnodes = -(-n // node_size)
+    nslices = int(np.ceil(np.sqrt(nnodes)))
+    slice_size = nslices * node_size
+    by_x = np.argsort(cx, kind = "stable")
+    slice_id = np.empty(n, dtype = np.int64)
+    slice_id[by_x] = np.arange(n) // slice_size
+    return np.lexsort((cy, slice_id))
+
+def _union(bbox, starts):
+    """ Returns the bounding box of each group of consecutive boxes starting at starts (NaN boxes are ignored). """
+    return np.column_stack((np.fmin.reduceat(bbox[:, 0], starts), np.fmax.reduceat(bbox[:, 1], starts), \
+                            np.fmin.reduceat(bbox[:, 2], starts), np.fmax.reduceat(bbox[:, 3], starts)))
+
+def _intersects(bbox, xmin, ymin, xmax, ymax):
+    return (bbox[:, 0] <= xmax) & (bbox[:, 1] >= xmin) & (bbox[:, 2] <= ymax) & (bbox[:, 3] >= ymin)
+
+class RTree:
+
+    def __init__(self, bbox, ids, levels, node_size, stamp = None):
+        """
+        :param bbox: (n, 4) bounding boxes of the records as (xmin, xmax, ymin, ymax) in packing order
+        :param ids: (n,) position of each box in the file
+        :param levels: list of (node_bbox, start, end) from the leaves to the root. The children of
+                       node j are the entries [start[j], end[j]) of the level below (or of bbox for the leaves).
+        :param node_size: maximum number of children of a node
+        :param stamp: (size, mtime) of the .shp file used to build the tree, or None
+        """
+        self.bbox = bbox
+        self.ids = ids
+        self.levels = levels
+        self.node_size = node_size
+        self.stamp = stamp
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __str__(self):
+        s = "RTree: %d boxes, %d levels, node size: %d"%(len(self), len(self.levels), self.node_size)
+        return s
+
+    def query_bbox(self, xmin, ymin, xmax, ymax):
+        """ Returns the sorted positions (0-based) of the records whose bounding box intersects the window. """
+        if len(self.levels) == 0:
+            return np.zeros(0, dtype = np.int64)
+
+        nodes = np.arange(len(self.levels[-1][0]), dtype = np.int64)
+        for node_bbox, start, end in reversed(self.levels):
+            nodes = nodes[_intersects(node_bbox[nodes], xmin, ymin, xmax, ymax)]
+            s, e = start[nodes], end[nodes]
+            local, first = _local_index(e - s)
+            nodes = np.repeat(s, e - s) + local        # children of the visited nodes
+
+        hit = _intersects(self.bbox[nodes], xmin, ymin, xmax, ymax)
+        return np.sort(self.ids[nodes[hit]])
+
+    def query_point(self, x, y):
+        """ Returns the sorted positions (0-based) of the records whose bounding box contains the point (x, y). """
+        return self.query_bbox(x, y, x, y)
+
+    def save(self, dst):
+        """ Saves the tree to dst (NumPy .npz format, the name is not changed). """
+        sizes = np.array([len(l[0]) for l in self.levels], dtype = np.int64)
+        empty = np.zeros(0, dtype = np.int64)
+        stamp = np.array(self.stamp if self.stamp is not None else (-1, -1), dtype = np.int64)
+        with open(dst, "wb") as f:
+            np.savez(f, bbox = self.bbox, ids = self.ids, level_sizes = sizes, \
+                     node_bbox = np.concatenate([l[0] for l in self.levels]) if len(sizes) > 0 else np.zeros((0, 4)), \
+                     node_start = np.concatenate([l[1] for l in self.levels]) if len(sizes) > 0 else empty,            \
+                     node_end = np.concatenate([l[2] for l in self.levels]) if len(sizes) > 0 else empty,              \
+                     node_size = np.array(self.node_size), stamp = stamp, version = np.array(SIDECAR_VERSION))
+
+    def _check(self):
+        """ Raises ValueError if the arrays of the tree are not consistent. """
+        n = len(self.ids)
+        if self.bbox.shape != (n, 4) or (n > 0 and (self.ids.min() < 0 or self.ids.max() >= n)):
+            raise ValueError("bounding boxes and positions do not match")
+        below = n
+        for node_bbox, start, end in self.levels:
+            m = len(node_bbox)
+            if node_bbox.shape != (m, 4) or start.shape != (m,) or end.shape != (m,) or \
+               np.any(start < 0) or np.any(end < start) or np.any(end > below):
+                raise ValueError("invalid level")
+            below = m
+        if (n > 0) != (len(self.levels) > 0) or below > 1:
+            raise ValueError("missing levels")
+
+    @staticmethod
+    def load(src):
+        """ Loads a tree saved with save. Raises ValueError if the file is not a valid tree (e.g. it is
+            truncated or it was written by another version).
+        """
+        try:
+            with np.load(src) as d:
+                if "version" not in d or int(d["version"]) != SIDECAR_VERSION:
+                    raise ValueError("unsupported version")
+                bounds = np.zeros(len(d["level_sizes"]) + 1, dtype = np.int64)
+                np.cumsum(d["level_sizes"], out = bounds[1:])
+                node_bbox, node_start, node_end = d["node_bbox"], d["node_start"], d["node_end"]
+                if not len(node_bbox) == len(node_start) == len(node_end) == bounds[-1]:
+                    raise ValueError("size of nodes does not match the levels")
+                levels = [(node_bbox[a:b], node_start[a:b], node_end[a:b]) for a, b in zip(bounds[:-1], bounds[1:])]
+                stamp = tuple(int(v) for v in d["stamp"])
+                tree = RTree(d["bbox"], d["ids"], levels, int(d["node_size"]), None if stamp == (-1, -1) else stamp)
+            tree._check()
+        except (ValueError, KeyError, TypeError, EOFError, zipfile.BadZipFile) as e:
+            raise ValueError("Invalid spatial index %s: %s"%(src, e))
+        return tree
+
+    @staticmethod
+    def build(bbox, node_size = 16, stamp = None):
+        """ Bulk loads a tree with the STR algorithm.
+
+            :param bbox: (n, 4) bounding boxes as (xmin, xmax, ymin, ymax) (see bulk.read_bboxes).
+                         Boxes with NaN values (NULL records) are never returned by queries.
+            :param node_size: maximum number of children of a node
+        """
+        assert node_size > 1
+        bbox = np.asarray(bbox, dtype = np.float64).reshape(-1, 4)
+        order = _str_order(bbox, node_size)
+        ids = order.astype(np.int64)
+        bbox = bbox[order]
+
+        levels = []
+        entries = bbox
+        while len(entries) > 0:
+            start = np.arange(0, len(entries), node_size, dtype = np.int64)
+            end = np.minimum(start + node_size, len(entries))
+            node_bbox = _union(entries, start)
+            if len(node_bbox) > 1:
+                o = _str_order(node_bbox, node_size)
+                node_bbox, start, end = node_bbox[o], start[o], end[o]
+            levels.append((node_bbox, start, end))
+            if len(node_bbox) == 1: break
+            entries = node_bbox
+
+        return RTree(bbox, ids, levels, node_size, stamp)
@@ -2,9 +2,14 @@
 # store its contents
 # REFERENCE: ESRI FileShp Technical Description
 
+import io
+import os
+import mmap as mmap_
 import struct
 import binascii
 
+import numpy as np
+
 from ..helpers import _read_little_int, _read_big_int, _read_little_double, _read_big_double, _read_bounding_box
 from ..shapes.shape_types import TS, SHP_TYPES
 from ..shapes.point import Point
@@ -12,6 +17,16 @@ from ..shapes.polyline import Polyline
 from ..shapes.polygon import Polygon
 from ..shapes.polygonz import PolygonZ
 from ..shapes.multipoint import Multipoint
+from ..shapes.geometry import GeometryArray
+from .bulk import HEADER_SIZE, RECORD_HEADER_SIZE, scan_records, read_bboxes, decode_records
+from .shx import FileShx
+from .lazy import LazyShapes
+from .parallel import read_parallel
+from .rtree import RTree, SIDECAR_EXT, _intersects
+from .dem import FileDem
+from .vtkfile import write_grid, write_pieces, write_index, VTK_VERTEX, VTK_POLYLINE, VTK_TRIANGLE, VTK_POLYGON
+from ..profiling import timer
+from ..interpolation import interpolate
 
 class FileShp:
     def __init__(self, src, shape_type, bbox, mm):
@@ -25,6 +40,10 @@ class FileShp:
         self.bbox = bbox
         self.mm = mm # no idea what is this for
         self.shapes = []
+        self.geometry = None # GeometryArray, only set when the file is read with the numpy engine
+        self.index = None    # RTree of the bounding boxes of the records (see get_index)
+        self.selection = None # positions (0-based) in the file of the records that were read with bbox (None: all records)
+        self._geometry_cache = None # GeometryArray created from the list of shapes (see get_geometry)
     
     def __str__(self):
         s = "="*40 + "\n"
@@ -37,9 +56,125 @@ class FileShp:
         
     def add_shape(self, shape):
         assert self.shape_type == shape.shape_type
+        assert isinstance(self.shapes, list), "Cannot add shapes to a file that was read with the numpy engine or opened lazily"
         self.shapes.append(shape)
+        self._geometry_cache = None
         return self
 
+    def get_geometry(self):
+        """ Returns a GeometryArray with all the shapes in this file. If the file was not read
+            with the numpy engine, then a new one is created from the list of shapes.
+        """
+        if self.geometry is not None:
+            return self.geometry
+        if isinstance(self.shapes, LazyShapes):
+            return self.shapes.to_geometry()
+        if self._geometry_cache is None:
+            self._geometry_cache = GeometryArray.from_shapes(self.shape_type, self.shapes)
+        return self._geometry_cache
+
+    def get_xyz_arrays(self, default_z = None):
+        """ Same as get_xyz_lists, but returns contiguous float64 arrays x, y, z and an int64 array
+            pointsPerShape. x, y (and z for types with elevation) are views of the coordinates
+            stored in the geometry (see get_geometry), so no copy is made.
+        """
+        if not default_z:
+            default_z = self.bbox[4] #zmin
+        g = self.get_geometry()
+        return g.xyz[0], g.xyz[1], g.get_z(default_z), g.points_per_shape()
+
+    def iter_chunks(self, n, dbf = None):
+        """ Iterates over the shapes in this file in chunks of (at most) n shapes.
+            Each chunk is returned as a GeometryArray. For files opened with FileShp.open
+            only one chunk is decoded and kept in memory at a time.
+
+            :param dbf: if present, a FileDbf (e.g. from FileDbf.open) whose records are read
+                        in chunks of the same size. In this case, each iteration returns a tuple
+                        (geometry, columns) where columns is a dictionary of arrays
+                        (see FileDbf.iter_chunks).
+        """
+        nshapes = len(self.shapes)
+        if isinstance(self.shapes, LazyShapes):
+            chunks = (self.shapes.decode(a, min(a + n, nshapes)) for a in range(0, nshapes, n))
+        else:
+            geometry = self.get_geometry()
+            chunks = (geometry.slice(a, min(a + n, nshapes)) for a in range(0, nshapes, n))
+
+        if dbf is None:
+            for g in chunks:
+                yield g
+        else:
+            assert dbf.num_records == nshapes, "Different number of shapes and records"
+            for g, columns in zip(chunks, dbf.iter_chunks(n)):
+                yield g, columns
+
+    def get_index(self, rebuild = False, save = True, node_size = 16, verbose = False):
+        """ Returns an RTree with the bounding boxes of all the records in the file at self.src.
+            Only the bounding boxes are read from the file, points are never decoded.
+            The tree is loaded from the sidecar file (same root as src with extension SIDECAR_EXT)
+            if it exists and it was built from the current version of the .shp file. Sidecar files
+            that cannot be loaded (e.g. truncated) are replaced.
+
+            :param rebuild: if True the tree is built even if the sidecar file is up to date
+            :param save: if True the tree is saved to the sidecar file after it is built. If the file cannot be
+                         written (e.g. read-only directory), the tree is only kept in memory.
+        """
+        if self.index is not None and not rebuild:
+            return self.index
+
+        st = os.stat(self.src)
+        stamp = (st.st_size, st.st_mtime_ns)
+        sidecar = os.path.splitext(self.src)[0] + SIDECAR_EXT
+        if not rebuild and os.path.exists(sidecar):
+            try:
+                index = RTree.load(sidecar)
+            except (OSError, ValueError) as e:
+                if verbose: print("Spatial index not loaded: %s"%e)
+                index = None
+            if index is not None and index.stamp == stamp:
+                if verbose: print("Spatial index loaded from: " + sidecar)
+                self.index = index
+                return index
+
+        with open(self.src, "rb") as b:
+            buf = mmap_.mmap(b.fileno(), 0, access = mmap_.ACCESS_READ)
+        offsets, lengths = FileShp._find_records(self.src, buf, verbose)
+        bbox = read_bboxes(buf, offsets, self.shape_type)
+        buf.close()
+
+        self.index = RTree.build(bbox, node_size, stamp)
+        if verbose: print(self.index)
+        if save:
+            try:
+                self.index.save(sidecar)
+                if verbose: print("Spatial index saved to: " + sidecar)
+            except OSError as e:
+                if verbose: print("Spatial index not saved: %s"%e)
+        return self.index
+
+    def query_bbox(self, xmin, ymin, xmax, ymax):
+        """ Returns the sorted positions (0-based) of the records in the file whose bounding box
+            intersects the window. Positions can be passed to FileShp.read_shapes to read only those shapes.
+        """
+        return self.get_index().query_bbox(xmin, ymin, xmax, ymax)
+
+    def query_point(self, x, y):
+        """ Returns the sorted positions (0-based) of the records in the file whose bounding box contains (x, y). """
+        return self.get_index().query_point(x, y)
+
+    def close(self):
+        """ Releases the memory map of a file opened with FileShp.open. """
+        if isinstance(self.shapes, LazyShapes):
+            buf = self.shapes.buf
+            self.shapes = []
+            if hasattr(buf, "close"): buf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
     def list_shapes(self):
         for s in self.shapes:
             print(s)
@@ -71,43 +206,119 @@ class FileShp:
         """
         rec = dbf.get_records()
         assert len(rec) == len(self.shapes)
+        if not isinstance(self.shapes, list):
+            self.shapes.set_attributes(rec)
+            return
         for s in range(len(self.shapes)):
             shape = self.shapes[s]
             shape.add_attributes(rec[s])
     
-    # def interpolateZ(xp, yp, zp):
-        # """ Interpolate z coordinate (elevation) from a set of 
-            # points with (xp,yp,zp) coordinates.
-        # """
-        # assert len(xp) == len(yp) == len(zp)
-        
-    def toVTK(self, dst, vals = None, text = None , default_z = None, verbose = False, comments = None, useZ = None):
+    def interpolateZ(self, xp, yp, zp, k = 8, method = "idw", power = 2.0):
+        """ Interpolate z coordinate (elevation) from a set of 
+            points with (xp,yp,zp) coordinates (e.g. from get_xyz_arrays of a POINTZ file).
+
+            The elevation of every point is interpolated from its k nearest sample points
+            (see interpolation.interpolate for method and power) and stored in the z coordinates
+            of the geometry (see get_geometry), so it is used by toVTK instead of default_z.
+            Files opened with FileShp.open decode a new geometry every time, so for them the
+            returned array should be passed to toVTK as useZ.
+
+            Returns the array with the interpolated elevations.
+        """
+        assert len(xp) == len(yp) == len(zp)
+        g = self.get_geometry()
+        z = interpolate(xp, yp, zp, g.xyz[0], g.xyz[1], k, method, power)
+        g.set_z(z)
+        return z
+
+    def select_bbox(self, bbox):
+        """ Returns the positions (0-based) in self.shapes of the shapes whose bounding box intersects
+            the window bbox = (xmin, ymin, xmax, ymax).
+        """
+        xmin, ymin, xmax, ymax = bbox
+        return np.nonzero(_intersects(self.get_geometry().bounds(), xmin, ymin, xmax, ymax))[0]
+
+    def toVTK(self, dst, vals = None, text = None , default_z = None, verbose = False, comments = None, useZ = None, bbox = None, \
+              writer = "evtk", fmt = "vtu", compressor = None, pieces = None, dem = None, simplify = None, \
+              lod = None, lod_index = "pvd", triangulate = False):
         """ Exports shapes to an unstructured VTK grid.
             
             useZ: list with point elevations. It should have the same size as the number of points in the shape.
                   If present, then default_z is discarded.
+            bbox: (xmin, ymin, xmax, ymax). If present, only shapes whose bounding box intersects this
+                  window are exported (with their values in vals and text).
+            writer: "evtk" to write the file with evtk, or "native" to stream it with the writer in
+                    vtkfile.py, which does not need evtk and does not copy the coordinates.
+            fmt: (only native writer) "vtu", "vtp" or "vtk" (legacy).
+            compressor: (only native writer) None, "zlib", "lz4" or "lzma".
+            pieces: (only native writer) if larger than 1, shapes are split in this number of pieces with
+                    about the same number of points. Pieces are written at the same time to dst_<i>.vtu
+                    (or .vtp) and a parallel file (dst.pvtu or dst.pvtp) that references them is created.
+                    A single file is written if there are less than 2 shapes.
+
+            dem: FileDem or path to a DEM (see FileDem.read). If present, the elevation of every point of
+                 2D shapes is interpolated from the DEM (types with z keep their coordinates). Points outside
+                 the DEM get default_z.
+            simplify: tolerance. If present, lines and polygon rings are simplified with the Douglas-Peucker
+                      algorithm (see GeometryArray.simplify): points closer than this distance to the simplified
+                      part are removed.
+            lod: list of fractions of the vertices (e.g. [1, 0.1, 0.01]). If present, one file is written for
+                 each level of detail (dst_lod0 has the most vertices) and an index file (see lod_index)
+                 that groups them. All levels are simplified from a single pass over the points
+                 (see GeometryArray.compute_importance). Only lines and polygons have more than one level.
+            lod_index: "pvd" (levels are time steps, from the coarsest to the finest, so ParaView opens the
+                       coarsest one) or "vtm" (multiblock file with one block for each level).
+            triangulate: if True, polygons are exported as triangles that share the points of their rings
+                         instead of one polygon cell for each ring, and holes are cut out (see
+                         GeometryArray.triangulate). The record number of the polygon of each triangle is
+                         stored in the cell field "polygon". Other types are exported as usual.
+
+            Returns the path to the file (the parallel file if pieces is used, the index file if lod is used).
         """
-        from evtk.hl import pointsToVTK, polyLinesToVTK, unstructuredGridToVTK
-        from evtk.vtk import VtkPolygon
-        
-        x, y, z, pointsPerShape = self.get_xyz_lists(default_z, verbose)
-        if useZ:
+        if lod:
+            assert simplify is None, "simplify and lod cannot be used at the same time"
+            return self._write_levels(dst, lod, lod_index, vals = vals, text = text, default_z = default_z, \
+                                      verbose = verbose, comments = comments, useZ = useZ, bbox = bbox, \
+                                      writer = writer, fmt = fmt, compressor = compressor, pieces = pieces, dem = dem, \
+                                      triangulate = triangulate)
+
+        if not default_z:
+            default_z = self.bbox[4] #zmin
+
+        g = self.get_geometry()
+        if bbox is not None:
+            sel = self.select_bbox(bbox)
+            if verbose: print("Shapes in window: %d of %d"%(len(sel), len(g)))
+            if useZ is not None:
+                assert len(useZ) == g.npoints
+                useZ = np.asarray(useZ, dtype = np.float64)[g.point_index(sel)]
+            if vals: vals = {k : np.asarray(v, dtype = np.float64)[sel] for k, v in vals.items()}
+            if text: text = {k : [v[i] for i in sel] for k, v in text.items()}
+            g = g.take(sel)
+        if simplify is not None:
+            npoints = g.npoints
+            g, keep = g.simplify(simplify)
+            if useZ is not None:
+                assert len(useZ) == npoints
+                useZ = np.asarray(useZ, dtype = np.float64)[keep]
+            if verbose: print("Simplification (tolerance: %g) removed %d of %d vertices"%(simplify, npoints - g.npoints, npoints))
+        x, y = g.xyz[0], g.xyz[1]
+        if useZ is not None:
             assert len(x) == len(useZ)
-            z = useZ
-        
-        nshapes = len(self.shapes)
-        
-        import numpy as np
-        x = np.array(x)
-        y = np.array(y)
-        z = np.array(z)
-        pointsPerShape = np.array(pointsPerShape)
+            assert dem is None, "useZ and dem cannot be used at the same time"
+            z = np.asarray(useZ, dtype = np.float64)
+        elif dem is not None and not g.has_z:
+            if not isinstance(dem, FileDem): dem = FileDem.read(dem)
+            z = dem.sample(x, y, fill = default_z)
+            if verbose: print("Elevation of %d points interpolated from: %s"%(len(z), dem.src))
+        else:
+            z = g.get_z(default_z)
         
-        # Export cell data
+        # Export cell data (arrays from FileDbf.get_columns are passed without copying them)
         if vals:
             cellData = {}
             for k, v in vals.items():
-                cellData[k] = np.array(v)
+                cellData[k] = np.ascontiguousarray(v, dtype = np.float64)
         else:
             cellData = None
         
@@ -133,29 +344,136 @@ class FileShp:
             print("type (%d): %s"%(self.shape_type, SHP_TYPES[self.shape_type]) )
         
         st = self.shape_type
+        tri = None
+        if triangulate and st in (TS["POLYGON"], TS["POLYGONZ"]):
+            tri = g.triangulate()
+            if verbose: print("Triangulation: %d triangles from %d polygons"%(len(tri[0]), len(g)))
+
+        if writer == "native":
+            return FileShp._write_native(dst, g, x, y, z, cellData, comments, fmt, compressor, pieces, tri)
+        assert writer == "evtk", "Unknown writer: %s"%writer
+        assert fmt == "vtu" and not compressor and not pieces, "Format, compression and pieces can only be selected with the native writer"
+
+        from evtk.hl import pointsToVTK, polyLinesToVTK, unstructuredGridToVTK
+        from evtk.vtk import VtkPolygon, VtkTriangle
+
         if st == TS["POINT"] or st == TS["POINTZ"]:          # POINT
-            pointsToVTK(dst, x, y, z, data = cellData, comments = comments)
+            return pointsToVTK(dst, x, y, z, data = cellData, comments = comments)
 
         elif st == TS["MULTIPOINT"]:                          # MULTIPOINT
-            pointsToVTK(dst, x, y, z, data = cellData, comments = comments)
+            return pointsToVTK(dst, x, y, z, data = cellData, comments = comments)
             
         elif st == TS["POLYLINE"] or st == TS["POLYLINEZ"]:  # POLYLINE
-            polyLinesToVTK(dst, x, y, z, pointsPerLine = pointsPerShape, cellData = None, pointData = None)
+            # one line for each part, with the values of the shape that owns it
+            partData = None
+            if cellData:
+                part_shape = g.part_to_shape()
+                partData = {k : v[part_shape] for k, v in cellData.items()}
+            return polyLinesToVTK(dst, x, y, z, pointsPerLine = g.points_per_part(), cellData = partData, pointData = None)
 
-        elif st == TS["POLYGON"] or st == TS["POLYGONZ"]:    # POLYGON
+        elif tri is not None:                                  # POLYGON (triangles)
+            triangles, tri_shape = tri
+            offsets = 3 * np.arange(1, len(triangles) + 1, dtype = np.int64)
+            cell_types = np.full(len(triangles), VtkTriangle.tid, dtype = np.uint8)
+            return unstructuredGridToVTK(dst, x, y, z, triangles.ravel(), offsets, cell_types, \
+                                         cellData = FileShp._triangle_data(g, tri_shape, cellData), pointData = None, comments = comments)
 
+        elif st == TS["POLYGON"] or st == TS["POLYGONZ"]:    # POLYGON
+            # one cell for each part (ring), with the values of the shape that owns it.
             # Points should be counter clock-wise
             # Add a small check LATER
-            conn   = np.array([i for i in range(len(x))])
-            offsets = np.zeros(nshapes)
-            cell_types = np.ones(nshapes) * VtkPolygon.tid
-            o = 0
-            for s in range(nshapes):
-                o = o + pointsPerShape[s]
-                offsets[s] = o
-                unstructuredGridToVTK(dst, x, y, z, conn, offsets, cell_types, cellData = cellData, pointData = None, comments = comments)
+            conn = np.arange(len(x), dtype = np.int64)
+            offsets = np.cumsum(g.points_per_part())
+            cell_types = np.full(g.nparts, VtkPolygon.tid, dtype = np.uint8)
+            partData = None
+            if cellData:
+                part_shape = g.part_to_shape()
+                partData = {k : v[part_shape] for k, v in cellData.items()}
+            return unstructuredGridToVTK(dst, x, y, z, conn, offsets, cell_types, cellData = partData, pointData = None, comments = comments)
         else:
             assert False, "Not implemented for type %d"%st
+
+    def _write_levels(self, dst, fractions, index, comments = None, **options):
+        """ Writes the levels of detail of the shapes and their index file (see toVTK). """
+        fractions = sorted(set(float(f) for f in fractions), reverse = True)
+        assert all(0.0 < f <= 1.0 for f in fractions), "Fractions of vertices should be in (0, 1]"
+        g = self.get_geometry()
+        if not g.can_simplify():
+            if options.get("verbose"): print("Levels of detail are only computed for lines and polygons, writing one level")
+            fractions = fractions[:1]
+        else:
+            g.compute_importance()   # kept in the geometry and shared by all levels
+
+        files, names = [], []
+        for i, f in enumerate(fractions):
+            tolerance = g.tolerance_for(f) if g.can_simplify() else None
+            files.append(self.toVTK(dst + "_lod%d"%i, comments = list(comments) if comments else None, \
+                                    simplify = tolerance, **options))
+            names.append("level %d: %g%% of vertices"%(i, 100.0 * f))
+        return write_index(dst, files[::-1], names[::-1], index)     # coarsest level first
+
+    @staticmethod
+    def _triangle_data(g, tri_shape, cellData):
+        """ Returns the cell data of the triangles of the polygons in g: the values of their polygon and its record number. """
+        data = {k : v[tri_shape] for k, v in cellData.items()} if cellData else {}
+        data.setdefault("polygon", np.asarray(g.idx, dtype = np.float64)[tri_shape])
+        return data
+
+    @staticmethod
+    def _native_grid(g, x, y, z, cellData, tri = None):
+        """ Returns the arguments of vtkfile.write_grid for the shapes in g:
+            (x, y, z, cell_sizes, cell_data, point_data, connectivity) and the VTK cell type.
+            tri is the triangulation of the polygons in g (see GeometryArray.triangulate) or None.
+        """
+        st = g.shape_type
+        if st in (TS["POINT"], TS["POINTZ"], TS["MULTIPOINT"]):
+            # one vertex for each point, values are stored as point data (as in evtk.pointsToVTK)
+            pointData = None
+            if cellData:
+                n = g.points_per_shape()
+                pointData = {k : np.repeat(v, n) for k, v in cellData.items()}
+            return (x, y, z, np.ones(len(x), dtype = np.int64), None, pointData, None), VTK_VERTEX
+
+        elif tri is not None:
+            # triangles that share the points of the rings, with the values of their polygon
+            triangles, tri_shape = tri
+            return (x, y, z, np.full(len(triangles), 3, dtype = np.int64), FileShp._triangle_data(g, tri_shape, cellData), \
+                    None, triangles.ravel()), VTK_TRIANGLE
+
+        elif st in (TS["POLYLINE"], TS["POLYLINEZ"], TS["POLYGON"], TS["POLYGONZ"]):
+            # one cell for each part, with the values of the shape that owns it
+            cell_type = VTK_POLYLINE if st in (TS["POLYLINE"], TS["POLYLINEZ"]) else VTK_POLYGON
+            partData = None
+            if cellData:
+                part_shape = g.part_to_shape()
+                partData = {k : v[part_shape] for k, v in cellData.items()}
+            return (x, y, z, g.points_per_part(), partData, None, None), cell_type
+        else:
+            assert False, "Not implemented for type %d"%st
+
+    @staticmethod
+    def _write_native(dst, g, x, y, z, cellData, comments, fmt, compressor, pieces = None, tri = None):
+        """ Writes the shapes in g with vtkfile.write_grid or vtkfile.write_pieces (see toVTK).
+            A single file is written if the shapes cannot be split in several pieces (e.g. no shapes).
+        """
+        ranges = g.split(pieces) if pieces and pieces > 1 else []
+        if len(ranges) < 2:
+            (x, y, z, cell_sizes, cell_data, point_data, conn), cell_type = FileShp._native_grid(g, x, y, z, cellData, tri)
+            return write_grid(dst, x, y, z, cell_sizes, cell_type, cell_data, point_data, \
+                              comments = comments, fmt = fmt, compressor = compressor, connectivity = conn)
+
+        po = g.point_offsets()
+        grids = []
+        for a, b in ranges:
+            p0, p1 = po[a], po[b]
+            data = {k : v[a:b] for k, v in cellData.items()} if cellData else None
+            piece_tri = None
+            if tri is not None:     # triangles are sorted by shape
+                ta, tb = np.searchsorted(tri[1], [a, b])
+                piece_tri = (tri[0][ta:tb] - p0, tri[1][ta:tb] - a)
+            grid, cell_type = FileShp._native_grid(g.slice(a, b), x[p0:p1], y[p0:p1], z[p0:p1], data, piece_tri)
+            grids.append(grid)
+        return write_pieces(dst, grids, cell_type, comments = comments, fmt = fmt, compressor = compressor)
         
     @staticmethod
     def _read_header(b, src, verbose = False):
@@ -200,10 +518,187 @@ class FileShp:
         return FileShp(src, shape_type, bbox, mm)
 
     @staticmethod
-    def read(src, verbose = False):
+    def _find_records(src, buf, verbose = False):
+        """ Returns (offsets, lengths) of the records in the file at src, whose contents are in buf.
+            They are taken from the index file (.shx) if it exists, otherwise the record headers are scanned.
+        """
+        src_shx = os.path.splitext(src)[0] + ".shx"
+        if os.path.exists(src_shx):
+            shx = FileShx.read(src_shx, verbose)
+            return shx.offsets, shx.lengths
+        return scan_records(buf)
+
+    @staticmethod
+    def _read_parallel(src, workers, verbose = False, stats = None):
+        """ Decodes the records with a pool of worker processes (see parallel.read_parallel).
+            Positions of the records are taken from the index file (.shx) if it exists, otherwise
+            the record headers are scanned.
+        """
+        with open(src, "rb") as b, timer(stats, "header"):
+            shp = FileShp._read_header(b, src, verbose)
+
+        with open(src, "rb") as b:
+            buf = mmap_.mmap(b.fileno(), 0, access = mmap_.ACCESS_READ)
+        offsets, lengths = FileShp._find_records(src, buf, verbose)
+        buf.close()
+
+        if len(offsets) == 0:
+            return FileShp._read_numpy(src, verbose, stats)
+
+        shp.geometry = read_parallel(src, shp.shape_type, offsets, lengths, workers)
+        shp.shapes = shp.geometry
+        if verbose: print("  # records: %d  # points: %d"%(len(shp.geometry), shp.geometry.npoints))
+        return shp
+
+    @staticmethod
+    def _read_window(src, bbox, workers = None, verbose = False, stats = None):
+        """ Decodes only the records whose bounding box intersects bbox = (xmin, ymin, xmax, ymax). """
+        xmin, ymin, xmax, ymax = bbox
+        with open(src, "rb") as b:
+            buf = mmap_.mmap(b.fileno(), 0, access = mmap_.ACCESS_READ)
+        with timer(stats, "header"):
+            shp = FileShp._read_header(io.BytesIO(buf[:HEADER_SIZE]), src, verbose)
+
+        offsets, lengths = FileShp._find_records(src, buf, verbose)
+        sel = np.nonzero(_intersects(read_bboxes(buf, offsets, shp.shape_type), xmin, ymin, xmax, ymax))[0]
+        if verbose: print("  # records in window: %d of %d"%(len(sel), len(offsets)))
+
+        if workers is not None and workers > 1 and len(sel) > 0:
+            buf.close()
+            shp.geometry = read_parallel(src, shp.shape_type, offsets[sel], lengths[sel], workers)
+        else:
+            rec = decode_records(buf, offsets[sel], lengths[sel], shp.shape_type)
+            shp.geometry = GeometryArray.from_records(shp.shape_type, rec)
+            del rec
+            buf.close()
+        shp.shapes = shp.geometry
+        shp.selection = sel
+        return shp
+
+    @staticmethod
+    def _read_numpy(src, verbose = False, stats = None):
+        """ Reads the whole file at once and decodes all records with bulk.decode_records. """
+        with open(src, "rb") as b:
+            buf = b.read()
+
+        with timer(stats, "header"):
+            shp = FileShp._read_header(io.BytesIO(buf[:HEADER_SIZE]), src, verbose)
+        offsets, lengths = scan_records(buf)
+        rec = decode_records(buf, offsets, lengths, shp.shape_type)
+        if verbose: print("  # records: %d  # points: %d"%(len(offsets), len(rec["xy"])))
+
+        shp.geometry = GeometryArray.from_records(shp.shape_type, rec)
+        shp.shapes = shp.geometry  # shapes are created on demand as views of the geometry
+        return shp
+
+    @staticmethod
+    def open(src, mmap = True, cache_size = 128, verbose = False):
+        """ Opens a shape file (.shp) without decoding its records.
+            Shapes are decoded when they are indexed or iterated (see LazyShapes), so
+            opening a large file is fast and uses very little memory.
+
+            :param src: path to .shp file
+            :param mmap: if True the file is memory mapped, otherwise it is read into memory
+            :param cache_size: number of decoded shapes kept in memory
+            :return: FileShp. Call close() (or use it in a with statement) to release the file.
+        """
+        print("Opening .shp file from: ")
+        print(src)
+
+        with open(src, "rb") as b:
+            if mmap:
+                buf = mmap_.mmap(b.fileno(), 0, access = mmap_.ACCESS_READ)
+            else:
+                buf = b.read()
+
+        shp = FileShp._read_header(io.BytesIO(buf[:HEADER_SIZE]), src, verbose)
+        shp.shapes = LazyShapes(buf, shp.shape_type, cache_size = cache_size)
+
+        # use the index file to find the records, otherwise they are found on first access
+        src_shx = os.path.splitext(src)[0] + ".shx"
+        if os.path.exists(src_shx):
+            shx = FileShx.read(src_shx, verbose)
+            shp.shapes.set_offsets(shx.offsets, shx.lengths)
+        return shp
+
+    @staticmethod
+    def read_shapes(src, indices, shx = None, verbose = False):
+        """ Reads only some shapes of a shape file using the index file (.shx) to seek
+            straight to the requested records.
+
+            :param src: path to .shp file
+            :param indices: list of positions (0-based) of the shapes to read
+            :param shx: FileShx or path to the .shx file (default: same root as src)
+            :return: FileShp that only stores the requested shapes (in the same order as indices)
+        """
+        print("Reading shapes from .shp file: ")
+        print(src)
+
+        if shx is None:
+            shx = os.path.splitext(src)[0] + ".shx"
+        if isinstance(shx, str):
+            shx = FileShx.read(shx, verbose)
+
+        indices = np.asarray(indices, dtype = np.int64)
+        offsets, lengths = shx.offsets[indices], shx.lengths[indices]
+
+        # copy the requested records into a single buffer and decode them at once
+        size = RECORD_HEADER_SIZE + lengths
+        new_offsets = np.zeros(len(indices), dtype = np.int64)
+        np.cumsum(size[:-1], out = new_offsets[1:])
+        buf = bytearray(int(size.sum()))
+        with open(src, "rb") as b:
+            shp = FileShp._read_header(b, src, verbose)
+            assert shp.shape_type == shx.shape_type
+            for i in range(len(indices)):
+                b.seek(int(offsets[i]))
+                o = int(new_offsets[i])
+                n = b.readinto(memoryview(buf)[o:o + int(size[i])])
+                assert n == size[i], "Truncated record: %d"%indices[i]
+
+        rec = decode_records(buf, new_offsets, lengths, shp.shape_type)
+        shp.geometry = GeometryArray.from_records(shp.shape_type, rec)
+        shp.shapes = shp.geometry
+        return shp
+
+    @staticmethod
+    def read(src, verbose = False, engine = "python", workers = None, stats = None, bbox = None):
+        """ Reads a shape file (.shp).
+
+            :param src: path to .shp file
+            :param engine: "python" to parse the file record by record, or "numpy" to
+                           read the file at once and decode all records with vectorized
+                           NumPy operations (much faster for large files). Both engines
+                           give the same shapes, but the numpy engine stores all the points
+                           in a GeometryArray (see get_geometry) and shapes are created on
+                           demand as views of it.
+            :param workers: if larger than 1, the records are split in contiguous slices that are
+                            decoded in parallel by this number of processes (implies engine = "numpy").
+                            The result is the same as with a single process.
+            :param stats: profiling.Stats where the time spent reading the header and decoding
+                          the shapes is added (stages "header" and "geometry"), or None.
+            :param bbox: (xmin, ymin, xmax, ymax). If present, only the records whose bounding box
+                         intersects this window are decoded (implies engine = "numpy"). The other records
+                         are skipped after reading their bounding box. The positions in the file of the
+                         records that were read are stored in self.selection (e.g. to read the matching
+                         rows of the .dbf file, see FileDbf.read).
+        """
         print("Reading .shp file from: ")
         print(src)
-        
+
+        with timer(stats, "geometry"):
+            if bbox is not None:
+                return FileShp._read_window(src, bbox, workers, verbose, stats)
+            if workers is not None and workers > 1:
+                return FileShp._read_parallel(src, workers, verbose, stats)
+            if engine == "numpy":
+                return FileShp._read_numpy(src, verbose, stats)
+            assert engine == "python", "Unknown engine: %s"%engine
+            return FileShp._read_python(src, verbose, stats)
+
+    @staticmethod
+    def _read_python(src, verbose = False, stats = None):
+        """ Parses the file record by record and creates one shape object for each record. """
         b = open(src, "rb") # assume shape file is not too large to fit in memory (in 2019!)
 
         # UGLY HACK TO CYCLE OVER SHAPES
@@ -211,7 +706,8 @@ class FileShp:
         eof = b.tell() # get current position
         b.seek(0, 0)   # go back to start of file
 
-        shp = FileShp._read_header(b, src, verbose)
+        with timer(stats, "header"):
+            shp = FileShp._read_header(b, src, verbose)
 
         shapes = []
         while (eof - b.tell()) > 0:
@@ -0,0 +1,75 @@
+# Reads the index file (.shx) associated to a shape file (.shp).
+# The index stores the position and length of every record in the .shp file,
+# so shapes can be read in random order without parsing the file from the beginning.
+# REFERENCE: ESRI Shapefile Technical Description
+#
+# File structure:
+# - Header (100 bytes, same layout as the header of the .shp file)
+# - One record of 8 bytes for each shape:
+#     0-3  int32  big  Offset of the record in the .shp file (in 16-bit words)
+#     4-7  int32  big  Content length of the record (in 16-bit words)
+########################################################################
+
+import binascii
+
+import numpy as np
+
+from ..shapes.shape_types import SHP_TYPES
+
+HEADER_SIZE = 100
+
+class FileShx:
+
+    def __init__(self, src, shape_type, offsets, lengths):
+        """
+        :param src: full path to this file
+        :param shape_type: shape type declared in the header
+        :param offsets: position (in bytes) of each record header in the .shp file
+        :param lengths: size (in bytes) of the contents of each record
+        """
+        self.src = src
+        self.shape_type = shape_type
+        self.shape_desc = SHP_TYPES[shape_type]
+        self.offsets = offsets
+        self.lengths = lengths
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __str__(self):
+        s = "="*40 + "\n"
+        s = s + "Index file (.shx): \n"
+        s = s + "  - Src: " + self.src + "\n"
+        s = s + "  - Type: " + self.shape_desc + "\n"
+        s = s + "  - # records: " + str(len(self)) + "\n"
+        s = s + "="*40
+        return s
+
+    @staticmethod
+    def read(src, verbose = False):
+        """ Reads a .shx file. The table of offsets is decoded at once. """
+        print("Reading .shx file from: ")
+        print(src)
+
+        with open(src, "rb") as b:
+            buf = b.read()
+
+        #0-3 int32 big File code (always hex value 0x0000270a)
+        s = binascii.hexlify(buf[:4])
+        assert (s == b"0000270a"), s
+
+        #24-27 int32 big File length (in 16-bit words, including the header)
+        #28-31 int32 little Version
+        #32-35 int32 little Shape type
+        length = int(np.frombuffer(buf, ">i4", count = 1, offset = 24)[0]) * 2
+        version, shape_type = np.frombuffer(buf, "<i4", count = 2, offset = 28)
+        assert (version == 1000)
+        assert length <= len(buf), "Truncated index file"
+        if verbose: print("  length[bytes]: %d   shape type: %d"%(length, shape_type))
+
+        table = np.frombuffer(buf, ">i4", count = (length - HEADER_SIZE) // 4, offset = HEADER_SIZE).reshape(-1, 2)
+        offsets = table[:, 0].astype(np.int64) * 2
+        lengths = table[:, 1].astype(np.int64) * 2
+        if verbose: print("  # records: %d"%len(offsets))
+
+        return FileShx(src, int(shape_type), offsets, lengths)
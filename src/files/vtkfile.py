@@ -0,0 +1,465 @@
+# Streaming writer of VTK files (.vtu, .vtp and legacy .vtk).
+#
+# Unlike evtk, arrays are never assembled in memory: points, connectivity, offsets
+# and cell types are generated and written in chunks directly from the coordinates
+# (e.g. the rows of GeometryArray.xyz), so the memory used by the writer does not
+# depend on the size of the file.
+#
+# XML files (.vtu, .vtp) store all arrays in the appended section as raw binary data.
+# Since compressed sizes are only known after the data is written, DataArray offsets
+# are written as zero padded placeholders that are replaced at the end.
+# Arrays can be compressed with the block layout of vtkZLibDataCompressor (also used
+# by the LZ4 and LZMA compressors):
+#
+#   [nblocks, block_size, last_block_size, compressed size of each block] (UInt64)
+#   followed by the compressed blocks.
+#
+# Blocks are compressed by a pool of threads (zlib, lzma and lz4 release the GIL).
+# Legacy .vtk files are written in binary (big endian) format and are not compressed.
+# REFERENCE: https://vtk.org/wp-content/uploads/2015/04/file-formats.pdf
+########################################################################
+
+import os
+import sys
+import zlib
+import lzma
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+try:
+    import lz4.block as lz4_block
+except ImportError:
+    lz4_block = None
+
+# VTK cell types written by PyGTV
+VTK_VERTEX   = 1
+VTK_POLYLINE = 4
+VTK_TRIANGLE = 5
+VTK_POLYGON  = 7
+
+# compressor: VTK class name
+COMPRESSORS = { "zlib" : "vtkZLibDataCompressor", \
+                "lz4"  : "vtkLZ4DataCompressor",  \
+                "lzma" : "vtkLZMADataCompressor" }
+
+FORMATS = ("vtu", "vtp", "vtk")
+
+BLOCK_SIZE = 32768       # default block size of VTK compressors (bytes)
+CHUNK_SIZE = 1 << 18     # number of values generated at once
+
+_OFFSET_WIDTH = 20       # digits of the placeholders for DataArray offsets
+
+_VTK_TYPES = { np.dtype(np.float64) : "Float64", np.dtype(np.int64) : "Int64", \
+               np.dtype(np.uint8)   : "UInt8",   np.dtype(np.int32) : "Int32" }
+
+# PolyData (.vtp): section with the cells of each type
+_POLYDATA_SECTIONS = { VTK_VERTEX : "Verts", VTK_POLYLINE : "Lines", VTK_TRIANGLE : "Polys", VTK_POLYGON : "Polys" }
+
+########################################################################
+# Sources of data. Each one is a (dtype, ncomponents, nvalues, chunks) tuple where
+# chunks() returns an iterator over contiguous arrays with consecutive values.
+########################################################################
+def _array_source(a, chunk_size = CHUNK_SIZE):
+    a = np.asarray(a)
+    def chunks():
+        for i in range(0, len(a), chunk_size):
+            yield np.ascontiguousarray(a[i:i + chunk_size])
+    return (a.dtype, 1, len(a), chunks)
+
+def _points_source(x, y, z, chunk_size = CHUNK_SIZE):
+    def chunks():
+        for i in range(0, len(x), chunk_size):
+            j = min(i + chunk_size, len(x))
+            p = np.empty((j - i, 3), dtype = np.float64)
+            p[:, 0], p[:, 1], p[:, 2] = x[i:j], y[i:j], z[i:j]
+            yield p
+    return (np.dtype(np.float64), 3, len(x), chunks)
+
+def _range_source(n, chunk_size = CHUNK_SIZE):
+    """ 0, 1, ..., n - 1 (connectivity of cells made of consecutive points). """
+    def chunks():
+        for i in range(0, n, chunk_size):
+            yield np.arange(i, min(i + chunk_size, n), dtype = np.int64)
+    return (np.dtype(np.int64), 1, n, chunks)
+
+def _cumsum_source(sizes, chunk_size = CHUNK_SIZE):
+    """ Cumulative sum of sizes (offsets of the end of each cell). """
+    def chunks():
+        total = 0
+        for i in range(0, len(sizes), chunk_size):
+            c = np.cumsum(sizes[i:i + chunk_size], dtype = np.int64) + total
+            if len(c) > 0: total = int(c[-1])
+            yield c
+    return (np.dtype(np.int64), 1, len(sizes), chunks)
+
+def _constant_source(value, n, dtype, chunk_size = CHUNK_SIZE):
+    def chunks():
+        for i in range(0, n, chunk_size):
+            yield np.full(min(chunk_size, n - i), value, dtype = dtype)
+    return (np.dtype(dtype), 1, n, chunks)
+
+########################################################################
+# Compression
+########################################################################
+def _get_compress(compressor, level):
+    if compressor == "zlib":
+        return lambda b: zlib.compress(b, 6 if level is None else level)
+    elif compressor == "lzma":
+        return lambda b: lzma.compress(b, preset = 6 if level is None else level)
+    elif compressor == "lz4":
+        assert lz4_block is not None, "lz4 compression requires the lz4 package"
+        return lambda b: lz4_block.compress(b, store_size = False)
+    assert False, "Unknown compressor: %s"%compressor
+
+def _blocks(chunks, block_size):
+    """ Regroups the bytes of a sequence of arrays into blocks of block_size bytes (the last one may be shorter). """
+    pending = bytearray()
+    for c in chunks:
+        pending += memoryview(c).cast("B")
+        n = (len(pending) // block_size) * block_size
+        for i in range(0, n, block_size):
+            yield bytes(pending[i:i + block_size])
+        del pending[:n]
+    if len(pending) > 0:
+        yield bytes(pending)
+
+class _AppendedData:
+    """ Writes arrays in the appended section of an XML file. """
+
+    def __init__(self, f, compressor = None, level = None, block_size = BLOCK_SIZE, threads = None):
+        self.f = f
+        self.compress = _get_compress(compressor, level) if compressor else None
+        self.block_size = block_size
+        self.threads = threads if threads else (os.cpu_count() or 1)
+        self.pool = ThreadPoolExecutor(max_workers = self.threads) if compressor else None
+        self.start = None
+
+    def begin(self):
+        self.f.write(b'  <AppendedData encoding="raw">\n   _')
+        self.start = self.f.tell()
+
+    def end(self):
+        self.f.write(b'\n  </AppendedData>\n')
+        if self.pool is not None:
+            self.pool.shutdown()
+
+    def write(self, source):
+        """ Writes the data of source and returns its offset in the appended section. """
+        f = self.f
+        dtype, ncomp, n, chunks = source
+        offset = f.tell() - self.start
+        nbytes = n * ncomp * dtype.itemsize
+
+        if self.compress is None:
+            f.write(np.uint64(nbytes).tobytes())
+            for c in chunks():
+                f.write(memoryview(c).cast("B"))
+            return offset
+
+        bs = self.block_size
+        nblocks = -(-nbytes // bs)
+        header = np.zeros(3 + nblocks, dtype = np.uint64)
+        header[0], header[1], header[2] = nblocks, bs, nbytes % bs
+        pos = f.tell()
+        f.write(header.tobytes())   # placeholder for compressed sizes
+
+        # compress blocks in the pool keeping at most 2 blocks per thread in memory
+        window = deque()
+        k = 0
+        for block in _blocks(chunks(), bs):
+            window.append(self.pool.submit(self.compress, block))
+            while len(window) >= 2 * self.threads or (len(window) > 0 and window[0].done()):
+                c = window.popleft().result()
+                header[3 + k] = len(c)
+                f.write(c)
+                k = k + 1
+        while len(window) > 0:
+            c = window.popleft().result()
+            header[3 + k] = len(c)
+            f.write(c)
+            k = k + 1
+        assert k == nblocks
+
+        end = f.tell()
+        f.seek(pos)
+        f.write(header.tobytes())
+        f.seek(end)
+        return offset
+
+########################################################################
+# XML files
+########################################################################
+def _xml_comment(s):
+    return "<!-- %s -->"%str(s).replace("--", "- -")
+
+class _XmlFile:
+    """ Writes the XML structure of a file and keeps the position of the offset placeholders. """
+
+    def __init__(self, f):
+        self.f = f
+        self.arrays = []   # (position of placeholder, source)
+
+    def line(self, s):
+        self.f.write((s + "\n").encode("utf-8"))
+
+    def data_array(self, name, source, indent = "        "):
+        dtype, ncomp, n, chunks = source
+        s = indent + '<DataArray type="%s" Name="%s" NumberOfComponents="%d" format="appended" offset="'%(_VTK_TYPES[dtype], name, ncomp)
+        self.f.write(s.encode("utf-8"))
+        self.arrays.append((self.f.tell(), source))
+        self.f.write(b"0" * _OFFSET_WIDTH)
+        self.line('"/>')
+
+    def write_data(self, appended):
+        appended.begin()
+        offsets = [appended.write(source) for pos, source in self.arrays]
+        appended.end()
+        end = self.f.tell()
+        for (pos, source), offset in zip(self.arrays, offsets):
+            self.f.seek(pos)
+            self.f.write((("%0" + str(_OFFSET_WIDTH) + "d")%offset).encode("ascii"))
+        self.f.seek(end)
+
+def _write_xml(path, fmt, x, y, z, cell_sizes, cell_type, cell_data, point_data, comments, \
+               compressor, level, block_size, threads, connectivity = None):
+    npoints, ncells = len(x), len(cell_sizes)
+    grid = "UnstructuredGrid" if fmt == "vtu" else "PolyData"
+    byte_order = "LittleEndian" if sys.byteorder == "little" else "BigEndian"
+    compression = ' compressor="%s"'%COMPRESSORS[compressor] if compressor else ""
+
+    with open(path, "wb") as f:
+        # header in text mode, positions are taken from the underlying binary file
+        xml = _XmlFile(f)
+        xml.line('<?xml version="1.0"?>')
+        xml.line('<VTKFile type="%s" version="1.0" byte_order="%s" header_type="UInt64"%s>'%(grid, byte_order, compression))
+        for c in (comments or []):
+            xml.line(_xml_comment(c))
+        xml.line('  <%s>'%grid)
+        if fmt == "vtu":
+            xml.line('    <Piece NumberOfPoints="%d" NumberOfCells="%d">'%(npoints, ncells))
+        else:
+            counts = dict((s, 0) for s in _POLYDATA_SECTIONS.values())
+            counts[_POLYDATA_SECTIONS[cell_type]] = ncells
+            xml.line('    <Piece NumberOfPoints="%d" NumberOfVerts="%d" NumberOfLines="%d" NumberOfStrips="0" NumberOfPolys="%d">'%(npoints, counts["Verts"], counts["Lines"], counts["Polys"]))
+
+        for tag, data in (("PointData", point_data), ("CellData", cell_data)):
+            if data:
+                xml.line('      <%s>'%tag)
+                for k, v in data.items():
+                    xml.data_array(k, _array_source(np.asarray(v, dtype = np.float64)))
+                xml.line('      </%s>'%tag)
+
+        xml.line('      <Points>')
+        xml.data_array("points", _points_source(x, y, z))
+        xml.line('      </Points>')
+
+        section = "Cells" if fmt == "vtu" else _POLYDATA_SECTIONS[cell_type]
+        xml.line('      <%s>'%section)
+        if connectivity is None:
+            xml.data_array("connectivity", _range_source(npoints))
+        else:
+            xml.data_array("connectivity", _array_source(connectivity))
+        xml.data_array("offsets", _cumsum_source(cell_sizes))
+        if fmt == "vtu":
+            xml.data_array("types", _constant_source(cell_type, ncells, np.uint8))
+        xml.line('      </%s>'%section)
+        xml.line('    </Piece>')
+        xml.line('  </%s>'%grid)
+
+        xml.write_data(_AppendedData(f, compressor, level, block_size, threads))
+        xml.line('</VTKFile>')
+
+########################################################################
+# Legacy files
+########################################################################
+def _legacy_name(name):
+    return str(name).replace(" ", "_")
+
+def _write_big(f, source, dtype):
+    """ Writes the values of source as big endian values of type dtype. """
+    for c in source[3]():
+        f.write(c.astype(np.dtype(dtype).newbyteorder(">")).tobytes())
+
+def _cells_source(cell_sizes, connectivity = None, chunk_size = CHUNK_SIZE):
+    """ Legacy cell list: for each cell its number of points followed by the point ids
+        (consecutive points if connectivity is None).
+    """
+    n = len(cell_sizes) + int(np.sum(cell_sizes))
+    def chunks():
+        first = 0
+        for i in range(0, len(cell_sizes), chunk_size):
+            s = np.asarray(cell_sizes[i:i + chunk_size], dtype = np.int64)
+            m = len(s) + int(s.sum())
+            out = np.empty(m, dtype = np.int64)
+            heads = np.arange(len(s)) + np.concatenate(([0], np.cumsum(s)[:-1]))
+            ids = np.ones(m, dtype = bool)
+            ids[heads] = False
+            out[heads] = s
+            if connectivity is None:
+                out[ids] = np.arange(first, first + int(s.sum()), dtype = np.int64)
+            else:
+                out[ids] = connectivity[first:first + int(s.sum())]
+            first = first + int(s.sum())
+            yield out
+    return (np.dtype(np.int64), 1, n, chunks)
+
+def _write_legacy(path, x, y, z, cell_sizes, cell_type, cell_data, point_data, comments, connectivity = None):
+    npoints, ncells = len(x), len(cell_sizes)
+    nids = npoints if connectivity is None else len(connectivity)
+    assert npoints < 2**31, "Too many points for legacy VTK file"
+    title = str(comments[0]) if comments else "PyGTV"
+    with open(path, "wb") as f:
+        def line(s): f.write((s + "\n").encode("utf-8"))
+        line("# vtk DataFile Version 3.0")
+        line(title.replace("\n", " ")[:255])
+        line("BINARY")
+        line("DATASET UNSTRUCTURED_GRID")
+        line("POINTS %d double"%npoints)
+        _write_big(f, _points_source(x, y, z), np.float64)
+        line("")
+        line("CELLS %d %d"%(ncells, ncells + nids))
+        _write_big(f, _cells_source(cell_sizes, connectivity), np.int32)
+        line("")
+        line("CELL_TYPES %d"%ncells)
+        _write_big(f, _constant_source(cell_type, ncells, np.int32), np.int32)
+        line("")
+        for tag, data, n in (("CELL_DATA", cell_data, ncells), ("POINT_DATA", point_data, npoints)):
+            if data:
+                line("%s %d"%(tag, n))
+                for k, v in data.items():
+                    line("SCALARS %s double 1"%_legacy_name(k))
+                    line("LOOKUP_TABLE default")
+                    _write_big(f, _array_source(np.asarray(v, dtype = np.float64)), np.float64)
+                    line("")
+
+########################################################################
+def write_grid(dst, x, y, z, cell_sizes, cell_type, cell_data = None, point_data = None, comments = None, \
+               fmt = "vtu", compressor = None, level = None, block_size = BLOCK_SIZE, threads = None, \
+               connectivity = None):
+    """ Writes a grid where each cell is made of consecutive points: cell i has the points
+        [sum(cell_sizes[:i]), sum(cell_sizes[:i+1])), or the points connectivity[sum(cell_sizes[:i]):sum(cell_sizes[:i+1])]
+        if connectivity is given (e.g. triangles that share points). All cells have the same type.
+
+        :param dst: path to the file without extension
+        :param x, y, z: (npoints,) coordinates (e.g. rows of GeometryArray.xyz)
+        :param cell_sizes: (ncells,) number of points in each cell
+        :param cell_type: VTK_VERTEX, VTK_POLYLINE, VTK_TRIANGLE or VTK_POLYGON
+        :param cell_data: dictionary with one (ncells,) array of values for each field, or None
+        :param point_data: dictionary with one (npoints,) array of values for each field, or None
+        :param comments: list of strings stored as XML comments (only the first one is stored in legacy files)
+        :param fmt: "vtu" (UnstructuredGrid), "vtp" (PolyData) or "vtk" (legacy, binary)
+        :param compressor: None, "zlib", "lz4" or "lzma" (only XML files)
+        :param level: compression level (default of each compressor if None)
+        :param block_size: size of the blocks that are compressed (bytes)
+        :param threads: number of threads used to compress blocks (default: number of CPUs)
+        :param connectivity: (sum(cell_sizes),) point ids of the cells, or None
+        :return: path to the file (with extension)
+    """
+    assert fmt in FORMATS, "Unknown format: %s"%fmt
+    assert len(x) == len(y) == len(z)
+    cell_sizes = np.asarray(cell_sizes, dtype = np.int64)
+    if connectivity is None:
+        assert cell_sizes.sum() == len(x)
+    else:
+        connectivity = np.asarray(connectivity, dtype = np.int64)
+        assert cell_sizes.sum() == len(connectivity)
+    for data, n in ((cell_data, len(cell_sizes)), (point_data, len(x))):
+        if data:
+            for k, v in data.items(): assert len(v) == n, "Wrong number of values in field: %s"%k
+
+    path = dst + "." + fmt
+    if fmt == "vtk":
+        assert not compressor, "Legacy files cannot be compressed"
+        _write_legacy(path, x, y, z, cell_sizes, cell_type, cell_data, point_data, comments, connectivity)
+    else:
+        _write_xml(path, fmt, x, y, z, cell_sizes, cell_type, cell_data, point_data, comments, \
+                   compressor, level, block_size, threads, connectivity)
+    return path
+
+def _write_master(path, fmt, pieces, cell_fields, point_fields, comments):
+    """ Writes the parallel file (.pvtu or .pvtp) that references the files of the pieces. """
+    grid = "PUnstructuredGrid" if fmt == "vtu" else "PPolyData"
+    byte_order = "LittleEndian" if sys.byteorder == "little" else "BigEndian"
+    with open(path, "w") as f:
+        f.write('<?xml version="1.0"?>\n')
+        f.write('<VTKFile type="%s" version="1.0" byte_order="%s" header_type="UInt64">\n'%(grid, byte_order))
+        for c in (comments or []):
+            f.write(_xml_comment(c) + "\n")
+        f.write('  <%s GhostLevel="0">\n'%grid)
+        for tag, names in (("PPointData", point_fields), ("PCellData", cell_fields)):
+            if names:
+                f.write('    <%s>\n'%tag)
+                for k in names:
+                    f.write('      <PDataArray type="Float64" Name="%s" NumberOfComponents="1"/>\n'%k)
+                f.write('    </%s>\n'%tag)
+        f.write('    <PPoints>\n')
+        f.write('      <PDataArray type="Float64" Name="points" NumberOfComponents="3"/>\n')
+        f.write('    </PPoints>\n')
+        for p in pieces:
+            f.write('    <Piece Source="%s"/>\n'%os.path.basename(p))
+        f.write('  </%s>\n'%grid)
+        f.write('</VTKFile>\n')
+
+def write_pieces(dst, pieces, cell_type, comments = None, fmt = "vtu", compressor = None, level = None, \
+                 block_size = BLOCK_SIZE, workers = None):
+    """ Writes a grid split in pieces that can be loaded in parallel (e.g. by ParaView or VisIt).
+        Each piece is written to dst_<i>.<fmt> by a pool of threads, and the parallel file
+        dst.p<fmt> references all of them.
+
+        :param pieces: list of (x, y, z, cell_sizes, cell_data, point_data, connectivity) tuples (see write_grid).
+                       All pieces must have the same fields.
+        :param comments: list of strings stored as XML comments in the parallel file
+        :param fmt: "vtu" or "vtp"
+        :param workers: number of pieces written at the same time (default: number of CPUs)
+        :return: path to the parallel file
+    """
+    assert fmt in ("vtu", "vtp"), "Pieces can only be written to XML files"
+    assert len(pieces) > 0
+    ncpus = os.cpu_count() or 1
+    workers = workers if workers else min(len(pieces), ncpus)
+    threads = max(1, ncpus // workers)   # compression threads of each piece
+
+    with ThreadPoolExecutor(max_workers = workers) as pool:
+        futures = [pool.submit(write_grid, "%s_%d"%(dst, i), x, y, z, cell_sizes, cell_type, cell_data, point_data, \
+                               fmt = fmt, compressor = compressor, level = level, block_size = block_size, threads = threads, \
+                               connectivity = connectivity) \
+                   for i, (x, y, z, cell_sizes, cell_data, point_data, connectivity) in enumerate(pieces)]
+        paths = [f.result() for f in futures]
+
+    x, y, z, cell_sizes, cell_data, point_data, connectivity = pieces[0]
+    path = dst + ".p" + fmt
+    _write_master(path, fmt, paths, list(cell_data or []), list(point_data or []), comments)
+    return path
+
+def write_index(dst, files, names, fmt = "pvd"):
+    """ Writes a file that groups other VTK files, e.g. the levels of detail of a layer.
+
+        :param files: paths to the files, in the directory of dst
+        :param names: name of each file (shown by ParaView for multiblock files)
+        :param fmt: "pvd": collection where file i is time step i (ParaView only loads the current one), or
+                    "vtm": multiblock data set with one block for each file
+        :return: path to the file (dst.pvd or dst.vtm)
+    """
+    assert fmt in ("pvd", "vtm"), "Unknown index format: %s"%fmt
+    assert len(files) == len(names)
+    path = dst + "." + fmt
+    byte_order = "LittleEndian" if sys.byteorder == "little" else "BigEndian"
+    with open(path, "w") as f:
+        f.write('<?xml version="1.0"?>\n')
+        if fmt == "pvd":
+            f.write('<VTKFile type="Collection" version="0.1" byte_order="%s">\n'%byte_order)
+            f.write('  <Collection>\n')
+            for i, (p, name) in enumerate(zip(files, names)):
+                f.write('    ' + _xml_comment(name) + '\n')
+                f.write('    <DataSet timestep="%d" group="" part="0" file="%s"/>\n'%(i, os.path.basename(p)))
+            f.write('  </Collection>\n')
+        else:
+            f.write('<VTKFile type="vtkMultiBlockDataSet" version="1.0" byte_order="%s">\n'%byte_order)
+            f.write('  <vtkMultiBlockDataSet>\n')
+            for i, (p, name) in enumerate(zip(files, names)):
+                f.write('    <DataSet index="%d" name="%s" file="%s"/>\n'%(i, name, os.path.basename(p)))
+            f.write('  </vtkMultiBlockDataSet>\n')
+        f.write('</VTKFile>\n')
+    return path
@@ -189,20 +189,29 @@ class PyGIS(Frame):
         
         from shapeToVTK import get_file_list, export_files
         files_src, files_dst = get_file_list(self.src, self.dst)
-        export_files(files_src, files_dst, default_z, self.verbose.get())
+        results = export_files(files_src, files_dst, default_z, self.verbose.get())
+        for src, dst in results.skipped:
+            self.text.write("Not modified since last export: %s\n"%src)
+        nfailed = 0
+        for src, dst, error in results:
+            if error is not None:
+                self.text.error("%s: %s\n"%(src, error))
+                nfailed = nfailed + 1
         self.text.write("=====================\n")
-        self.text.write("  All files exported \n")
+        self.text.write("  %d file(s) exported, %d failed, %d not modified \n"%(len(results) - nfailed, nfailed, len(results.skipped)))
         self.text.write("=====================\n")
         
         import glob
         ##g = os.path.join(self.dst, "*.vtu")
         ##ff = glob.glob(g)
-        ff = files_dst
+        # files written now or in a previous export (not modified)
+        failed = [dst for src, dst, error in results if error is not None]
+        ff = [f for f in files_dst if f not in failed]
         
         filenames = [os.path.basename(f) + ".vtu" for f in ff]
         #for f in ff: print(f)
         self.exportedFiles['values'] = filenames
-        self.exportedFiles.current(0)
+        if filenames: self.exportedFiles.current(0)
     
     def view_file(self):
         filename = self.exportedFiles.get()
@@ -0,0 +1,183 @@
+# Interpolation of scattered values (e.g. elevations of survey points) at arbitrary
+# (x, y) locations from their k nearest neighbors.
+#
+# Sample points are stored in a regular grid of buckets: points are sorted by cell
+# (row major), so the points of a row of consecutive cells are a contiguous range of
+# the sorted arrays. A k nearest neighbors query looks at the block of cells of
+# "radius" r around the cell of each query point and accepts the k closest candidates
+# once the k-th distance is not larger than the distance to the border of the block
+# (points outside the block cannot be closer). Queries that are not resolved are
+# repeated with a block twice as large. All queries of a batch are processed at once
+# with vectorized NumPy operations.
+########################################################################
+
+import numpy as np
+
+BATCH_SIZE = 65536       # query points processed at a time
+MAX_CANDIDATES = 1 << 22 # maximum size of the (queries x candidates) matrices
+
+class GridIndex:
+
+    def __init__(self, x, y, bucket_size = 4):
+        """
+        :param x, y: coordinates of the sample points
+        :param bucket_size: average number of points in each cell of the grid
+        """
+        x = np.asarray(x, dtype = np.float64)
+        y = np.asarray(y, dtype = np.float64)
+        assert len(x) == len(y) and len(x) > 0
+        n = len(x)
+        self.x0, self.y0 = x.min(), y.min()
+        w, h = x.max() - self.x0, y.max() - self.y0
+        ncells = max(1, n // bucket_size)
+        # square cells, at most about ncells of them (also if points are on a line)
+        s = max(np.sqrt(w * h / ncells), max(w, h) / ncells)
+        self.size = s if s > 0 else 1.0
+        self.nx = int(w / self.size) + 1
+        self.ny = int(h / self.size) + 1
+
+        cx, cy = self._cell(x, y)
+        cell = cy * self.nx + cx
+        self.order = np.argsort(cell, kind = "stable")
+        self.x, self.y = x[self.order], y[self.order]
+        self.start = np.searchsorted(cell[self.order], np.arange(self.nx * self.ny + 1))
+
+    def __len__(self):
+        return len(self.order)
+
+    def __str__(self):
+        return "GridIndex: %d points, %d x %d cells of size %g"%(len(self), self.nx, self.ny, self.size)
+
+    def _cell(self, x, y):
+        cx = np.clip(np.floor((x - self.x0) / self.size), 0, self.nx - 1).astype(np.int64)
+        cy = np.clip(np.floor((y - self.y0) / self.size), 0, self.ny - 1).astype(np.int64)
+        return cx, cy
+
+    def _ranges(self, cx, cy, r):
+        """ Returns (2r + 1, m) arrays a, b such that the points in the row dy of the block of cells
+            [cx - r, cx + r] x [cy - r, cy + r] of each query are the sorted points [a, b).
+        """
+        xa, xb = np.maximum(cx - r, 0), np.minimum(cx + r, self.nx - 1)
+        rows = cy[None, :] + np.arange(-r, r + 1)[:, None]
+        valid = (rows >= 0) & (rows < self.ny)
+        rows = np.clip(rows, 0, self.ny - 1) * self.nx
+        a = np.where(valid, self.start[rows + xa], 0)
+        b = np.where(valid, self.start[rows + xb + 1], 0)
+        return a, b
+
+    def _nearest(self, x, y, a, b, k):
+        """ Returns the squared distances and positions (sorted points) of the k nearest candidates of each
+            query (inf and 0 if there are less than k), where the candidates are given by _ranges.
+        """
+        counts = b - a
+        col = np.zeros_like(counts)
+        np.cumsum(counts[:-1], axis = 0, out = col[1:])
+        width = max(int(col[-1].max() + counts[-1].max()), k)
+        d2 = np.full((len(x), width), np.inf)
+        p = np.zeros((len(x), width), dtype = np.int64)
+        for dy in range(len(a)):
+            c = counts[dy]
+            first = np.zeros(len(c) + 1, dtype = np.int64)
+            np.cumsum(c, out = first[1:])
+            local = np.arange(first[-1], dtype = np.int64) - np.repeat(first[:-1], c)
+            q = np.repeat(np.arange(len(x)), c)
+            pp = np.repeat(a[dy], c) + local
+            cc = np.repeat(col[dy], c) + local
+            d2[q, cc] = (self.x[pp] - x[q])**2 + (self.y[pp] - y[q])**2
+            p[q, cc] = pp
+        if width > k:
+            part = np.argpartition(d2, k - 1, axis = 1)[:, :k]
+            d2, p = np.take_along_axis(d2, part, axis = 1), np.take_along_axis(p, part, axis = 1)
+        o = np.argsort(d2, axis = 1)
+        return np.take_along_axis(d2, o, axis = 1), np.take_along_axis(p, o, axis = 1)
+
+    def _query_batch(self, x, y, k):
+        m = len(x)
+        dist = np.empty((m, k), dtype = np.float64)
+        idx = np.empty((m, k), dtype = np.int64)
+        cx, cy = self._cell(x, y)
+        pending = np.arange(m)
+        r = 1
+        while len(pending) > 0:
+            qx, qy, qcx, qcy = x[pending], y[pending], cx[pending], cy[pending]
+            a, b = self._ranges(qcx, qcy, r)
+
+            # queries are processed in groups with a similar number of candidates to limit memory
+            total = (b - a).sum(axis = 0)
+            by_total = np.argsort(total, kind = "stable")
+            tsorted = np.maximum(total[by_total], k)
+            d2 = np.empty((len(pending), k))
+            p = np.empty((len(pending), k), dtype = np.int64)
+            i = 0
+            while i < len(pending):
+                size = np.arange(1, len(pending) - i + 1) * tsorted[i:]
+                j = i + max(1, int(np.searchsorted(size, MAX_CANDIDATES, side = "right")))
+                g = by_total[i:j]
+                d2[g], p[g] = self._nearest(qx[g], qy[g], a[:, g], b[:, g], k)
+                i = j
+
+            # distance to the border of the block (infinite if the block reaches the border of the grid)
+            inf = np.inf
+            xa, xb = qcx - r, qcx + r
+            ya, yb = qcy - r, qcy + r
+            left = np.where(xa <= 0, inf, qx - (self.x0 + xa * self.size))
+            right = np.where(xb >= self.nx - 1, inf, self.x0 + (xb + 1) * self.size - qx)
+            bottom = np.where(ya <= 0, inf, qy - (self.y0 + ya * self.size))
+            top = np.where(yb >= self.ny - 1, inf, self.y0 + (yb + 1) * self.size - qy)
+            border = np.minimum(np.minimum(left, right), np.minimum(bottom, top))
+            done = (d2[:, k - 1] <= border**2) | np.isinf(border)
+
+            sel = np.nonzero(done)[0]
+            dist[pending[sel]] = np.sqrt(d2[sel])
+            idx[pending[sel]] = self.order[p[sel]]
+            pending = pending[~done]
+            r = 2 * r
+        return dist, idx
+
+    def query(self, x, y, k = 1):
+        """ Returns (dist, idx): (m, k) arrays with the distance to the k nearest sample points of each
+            query point (x, y) and their positions in the arrays used to build the index, sorted by distance.
+            k is reduced to the number of sample points if it is larger.
+        """
+        x = np.atleast_1d(np.asarray(x, dtype = np.float64))
+        y = np.atleast_1d(np.asarray(y, dtype = np.float64))
+        assert len(x) == len(y)
+        k = min(k, len(self))
+        dist = np.empty((len(x), k), dtype = np.float64)
+        idx = np.empty((len(x), k), dtype = np.int64)
+        for a in range(0, len(x), BATCH_SIZE):
+            b = min(a + BATCH_SIZE, len(x))
+            dist[a:b], idx[a:b] = self._query_batch(x[a:b], y[a:b], k)
+        return dist, idx
+
+def interpolate(xp, yp, zp, x, y, k = 8, method = "idw", power = 2.0, index = None):
+    """ Interpolates the values zp known at the sample points (xp, yp) at the points (x, y).
+
+        :param k: number of nearest sample points used for each point
+        :param method: "idw": inverse distance weighting (weights 1 / distance**power), or
+                       "nearest": mean of the k nearest values (k = 1 gives the nearest neighbor)
+        :param index: GridIndex of (xp, yp) to reuse between calls, or None
+        :return: array with the interpolated values
+    """
+    assert method in ("idw", "nearest"), "Unknown interpolation method: %s"%method
+    zp = np.asarray(zp, dtype = np.float64)
+    assert len(zp) == len(xp) == len(yp)
+    if index is None:
+        index = GridIndex(xp, yp)
+    x = np.asarray(x, dtype = np.float64)
+    y = np.asarray(y, dtype = np.float64)
+    z = np.empty(len(x), dtype = np.float64)
+    for a in range(0, len(x), BATCH_SIZE):
+        b = min(a + BATCH_SIZE, len(x))
+        dist, idx = index.query(x[a:b], y[a:b], k)
+        values = zp[idx]
+        if method == "nearest":
+            z[a:b] = values.mean(axis = 1)
+            continue
+        exact = dist == 0.0
+        with np.errstate(divide = "ignore"):
+            w = np.where(exact, 0.0, 1.0 / dist**power)
+        on_sample = exact.any(axis = 1)        # points that coincide with samples take their value
+        w[on_sample] = exact[on_sample]
+        z[a:b] = (w * values).sum(axis = 1) / w.sum(axis = 1)
+    return z
@@ -0,0 +1,183 @@
+# Manifest of the files exported to a directory, used to skip layers that did not change.
+#
+# The manifest is a JSON file stored in the destination directory (MANIFEST_NAME). For each
+# exported layer it records the size, modification time and content hash of its source files
+# (.shp, .shx, .dbf and .prj), the options used to export it and the same information for the
+# VTK file(s) that were written. A layer is exported again if any of them changed.
+#
+# Hashes are only computed when the size or modification time of a file changed, so checking
+# an unchanged layer only needs a few calls to os.stat. A file that was touched but whose
+# content is the same (e.g. copied again from a server) is not exported again.
+#
+# Other files the export depends on (e.g. the DEM used to interpolate elevations) are
+# recorded in the same way, so a layer is also exported again when they change.
+########################################################################
+
+import os
+import re
+import json
+import hashlib
+
+MANIFEST_NAME = ".pygtv_manifest.json"
+MANIFEST_VERSION = 1
+
+# files of a layer that are checked, all of them are optional except .shp
+SRC_EXT = [".shp", ".shx", ".dbf", ".prj"]
+
+CHUNK_SIZE = 1 << 20
+
+def file_hash(path):
+    """ Returns the hash (BLAKE2b, 128 bits) of the content of a file as an hexadecimal string. """
+    h = hashlib.blake2b(digest_size = 16)
+    with open(path, "rb") as f:
+        while True:
+            b = f.read(CHUNK_SIZE)
+            if not b: break
+            h.update(b)
+    return h.hexdigest()
+
+def file_state(path, old = None):
+    """ Returns {"size" : ..., "mtime_ns" : ..., "hash" : ...} for the file in path or None if it does not exist.
+        If old (a previous state of the same file) has the same size and modification time, it is returned
+        without reading the file.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if old is not None and old["size"] == st.st_size and old["mtime_ns"] == st.st_mtime_ns:
+        return old
+    return {"size" : st.st_size, "mtime_ns" : st.st_mtime_ns, "hash" : file_hash(path)}
+
+def vtk_outputs(path):
+    """ Returns the list of files written by FileShp.toVTK to path: path itself and, for parallel
+        files (.pvtu, .pvtp) and index files (.pvd, .vtm), the files that it references.
+    """
+    if path is None:
+        return []
+    files = [path]
+    ext = os.path.splitext(path)[1]
+    if ext in (".pvtu", ".pvtp", ".pvd", ".vtm") and os.path.exists(path):
+        with open(path, "r") as f:
+            pattern = r'<Piece\s+Source="([^"]+)"' if ext in (".pvtu", ".pvtp") else r'<DataSet\s[^>]*file="([^"]+)"'
+            sources = re.findall(pattern, f.read())
+        for s in sources:
+            files = files + vtk_outputs(os.path.join(os.path.dirname(path), s))
+    return files
+
+def _normalize(options):
+    """ Returns options as they are after a round trip to JSON (e.g. tuples become lists). """
+    return json.loads(json.dumps(options, sort_keys = True))
+
+class Manifest:
+
+    def __init__(self, path, entries = None):
+        """
+        :param path: path to the manifest file
+        :param entries: dictionary {src: entry} where src is the absolute path to the layer without extension.
+                        Each entry is {"dst" : ..., "options" : ..., "inputs" : {ext: state}, "outputs" : {path: state},
+                        "depends" : {path: state}} (see file_state).
+        """
+        self.path = path
+        self.entries = entries if entries is not None else {}
+        self.modified = False
+        self.depends = {}   # path: state of the files that layers depend on, computed once for all layers
+
+    def _depends_state(self, path, old = None):
+        """ file_state of a file that layers depend on. Shared files (e.g. a DEM) are only checked once. """
+        if path not in self.depends:
+            self.depends[path] = file_state(path, old)
+        return self.depends[path]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __str__(self):
+        return "Manifest: %s (%d layers)"%(self.path, len(self))
+
+    @staticmethod
+    def load(directory):
+        """ Loads the manifest stored in directory. Returns an empty manifest if there is none or it cannot be read. """
+        path = os.path.join(directory, MANIFEST_NAME)
+        try:
+            with open(path, "r") as f:
+                d = json.load(f)
+            if d.get("version") == MANIFEST_VERSION:
+                return Manifest(path, d["layers"])
+        except (OSError, ValueError, KeyError):
+            pass
+        return Manifest(path)
+
+    def save(self):
+        """ Saves the manifest if it was modified. The file is replaced atomically. """
+        if not self.modified: return
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"version" : MANIFEST_VERSION, "layers" : self.entries}, f, indent = 1, sort_keys = True)
+        os.replace(tmp, self.path)
+        self.modified = False
+
+    def is_current(self, src, dst, options, depends = None):
+        """ Returns True if the layer src (path without extension) was exported to dst with the same options
+            and neither its source files, the files in depends nor the VTK files changed since then.
+        """
+        e = self.entries.get(os.path.abspath(src))
+        if e is None or e["dst"] != os.path.abspath(dst) or e["options"] != _normalize(options):
+            return False
+
+        old_depends = e.get("depends", {})
+        if sorted(old_depends) != sorted(os.path.abspath(f) for f in (depends or [])):
+            return False
+        for path, old in old_depends.items():
+            new = self._depends_state(path, old)
+            if (old is None) != (new is None): return False
+            if new is None: continue
+            if new["hash"] != old["hash"]: return False
+            if new is not old:
+                old_depends[path] = new
+                self.modified = True
+
+        for ext in SRC_EXT:
+            old = e["inputs"].get(ext)
+            new = file_state(src + ext, old)
+            if (old is None) != (new is None): return False    # file added or removed
+            if new is None: continue
+            if new["hash"] != old["hash"]: return False
+            if new is not old:                                  # touched, but with the same content
+                e["inputs"][ext] = new
+                self.modified = True
+
+        for path, old in e["outputs"].items():
+            new = file_state(path, old)
+            if new is None or new["hash"] != old["hash"]: return False
+            if new is not old:
+                e["outputs"][path] = new
+                self.modified = True
+        return True
+
+    def update(self, src, dst, options, path, depends = None):
+        """ Records that the layer src was exported to dst with options.
+            path is the file returned by FileShp.toVTK (None if no file was written) and depends the list
+            of other files used to export it.
+        """
+        inputs = {}
+        for ext in SRC_EXT:
+            s = file_state(src + ext)
+            if s is not None: inputs[ext] = s
+        outputs = {}
+        for f in vtk_outputs(path):
+            s = file_state(f)
+            if s is not None: outputs[os.path.abspath(f)] = s
+        old = self.entries.get(os.path.abspath(src), {}).get("depends", {})
+        deps = {}
+        for f in (depends or []):
+            f = os.path.abspath(f)
+            deps[f] = self._depends_state(f, old.get(f))
+        self.entries[os.path.abspath(src)] = {"dst" : os.path.abspath(dst), "options" : _normalize(options), \
+                                              "inputs" : inputs, "outputs" : outputs, "depends" : deps}
+        self.modified = True
+
+    def remove(self, src):
+        """ Removes the layer src from the manifest (e.g. because its export failed). """
+        if self.entries.pop(os.path.abspath(src), None) is not None:
+            self.modified = True
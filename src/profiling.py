@@ -0,0 +1,152 @@
+# Instrumentation used to find out where time goes while exporting files.
+#
+# A Stats object collects the time spent in each stage of the export of one file
+# (prefetch, header parse, geometry decode, DBF decode, attribute join and VTK write) and some
+# counters (bytes read, records, peak memory). Stages can be nested: the time of a
+# stage does not include the time of the stages timed inside it, so the times of all
+# stages add up to the total time.
+#
+# Readers accept an optional stats argument and use the timer function below, which
+# does nothing if stats is None.
+########################################################################
+
+import sys
+import time
+import contextlib
+
+try:
+    import resource
+except ImportError:   # Windows
+    resource = None
+
+# stages in the order they are reported
+STAGES = ["prefetch", "header", "geometry", "dbf", "attributes", "vtk"]
+
+def timer(stats, stage):
+    """ Returns a context manager that adds the time spent in the block to stats[stage].
+        If stats is None the block is not timed.
+    """
+    if stats is None:
+        return contextlib.nullcontext()
+    return stats.timer(stage)
+
+def peak_memory_mb():
+    """ Returns the peak resident memory of the current process in MB or None if it is not available. """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return rss / 1.0e6  # bytes
+    return rss / 1.0e3      # kilobytes
+
+class Stats:
+
+    def __init__(self, name = ""):
+        """
+        :param name: name of the stats, typically the path to the exported file
+        """
+        self.name = name
+        self.times = {}        # stage: time [s]
+        self.bytes_read = 0
+        self.nrecords = 0
+        self.npoints = 0
+        self.peak_mb = None    # peak resident memory of the process [MB]
+        self._nested = []      # time spent in the stages nested in each active timer
+
+    @contextlib.contextmanager
+    def timer(self, stage):
+        self._nested.append(0.0)
+        t0 = time.perf_counter()
+        try:
+            yield self
+        finally:
+            elapsed = time.perf_counter() - t0
+            nested = self._nested.pop()
+            self.times[stage] = self.times.get(stage, 0.0) + elapsed - nested
+            if len(self._nested) > 0:
+                self._nested[-1] = self._nested[-1] + elapsed
+
+    def sample_memory(self):
+        """ Updates peak_mb with the current peak memory of the process. """
+        m = peak_memory_mb()
+        if m is not None:
+            self.peak_mb = m if self.peak_mb is None else max(self.peak_mb, m)
+
+    @property
+    def total_time(self):
+        return sum(self.times.values())
+
+    def records_per_second(self):
+        t = self.total_time
+        return self.nrecords / t if t > 0 else 0.0
+
+    def add(self, other):
+        """ Adds the times and counters of other to this object. """
+        for stage, t in other.times.items():
+            self.times[stage] = self.times.get(stage, 0.0) + t
+        self.bytes_read = self.bytes_read + other.bytes_read
+        self.nrecords = self.nrecords + other.nrecords
+        self.npoints = self.npoints + other.npoints
+        if other.peak_mb is not None:
+            self.peak_mb = other.peak_mb if self.peak_mb is None else max(self.peak_mb, other.peak_mb)
+        return self
+
+    def _stages(self):
+        stages = [s for s in STAGES if s in self.times]
+        return stages + sorted(s for s in self.times if s not in STAGES)
+
+    def __str__(self):
+        total = self.total_time
+        s = "Stats: %s\n"%self.name
+        for stage in self._stages():
+            t = self.times[stage]
+            s = s + "  - %-12s %10.4f s  (%5.1f %%)\n"%(stage + ":", t, 100.0 * t / total if total > 0 else 0.0)
+        s = s + "  - %-12s %10.4f s\n"%("total:", total)
+        s = s + "  - bytes read: %d (%.2f MB/s)\n"%(self.bytes_read, self.bytes_read / 1.0e6 / total if total > 0 else 0.0)
+        s = s + "  - records: %d (%.0f records/s)   points: %d\n"%(self.nrecords, self.records_per_second(), self.npoints)
+        if self.peak_mb is not None:
+            s = s + "  - peak memory: %.1f MB\n"%self.peak_mb
+        return s
+
+class ExportStats:
+
+    def __init__(self, results, files, skipped = None):
+        """
+        :param results: list with a tuple (src, dst, error) for each exported file.
+                        error is None if the file was exported.
+        :param files: list with the Stats of each file (same order as results)
+        :param skipped: list with a tuple (src, dst) for each file that was not exported because
+                        it did not change since the last export.
+        """
+        assert len(results) == len(files)
+        self.results = results
+        self.files = files
+        self.skipped = skipped if skipped is not None else []
+        self.total = Stats("all files")
+        for f in files:
+            self.total.add(f)
+
+    # iterating gives the (src, dst, error) tuples, as the list returned by previous versions
+    def __iter__(self):
+        return iter(self.results)
+
+    def __len__(self):
+        return len(self.results)
+
+    def __getitem__(self, i):
+        return self.results[i]
+
+    @property
+    def nfailed(self):
+        return sum(1 for r in self.results if r[2] is not None)
+
+    def report(self):
+        """ Returns a string with the stats of every file followed by the totals. """
+        s = "="*40 + "\n"
+        s = s + "Profile:\n"
+        for f in self.files:
+            s = s + str(f)
+        if len(self.files) > 1:
+            s = s + str(self.total)
+        s = s + "="*40
+        return s
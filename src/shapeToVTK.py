@@ -36,11 +36,15 @@
 # DATE:   18/Mar/2019                                                                          #
 ################################################################################################
 
-import os, glob, sys
+import os, glob, sys, time, queue, threading, traceback
 from argparse import ArgumentParser
 from gtv.files.shp import FileShp
 from gtv.files.dbf import FileDbf
 from gtv.files.prj import FilePrj
+from gtv.files.dem import FileDem, source_files as dem_source_files
+from gtv.profiling import Stats, ExportStats, timer
+from gtv.manifest import Manifest
+from gtv.watch import Watcher
 from version import PYGTV_VERSION
 
 def get_file_list(src, dst):
@@ -69,7 +73,7 @@ def get_file_list(src, dst):
 
     else: # directory
         g = os.path.join(src, "*.shp")
-        ff = glob.glob(g)
+        ff = sorted(glob.glob(g))
         for f in ff:
             f = f.split(".")[0]      # remove extension
             files_src.append(f)
@@ -89,31 +93,280 @@ def get_file_list(src, dst):
 
     return files_src, files_dst
 
-def export_files(files_src, files_dst, default_z, verbose = False):
-    for i in range(len(files_src)):
-        src, dst = files_src[i], files_dst[i]
-        print("Processing files...")
-        print("  src: %s"%src)
-        print("  dst: %s"%dst)
-        
-        src_shp = src + ".shp"
-        shp = FileShp.read(src_shp, verbose)         # pass the pointer to the file. It could be faster to read it at once into memory.
-        #print(shp)
-        #shp.list_shapes()
-        
-        src_dbf = src + ".dbf"
-        dbf = FileDbf.read(src_dbf, verbose)
-        #print(dbf)
-        
-        src_prj = src + ".prj"
+def export_file(src, dst, default_z, verbose = False, fields = None, clip = None, vtk_options = None, \
+                engine = "numpy", workers = None, stats = None):
+    """
+    Exports one shape file (and its .dbf and .prj files) to a VTK file.
+    :param src: path to the source files without extension
+    :param dst: path to the VTK file without extension
+    :param clip: (xmin, ymin, xmax, ymax). If present, only shapes whose bounding box intersects
+                 this window (and their records in the .dbf file) are read and exported.
+    :param vtk_options: dictionary with options passed to FileShp.toVTK (e.g. {"writer" : "native", "compressor" : "zlib"})
+    :param engine: engine used to decode the .shp and .dbf files, "python" or "numpy" (see FileShp.read and
+                   FileDbf.read). Both give the same VTK file.
+    :param workers: number of processes used to decode the records of the .shp file (see FileShp.read).
+    :param stats: profiling.Stats where the time spent in each stage is added, or None.
+    :return: path to the VTK file that was written (None if no file was written)
+    """
+    layer = _load_layer(src, dst, verbose, fields, clip, engine, workers, stats)
+    return _write_layer(layer, dst, default_z, verbose, vtk_options, stats)
+
+def _prefetch(src, stats = None):
+    """ Reads the files of the layer src (path without extension) and discards their contents, so they are
+        in the cache of the operating system when they are decoded. Missing files are ignored.
+    """
+    buf = bytearray(1 << 20)
+    with timer(stats, "prefetch"):
+        for ext in (".shp", ".shx", ".dbf", ".prj"):
+            try:
+                with open(src + ext, "rb", buffering = 0) as f:
+                    while f.readinto(buf) > 0: pass
+            except OSError:
+                pass
+
+def _load_layer(src, dst, verbose = False, fields = None, clip = None, engine = "numpy", workers = None, stats = None):
+    """ Reads and decodes the files of the layer src (first half of export_file).
+        Returns (shp, vals, text, comments) or None if there are no shapes (in the clip window, if any).
+    """
+    print("Processing files...")
+    print("  src: %s"%src)
+    print("  dst: %s"%dst)
+
+    src_shp = src + ".shp"
+    shp = FileShp.read(src_shp, verbose, engine = engine, workers = workers, stats = stats, bbox = clip)         # pass the pointer to the file. It could be faster to read it at once into memory.
+    #print(shp)
+    #shp.list_shapes()
+    
+    if len(shp.shapes) == 0:
+        if clip is not None:
+            print("  No shapes in clip window, VTK file is not written")
+        else:
+            print("  No shapes in layer, VTK file is not written")
+        return None
+
+    src_dbf = src + ".dbf"
+    dbf = FileDbf.read(src_dbf, engine = engine, fields = fields, stats = stats, rows = shp.selection)
+    #print(dbf)
+    
+    src_prj = src + ".prj"
+    with timer(stats, "header"):
         prj = FilePrj.read(src_prj)
-        #print(prj)
-        
-        vals, text = dbf.get_records_as_lists()
-        comments =            [".shp: " + shp.src]
-        comments = comments + [".dbf: " + dbf.src]
-        comments = comments + [".prj: " + prj.src]
-        shp.toVTK(dst, vals, text, default_z, verbose, comments = comments)
+    #print(prj)
+    
+    with timer(stats, "attributes"):
+        vals, text = dbf.get_columns()
+    comments =            [".shp: " + shp.src]
+    comments = comments + [".dbf: " + dbf.src]
+    comments = comments + [".prj: " + prj.src]
+
+    if stats is not None:
+        stats.bytes_read = stats.bytes_read + sum(os.path.getsize(f) for f in (src_shp, src_dbf, src_prj))
+        stats.nrecords = stats.nrecords + len(shp.shapes)
+        stats.npoints = stats.npoints + shp.get_geometry().npoints
+    return shp, vals, text, comments
+
+def _write_layer(layer, dst, default_z, verbose = False, vtk_options = None, stats = None):
+    """ Writes a layer returned by _load_layer to dst (second half of export_file). Returns the path to the VTK file,
+        or None if the layer has no shapes.
+    """
+    if layer is None:
+        return None
+    shp, vals, text, comments = layer
+    with timer(stats, "vtk"):
+        path = shp.toVTK(dst, vals, text, default_z, verbose, comments = comments, **(vtk_options or {}))
+    if stats is not None:
+        stats.sample_memory()
+    return path
+
+def _error(e):
+    """ Returns the description of an exception as reported by export_files. """
+    return "%s: %s"%(type(e).__name__, e)
+
+def _export_file_safe(args):
+    """ Calls export_file and returns ((src, dst, error), stats, path), where error is None if the file
+        was exported or a string with the description of the error otherwise, and path is the file
+        returned by export_file. An error in one file does not stop the export of the other files.
+    """
+    src, dst = args[0], args[1]
+    stats = Stats(src)
+    try:
+        path = export_file(*args, stats = stats)
+        return (src, dst, None), stats, path
+    except Exception as e:
+        traceback.print_exc()
+        return (src, dst, _error(e)), stats, None
+
+def _export_pipeline(tasks, depth, record):
+    """ Exports the files in tasks (arguments of export_file) in three stages that run at the same time
+        in different threads: while file k is written, file k+1 is decoded and the files of the next
+        layers are read (see _prefetch). Stages are connected by queues that hold at most depth layers,
+        so at most about 2 * depth + 2 layers are in memory. record is called with the result of each
+        file, in the same order as tasks (see _export_file_safe).
+    """
+    decode_q, write_q = queue.Queue(maxsize = depth), queue.Queue(maxsize = depth)
+
+    def prefetch():
+        for t in tasks:
+            stats = Stats(t[0])
+            _prefetch(t[0], stats)
+            decode_q.put((t, stats))
+        decode_q.put(None)
+
+    def decode():
+        while True:
+            item = decode_q.get()
+            if item is None: break
+            (src, dst, default_z, verbose, fields, clip, vtk_options, engine, workers), stats = item
+            layer, error = None, None
+            try:
+                layer = _load_layer(src, dst, verbose, fields, clip, engine, workers, stats)
+            except Exception as e:
+                traceback.print_exc()
+                error = _error(e)
+            write_q.put((item[0], stats, layer, error))
+        write_q.put(None)
+
+    threads = [threading.Thread(target = prefetch, daemon = True), threading.Thread(target = decode, daemon = True)]
+    for th in threads: th.start()
+
+    while True:
+        item = write_q.get()
+        if item is None: break
+        (src, dst, default_z, verbose, fields, clip, vtk_options, engine, workers), stats, layer, error = item
+        path = None
+        if error is None:
+            try:
+                path = _write_layer(layer, dst, default_z, verbose, vtk_options, stats)
+            except Exception as e:
+                traceback.print_exc()
+                error = _error(e)
+        del item, layer         # do not keep the layer while waiting for the next one
+        record(((src, dst, error), stats, path))
+
+    for th in threads: th.join()
+
+def export_files(files_src, files_dst, default_z, verbose = False, fields = None, jobs = 1, clip = None, vtk_options = None, \
+                 force = False, pipeline = None, engine = "numpy", workers = None):
+    """
+    Exports shape files to VTK files.
+    A manifest (see manifest.py) is kept in the destination directory and files that did not change since
+    they were exported with the same options are skipped.
+    :param fields: list with the names of the fields in the .dbf files that should be exported.
+                   If None, all fields are exported.
+    :param clip: (xmin, ymin, xmax, ymax). If present, only shapes that intersect this window are exported.
+    :param vtk_options: dictionary with options passed to FileShp.toVTK (see export_file).
+    :param jobs: number of processes used to export the files in parallel (0: one per CPU).
+    :param force: if True, all files are exported even if they did not change.
+    :param pipeline: if jobs is 1 and pipeline is a positive integer, reading, decoding and writing of
+                     different files overlap (see _export_pipeline). pipeline is the maximum number of
+                     files waiting between two stages.
+    :param engine, workers: decoding of the .shp and .dbf files (see export_file).
+    :return: profiling.ExportStats. Iterating over it gives a tuple (src, dst, error) for each exported file,
+             in the same order as files_src (error is None if the file was exported), its skipped attribute
+             lists the files that did not change, and its report method returns the time spent in each stage
+             of the export of each file.
+    """
+    # files whose content changes the output, besides the layer
+    depends = []
+    recorded = dict(vtk_options or {})
+    dem = recorded.get("dem")
+    if dem is not None:
+        if isinstance(dem, FileDem): recorded["dem"] = dem.src     # the manifest stores the path
+        depends = dem_source_files(recorded["dem"])
+    options = {"version" : PYGTV_VERSION, "default_z" : default_z, "fields" : fields, "clip" : clip, \
+               "vtk_options" : recorded}
+    manifests, skipped, tasks = {}, [], []
+    for src, dst in zip(files_src, files_dst):
+        d = os.path.dirname(os.path.abspath(dst))
+        if d not in manifests: manifests[d] = Manifest.load(d)
+        if not force and manifests[d].is_current(src, dst, options, depends):
+            skipped.append((src, dst))
+        else:
+            tasks.append((src, dst, default_z, verbose, fields, clip, vtk_options, engine, workers))
+    if jobs == 0: jobs = os.cpu_count()
+
+    out = []
+    def record(r):
+        (src, dst, error), stats, path = r
+        m = manifests[os.path.dirname(os.path.abspath(dst))]
+        if error is None:
+            m.update(src, dst, options, path, depends)
+        else:
+            m.remove(src)
+        out.append((r[0], stats))
+
+    try:
+        if jobs > 1 and len(tasks) > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers = min(jobs, len(tasks))) as pool:
+                for r in pool.map(_export_file_safe, tasks):
+                    record(r)
+        elif pipeline and len(tasks) > 1:
+            _export_pipeline(tasks, pipeline, record)
+        else:
+            for t in tasks:
+                record(_export_file_safe(t))
+    finally:
+        # files exported before an interruption are not exported again in the next run
+        for m in manifests.values():
+            m.save()
+
+    return ExportStats([r for r, s in out], [s for r, s in out], skipped)
+
+def watch_files(src, dst, default_z, verbose = False, fields = None, clip = None, vtk_options = None, \
+                interval = 1.0, debounce = 2.0, engine = "numpy", workers = None):
+    """
+    Watches the directory src and exports the layers that change to the directory dst with export_files,
+    until the process is interrupted (Ctrl+C). Layers that did not change since the last export (see the
+    manifest in dst) are skipped, so only new or modified layers are exported when watching starts.
+    :param interval: time [s] between two scans of src.
+    :param debounce: time [s] the files of a layer must remain unchanged before it is exported (see watch.py).
+    Other parameters are the same as in export_files.
+    """
+    assert os.path.isdir(dst), "Path to dst must point to a directory"
+    watcher = Watcher(src, debounce)
+    print("Watching: %s (Ctrl+C to stop)"%src)
+    try:
+        while True:
+            roots = watcher.poll()
+            if len(roots) > 0:
+                files_dst = [os.path.join(dst, os.path.basename(r)) for r in roots]
+                results = export_files(roots, files_dst, default_z, verbose, fields, 1, clip, vtk_options, \
+                                       engine = engine, workers = workers)
+                print_summary(results)
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("Watch stopped")
+
+def print_summary(results):
+    """ Prints the result of export_files and returns the number of files that failed. """
+    nfailed = 0
+    print("-"*40)
+    print("Summary:")
+    for src, dst in results.skipped:
+        print("  [SKIP] %s (not modified)"%src)
+    for src, dst, error in results:
+        if error is None:
+            print("  [ OK ] %s -> %s"%(src, dst))
+        else:
+            print("  [FAIL] %s: %s"%(src, error))
+            nfailed = nfailed + 1
+    print("%d file(s) exported, %d failed, %d not modified"%(len(results) - nfailed, nfailed, len(results.skipped)))
+    return nfailed
+
+def parse_bbox(s):
+    """ Parses a window given as "xmin,ymin,xmax,ymax". """
+    v = [float(c) for c in s.split(",")]
+    if len(v) != 4 or v[0] > v[2] or v[1] > v[3]:
+        raise ValueError("window should be xmin,ymin,xmax,ymax")
+    return tuple(v)
+
+def parse_fraction(s):
+    """ Parses a fraction given as a number (e.g. 0.1) or as a ratio (e.g. 1/10). """
+    if "/" in s:
+        n, d = s.split("/")
+        return float(n) / float(d)
+    return float(s)
 
 def setup_cmd_parser():
     parser = ArgumentParser(description = "PyGTV version: " + PYGTV_VERSION)
@@ -124,6 +377,63 @@ def setup_cmd_parser():
     parser.add_argument("-e", "--elev", dest="elev",
                         nargs='+', type=float, default=0.0,
                         help="default elevation for files that only have (x,y) coordinates")
+    parser.add_argument("-f", "--fields", dest="fields",
+                        nargs='+', default=None,
+                        help="names of the fields in the .dbf file(s) that should be exported (default: all)")
+    parser.add_argument("--engine", dest="engine",
+                        choices=["python", "numpy"], default="numpy",
+                        help="decoder of .shp and .dbf files (numpy: vectorized, default; python: record by record)")
+    parser.add_argument("--workers", dest="workers",
+                        type=int, default=None,
+                        help="number of processes used to decode the records of each .shp file")
+    parser.add_argument("-j", "--jobs", dest="jobs",
+                        type=int, default=1,
+                        help="number of processes used to export files in a directory (0: one per CPU)")
+    parser.add_argument("-c", "--clip", dest="clip",
+                        type=parse_bbox, default=None,
+                        help="only export shapes that intersect the window xmin,ymin,xmax,ymax (use --clip=... if xmin is negative)")
+    parser.add_argument("--dem", dest="dem", default=None,
+                        help="DEM (ESRI ASCII grid .asc or .npy with .hdr) used to interpolate the elevation of 2D shapes")
+    parser.add_argument("--simplify", dest="simplify",
+                        type=float, default=None,
+                        help="simplify lines and polygons, removing vertices closer than this distance to the simplified shape")
+    parser.add_argument("--lod", dest="lod",
+                        nargs='+', type=parse_fraction, default=None,
+                        help="write levels of detail of lines and polygons with these fractions of the vertices (e.g. 1 1/10 1/100)")
+    parser.add_argument("--lod-index", dest="lod_index",
+                        choices=["pvd", "vtm"], default="pvd",
+                        help="file that groups the levels of detail (pvd: levels are time steps, coarsest first; vtm: multiblock)")
+    parser.add_argument("--triangulate", dest="triangulate", action="store_true",
+                        help="export polygons as triangles, with their holes cut out, instead of one polygon for each ring")
+    parser.add_argument("-w", "--writer", dest="writer",
+                        choices=["evtk", "native"], default="evtk",
+                        help="library used to write VTK files (native: built-in streaming writer)")
+    parser.add_argument("--format", dest="fmt",
+                        choices=["vtu", "vtp", "vtk"], default=None,
+                        help="format of VTK files written by the native writer (default: vtu; vtk: legacy binary)")
+    parser.add_argument("--compress", dest="compressor",
+                        choices=["zlib", "lz4", "lzma"], default=None,
+                        help="compress the data in VTK files written by the native writer")
+    parser.add_argument("--pieces", dest="pieces",
+                        type=int, default=None,
+                        help="split each layer in this number of pieces written in parallel with a .pvtu/.pvtp file (native writer)")
+    parser.add_argument("--pipeline", dest="pipeline",
+                        type=int, default=None,
+                        help="overlap reading, decoding and writing of files, with at most this number of files waiting between stages")
+    parser.add_argument("--force", dest="force", action="store_true",
+                        help="export all files, even if they did not change since the last export")
+    parser.add_argument("--watch", dest="watch", default=None,
+                        help="watch this directory and export the shape files that change to the dst directory")
+    parser.add_argument("--interval", dest="interval",
+                        type=float, default=1.0,
+                        help="time [s] between two scans of the watched directory (default: 1)")
+    parser.add_argument("--debounce", dest="debounce",
+                        type=float, default=2.0,
+                        help="time [s] files must remain unchanged before they are exported in watch mode (default: 2)")
+    parser.add_argument("-p", "--profile", dest="profile", action="store_true",
+                        help="print the time spent in each stage of the export, bytes read, records/s and peak memory")
+    parser.add_argument("--profile-dump", dest="profile_dump", default=None,
+                        help="save cProfile data of the main process to this file (see pstats)")
     parser.add_argument("-g", "--gui", dest="gui", action="store_true",
                         help="run simple graphical interface")
     parser.add_argument("-v", "--verbose", dest="verbose", action="store_true",
@@ -135,6 +445,10 @@ def setup_cmd_parser():
         sys.exit(1)
         
     args = parser.parse_args()
+    if args.writer != "native":
+        given = [o for o, v in (("--format", args.fmt), ("--compress", args.compressor), ("--pieces", args.pieces)) if v is not None]
+        if given: parser.error("%s only supported by the native writer (use -w native)"%", ".join(given))
+    if args.fmt is None: args.fmt = "vtu"
     return args
    
 #####################################
@@ -142,12 +456,14 @@ def setup_cmd_parser():
 #####################################
 if __name__ == "__main__":
     args = setup_cmd_parser()
+    nfailed = 0
 
     if args.gui:
         from gui import run_gui
         run_gui(args)
     
     else:
+        if args.watch: args.src = args.watch
         print("*"*40)
         print("PyGTV version: " + PYGTV_VERSION)
         print("Exporting GIS data to VTK format...")
@@ -156,11 +472,55 @@ if __name__ == "__main__":
         print("Run gui: " + str(args.gui) )
         print("Verbose: " + str(args.verbose) )
         print("Default elevation: " + str(args.elev) )
+        print("Fields: " + (" ".join(args.fields) if args.fields else "all") )
+        if args.clip: print("Clip window: %g,%g,%g,%g"%args.clip )
+        if args.dem: print("DEM: " + args.dem )
+        if args.simplify: print("Simplification tolerance: %g"%args.simplify )
+        if args.lod: print("Levels of detail: " + " ".join("%g"%f for f in args.lod) + " (index: %s)"%args.lod_index )
+        if args.triangulate: print("Triangulate polygons: True" )
+        print("Reader: %s (workers: %s)"%(args.engine, args.workers) )
+        if args.writer == "native":
+            print("Writer: %s (format: %s, compression: %s, pieces: %s)"%(args.writer, args.fmt, args.compressor, args.pieces) )
+        else:
+            print("Writer: %s"%args.writer )
+        print("Force export: " + str(args.force) )
+        if args.watch: print("Watch: interval %g s, debounce %g s"%(args.interval, args.debounce) )
         print("-"*40)
 
-        # DO SOME CHECKING FOR DST (EXIST?, CREATE?, ETC)
-        files_src, files_dst = get_file_list(args.src, args.dst)
-        export_files(files_src, files_dst, args.elev, args.verbose)
+        vtk_options = {"writer" : args.writer}
+        if args.writer == "native":
+            vtk_options["fmt"], vtk_options["compressor"], vtk_options["pieces"] = args.fmt, args.compressor, args.pieces
+        if args.dem:
+            FileDem.read(args.dem, verbose = True)   # converts ASCII grids once, before files are exported in parallel
+            vtk_options["dem"] = args.dem
+        if args.simplify:
+            vtk_options["simplify"] = args.simplify
+        if args.lod:
+            vtk_options["lod"], vtk_options["lod_index"] = args.lod, args.lod_index
+        if args.triangulate:
+            vtk_options["triangulate"] = True
+
+        if args.watch:
+            watch_files(args.watch, args.dst, args.elev, args.verbose, args.fields, args.clip, vtk_options, \
+                        args.interval, args.debounce, args.engine, args.workers)
+        else:
+            # DO SOME CHECKING FOR DST (EXIST?, CREATE?, ETC)
+            files_src, files_dst = get_file_list(args.src, args.dst)
+            if args.profile_dump:
+                import cProfile
+                profiler = cProfile.Profile()
+                profiler.enable()
+            results = export_files(files_src, files_dst, args.elev, args.verbose, args.fields, args.jobs, args.clip, vtk_options, \
+                                   args.force, args.pipeline, args.engine, args.workers)
+            if args.profile_dump:
+                profiler.disable()
+                profiler.dump_stats(args.profile_dump)
+                print("cProfile data saved to: " + args.profile_dump)
+            nfailed = print_summary(results)
+            if args.profile:
+                print(results.report())
         
     print("*** Done ***")
     print("*"*40)
+    if nfailed > 0:
+        sys.exit(1)
@@ -0,0 +1,352 @@
+# Columnar storage for all the shapes in a shape file (.shp).
+#
+# Instead of keeping one object per shape with its points as a list of tuples,
+# the coordinates of all shapes are stored in a single (3, npoints) float64 array.
+# Two offset arrays describe how points are grouped:
+#
+#   - part_offsets[j]  : position of the first point of part j in xyz (size: nparts + 1)
+#   - shape_offsets[i] : position of the first part of shape i in part_offsets (size: nshapes + 1)
+#
+# so the points of shape i are xyz[:, part_offsets[shape_offsets[i]] : part_offsets[shape_offsets[i+1]]].
+# Shape objects (Point, Polygon, etc.) are only created when a shape is indexed, and their
+# points are views of the shared array.
+########################################################################
+
+import numpy as np
+
+from .shape_types import TS, SHP_TYPES
+from .point import Point
+from .multipoint import Multipoint
+from .polyline import Polyline
+from .polygon import Polygon
+from .polygonz import PolygonZ
+from .simplify import douglas_peucker, importance, preserve_topology
+from .triangulate import triangulate
+
+Z_TYPES = (TS["POINTZ"], TS["POLYLINEZ"], TS["POLYGONZ"], TS["MULTIPOINTZ"])
+
+class GeometryArray:
+
+    def __init__(self, shape_type, idx, xyz, part_offsets, shape_offsets, bbox = None, zrange = None, m = None, mrange = None):
+        """
+        :param shape_type: type of the shapes (see shape_types.TS)
+        :param idx: (nshapes,) record number of each shape
+        :param xyz: (3, npoints) coordinates. For 2D types the z row is not meaningful (see has_z),
+                    unless it was assigned with set_z.
+        :param part_offsets: (nparts + 1,) position of the first point of each part
+        :param shape_offsets: (nshapes + 1,) position of the first part of each shape
+        :param bbox: (nshapes, 4) bounding box of each shape as (xmin, xmax, ymin, ymax) or None
+        :param zrange: (nshapes, 2) range of z of each shape or None
+        :param m: (npoints,) measures or None
+        :param mrange: (nshapes, 2) range of measures of each shape or None
+        """
+        assert xyz.shape[0] == 3
+        assert len(shape_offsets) == len(idx) + 1
+        self.shape_type = shape_type
+        self.shape_desc = SHP_TYPES[shape_type]
+        self.has_z = shape_type in Z_TYPES
+        self.z_assigned = False   # True if the z of a 2D type was set with set_z
+        self.importance = None    # (npoints,) importance of the points for simplification (see compute_importance)
+        self.idx = np.asarray(idx)
+        self.xyz = xyz
+        self.part_offsets = np.asarray(part_offsets, dtype = np.int64)
+        self.shape_offsets = np.asarray(shape_offsets, dtype = np.int64)
+        self.bbox = bbox
+        self.zrange = zrange
+        self.m = m
+        self.mrange = mrange
+        self.attribs = None  # list with one record (see FileDbf.get_records) for each shape
+
+    def __len__(self):
+        return len(self.idx)
+
+    def set_attributes(self, records):
+        """ Attaches one record (see FileDbf.get_records) to each shape. """
+        assert len(records) == len(self)
+        self.attribs = records
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0: i = i + len(self)
+        if i < 0 or i >= len(self): raise IndexError("shape index out of range")
+        return self._make_shape(i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._make_shape(i)
+
+    def __str__(self):
+        s = "GeometryArray[%s]: %d shapes, %d parts, %d points"%(self.shape_desc, len(self), self.nparts, self.npoints)
+        return s
+
+    @property
+    def npoints(self):
+        return self.xyz.shape[1]
+
+    @property
+    def nparts(self):
+        return len(self.part_offsets) - 1
+
+    def point_offsets(self):
+        """ Returns (nshapes + 1,) array with the position of the first point of each shape. """
+        return self.part_offsets[self.shape_offsets]
+
+    def points_per_shape(self):
+        return np.diff(self.point_offsets())
+
+    def points_per_part(self):
+        return np.diff(self.part_offsets)
+
+    def part_to_shape(self):
+        """ Returns (nparts,) array with the index of the shape that owns each part. """
+        return np.repeat(np.arange(len(self)), np.diff(self.shape_offsets))
+
+    def get_z(self, default_z = 0.0):
+        """ Returns the z coordinates. For 2D types a new array filled with default_z is returned
+            (unless z was assigned with set_z).
+        """
+        if self.has_z or self.z_assigned:
+            return self.xyz[2]
+        return np.full(self.npoints, default_z, dtype = np.float64)
+
+    def set_z(self, z):
+        """ Stores z as the z coordinates of all points (in place). For 2D types, they are then used
+            instead of the default elevation.
+        """
+        assert len(z) == self.npoints
+        self.xyz[2] = z
+        self.z_assigned = not self.has_z
+
+    def bounds(self):
+        """ Returns (nshapes, 4) bounding boxes as (xmin, xmax, ymin, ymax). If they were not
+            stored in the file (e.g. points), they are computed from the coordinates.
+        """
+        if self.bbox is not None:
+            return self.bbox
+        po = self.point_offsets()[:-1]
+        if len(po) == 0:
+            return np.zeros((0, 4))
+        x, y = self.xyz[0], self.xyz[1]
+        return np.column_stack((np.minimum.reduceat(x, po), np.maximum.reduceat(x, po), \
+                                np.minimum.reduceat(y, po), np.maximum.reduceat(y, po)))
+
+    def point_index(self, sel):
+        """ Returns the positions in xyz of the points of the shapes at positions sel (in the same order). """
+        sel = np.asarray(sel, dtype = np.int64)
+        po = self.point_offsets()
+        counts = po[sel + 1] - po[sel]
+        starts = np.repeat(po[sel] - np.concatenate(([0], np.cumsum(counts)[:-1])), counts)
+        return starts + np.arange(int(counts.sum()), dtype = np.int64)
+
+    def take(self, sel):
+        """ Returns a new GeometryArray with the shapes at positions sel (in the same order). Data is copied. """
+        sel = np.asarray(sel, dtype = np.int64)
+        so = self.shape_offsets
+        pidx = self.point_index(sel)
+
+        # parts: same trick as point_index, over part_offsets
+        nparts = so[sel + 1] - so[sel]
+        first = np.concatenate(([0], np.cumsum(nparts)[:-1])).astype(np.int64)
+        part_idx = np.repeat(so[sel] - first, nparts) + np.arange(int(nparts.sum()), dtype = np.int64)
+        npoints = self.points_per_part()[part_idx]
+        part_offsets = np.zeros(len(part_idx) + 1, dtype = np.int64)
+        np.cumsum(npoints, out = part_offsets[1:])
+        shape_offsets = np.zeros(len(sel) + 1, dtype = np.int64)
+        np.cumsum(nparts, out = shape_offsets[1:])
+
+        g = GeometryArray(self.shape_type, self.idx[sel], self.xyz.take(pidx, axis = 1), part_offsets, shape_offsets, \
+                          bbox = None if self.bbox is None else self.bbox[sel],                         \
+                          zrange = None if self.zrange is None else self.zrange[sel],                   \
+                          m = None if self.m is None else self.m[pidx],                                 \
+                          mrange = None if self.mrange is None else self.mrange[sel])
+        if self.attribs is not None:
+            g.attribs = [self.attribs[i] for i in sel]
+        g.z_assigned = self.z_assigned
+        if self.importance is not None: g.importance = self.importance[pidx]
+        return g
+
+    def can_simplify(self):
+        return self.shape_type in (TS["POLYLINE"], TS["POLYLINEZ"], TS["POLYGON"], TS["POLYGONZ"])
+
+    def compute_importance(self):
+        """ Computes (once) and returns the importance of every point (see simplify.importance).
+            Afterwards, simplify does not need to go over the points again.
+        """
+        if self.importance is None:
+            assert self.can_simplify(), "Only lines and polygons can be simplified"
+            rings = self.shape_type in (TS["POLYGON"], TS["POLYGONZ"])
+            self.importance = importance(self.xyz[0], self.xyz[1], self.part_offsets, rings)
+        return self.importance
+
+    def tolerance_for(self, fraction):
+        """ Returns the tolerance for which simplify keeps (at most) this fraction of the points, besides
+            those kept to preserve topology, or None if all points are kept.
+        """
+        imp = self.compute_importance()
+        nkeep = int(np.ceil(fraction * self.npoints))
+        if nkeep >= self.npoints: return None
+        # importance > t keeps the points above the (nkeep + 1)-th largest value
+        t = -np.partition(-imp, nkeep)[nkeep]
+        if np.isinf(t):      # fewer points than the end points of parts, keep only them
+            finite = imp[np.isfinite(imp)]
+            t = finite.max() if len(finite) > 0 else 0.0
+        return max(t, 0.0)
+
+    def simplify(self, tolerance):
+        """ Simplifies every part of lines and polygons with the Douglas-Peucker algorithm (see simplify.py).
+            Points are kept where the parts of a shape could cross each other after simplification (see
+            simplify.preserve_topology). Returns a new GeometryArray and the boolean array with the points of
+            this array that were kept. Other types are returned unchanged.
+        """
+        if not self.can_simplify():
+            return self, np.ones(self.npoints, dtype = bool)
+        if self.importance is not None:
+            keep = self.importance > tolerance
+        else:
+            rings = self.shape_type in (TS["POLYGON"], TS["POLYGONZ"])
+            keep = douglas_peucker(self.xyz[0], self.xyz[1], self.part_offsets, tolerance, rings)
+        keep = preserve_topology(self.xyz[0], self.xyz[1], self.part_offsets, self.shape_offsets, keep)
+        part_offsets = np.zeros(self.nparts + 1, dtype = np.int64)
+        np.cumsum(np.add.reduceat(keep, self.part_offsets[:-1]) if self.nparts > 0 else [], out = part_offsets[1:])
+        # boolean indexing of the columns gives a Fortran ordered array, rows must be contiguous (e.g. for evtk)
+        g = GeometryArray(self.shape_type, self.idx, np.ascontiguousarray(self.xyz[:, keep]), part_offsets, self.shape_offsets, \
+                          bbox = self.bbox, zrange = self.zrange, m = None if self.m is None else self.m[keep], \
+                          mrange = self.mrange)
+        g.attribs = self.attribs
+        g.z_assigned = self.z_assigned
+        if self.importance is not None: g.importance = self.importance[keep]
+        return g, keep
+
+    def triangulate(self):
+        """ Triangulates polygons, cutting their holes (see triangulate.py). Returns a (ntriangles, 3) array with the
+            positions in xyz of the points of each triangle and a (ntriangles,) array with the shape of each triangle.
+        """
+        assert self.shape_type in (TS["POLYGON"], TS["POLYGONZ"]), "Only polygons can be triangulated"
+        return triangulate(self.xyz[0], self.xyz[1], self.part_offsets, self.shape_offsets)
+
+    def split(self, n):
+        """ Splits the shapes into (at most) n contiguous ranges with about the same number of points.
+            Returns the list of (first, last + 1) shape of each range.
+        """
+        po = self.point_offsets()
+        n = max(1, min(n, len(self)))
+        bounds = np.searchsorted(po, po[-1] * np.arange(1, n) / n) if len(self) > 0 else []
+        bounds = np.unique(np.concatenate(([0], bounds, [len(self)]))).astype(np.int64)
+        return [(int(bounds[i]), int(bounds[i + 1])) for i in range(len(bounds) - 1)]
+
+    def slice(self, a, b):
+        """ Returns a GeometryArray with shapes [a, b). Coordinates are views of this array. """
+        so = self.shape_offsets[a:b + 1]
+        po = self.part_offsets[so[0]:so[-1] + 1]
+        g = GeometryArray(self.shape_type, self.idx[a:b], self.xyz[:, po[0]:po[-1]], po - po[0], so - so[0], \
+                          bbox = None if self.bbox is None else self.bbox[a:b],                             \
+                          zrange = None if self.zrange is None else self.zrange[a:b],                       \
+                          m = None if self.m is None else self.m[po[0]:po[-1]],                             \
+                          mrange = None if self.mrange is None else self.mrange[a:b])
+        if self.attribs is not None:
+            g.attribs = self.attribs[a:b]
+        g.z_assigned = self.z_assigned
+        if self.importance is not None: g.importance = self.importance[po[0]:po[-1]]
+        return g
+
+    def _make_shape(self, i):
+        st = self.shape_type
+        idx = int(self.idx[i])
+        so = self.shape_offsets
+        a, b = self.part_offsets[so[i]], self.part_offsets[so[i + 1]]
+        parts = (self.part_offsets[so[i]:so[i + 1]] - a).tolist()
+        bbox = None if self.bbox is None else tuple(self.bbox[i])
+
+        # Z types other than PolygonZ use the class of the 2D type, with (x, y, z) points
+        if self.has_z:
+            pts = self.xyz[:, a:b].T
+            if bbox is not None and self.zrange is not None: bbox = bbox + tuple(self.zrange[i])
+            if self.m is not None:
+                mm, mpoints = tuple(self.mrange[i]), self.m[a:b]
+            else:
+                mm, mpoints = None, []
+        else:
+            pts = self.xyz[:2, a:b].T
+
+        if st in (TS["POINT"], TS["POINTZ"]):
+            s = Point(idx, float(self.xyz[0, a]), float(self.xyz[1, a]))
+            if self.has_z: s.points = [tuple(float(v) for v in pts[0])]
+
+        elif st in (TS["MULTIPOINT"], TS["MULTIPOINTZ"]):
+            s = Multipoint(idx, pts, bbox)
+
+        elif st in (TS["POLYLINE"], TS["POLYLINEZ"]):
+            s = Polyline(idx, pts, parts, bbox)
+
+        elif st == TS["POLYGON"]:
+            s = Polygon(idx, pts, parts, bbox)
+
+        elif st == TS["POLYGONZ"]:
+            s = PolygonZ(idx, pts, parts, bbox, mm, mpoints)
+
+        else:
+            assert False, "NOT IMPLEMENTED YET FOR TYPE: %d"%(st)
+
+        if self.has_z and st != TS["POLYGONZ"]:
+            s.shape_type, s.shape_desc = st, self.shape_desc
+            s.mm, s.mpoints = mm, mpoints
+
+        if self.attribs is not None:
+            s.attribs = dict(self.attribs[i].values())
+        return s
+
+    @staticmethod
+    def from_records(shape_type, rec):
+        """ Creates a GeometryArray from the dictionary returned by bulk.decode_records. """
+        assert np.all(rec["types"] != TS["NULL"]), "NULL records are not supported yet"
+        xy = rec["xy"]
+        xyz = np.empty((3, len(xy)))
+        xyz[0] = xy[:, 0]
+        xyz[1] = xy[:, 1]
+        if rec["z"] is not None:
+            xyz[2] = rec["z"]
+        else:
+            xyz[2] = 0.0
+
+        # parts in the file are relative to the first point of the shape
+        point_offsets = rec["shape_offsets"]
+        nparts = np.diff(rec["part_offsets"])
+        part_offsets = np.empty(len(rec["parts"]) + 1, dtype = np.int64)
+        part_offsets[:-1] = rec["parts"] + np.repeat(point_offsets[:-1], nparts)
+        part_offsets[-1] = point_offsets[-1]
+
+        return GeometryArray(shape_type, rec["idx"], xyz, part_offsets, rec["part_offsets"], \
+                             bbox = rec["bbox"], zrange = rec["zrange"], m = rec["m"], mrange = rec["mrange"])
+
+    @staticmethod
+    def from_shapes(shape_type, shapes):
+        """ Creates a GeometryArray from a list of shape objects (e.g. FileShp.shapes). """
+        n = len(shapes)
+        npoints = np.array([s.npoints for s in shapes], dtype = np.int64)
+        nparts = np.array([max(len(s.parts), 1) for s in shapes], dtype = np.int64)
+
+        xyz = np.zeros((3, int(npoints.sum())))
+        point_offsets = np.zeros(n + 1, dtype = np.int64)
+        np.cumsum(npoints, out = point_offsets[1:])
+        shape_offsets = np.zeros(n + 1, dtype = np.int64)
+        np.cumsum(nparts, out = shape_offsets[1:])
+        part_offsets = np.empty(int(nparts.sum()) + 1, dtype = np.int64)
+        part_offsets[-1] = point_offsets[-1]
+
+        has_z = shape_type in Z_TYPES
+        for i, s in enumerate(shapes):
+            a, b = point_offsets[i], point_offsets[i + 1]
+            if b > a:
+                pts = np.asarray(s.points, dtype = np.float64)
+                xyz[0, a:b] = pts[:, 0]
+                xyz[1, a:b] = pts[:, 1]
+                if has_z: xyz[2, a:b] = pts[:, 2]
+            parts = s.parts if len(s.parts) > 0 else [0]
+            part_offsets[shape_offsets[i]:shape_offsets[i + 1]] = np.asarray(parts, dtype = np.int64) + a
+
+        idx = np.array([s.idx for s in shapes], dtype = np.int64)
+        bbox = None
+        if n > 0 and all(s.bbox is not None for s in shapes):
+            bbox = np.array([s.bbox[:4] for s in shapes], dtype = np.float64)
+        return GeometryArray(shape_type, idx, xyz, part_offsets, shape_offsets, bbox = bbox)
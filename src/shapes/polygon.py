@@ -49,7 +49,7 @@ class Polygon(Shape):
         for i in range(numParts):
             p = _read_little_int(b)
             if verbose: print("  parts[i]: %d"%(p))
-            parts.append(b)
+            parts.append(p)
 
         points = []
         for i in range(numPoints):
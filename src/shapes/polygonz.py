@@ -19,22 +19,22 @@ class PolygonZ(Shape):
         self.mpoints = mpoints
 
     @staticmethod
-    def read(b):
-        print("reading polygon...")
+    def read(b, verbose = False):
+        if verbose: print("reading polygon...")
         
         # 0-3 	int32 	big 	Record number (1-based)
         idx = _read_big_int(b)
-        print("  idx: %d"%idx)
+        if verbose: print("  idx: %d"%idx)
 
         # 4-7 	int32 	big 	Record length (in 16-bit words)
         length = _read_big_int(b) * 2
-        print("  length: %d [bytes]"%length)
+        if verbose: print("  length: %d [bytes]"%length)
         
         # 0-3 	int32 	little 	Shape type (see reference below)
         shape_type = _read_little_int(b)
         shape_desc = SHP_TYPES[shape_type]
         assert (shape_type == PolygonZ.shape_type)
-        print("  shape type: %d   desc: %s"%(shape_type, shape_desc))
+        if verbose: print("  shape type: %d   desc: %s"%(shape_type, shape_desc))
         
         # 4 doubles with bounding box
         xmin, xmax, ymin, ymax = _read_bounding_box(b)
@@ -42,13 +42,13 @@ class PolygonZ(Shape):
         #
         numParts  = _read_little_int(b)
         numPoints = _read_little_int(b)
-        print("  #parts: %d  #points: %d"%(numParts, numPoints))
+        if verbose: print("  #parts: %d  #points: %d"%(numParts, numPoints))
 
         parts = []
         for i in range(numParts):
             p = _read_little_int(b)
-            print("  parts[i]: %d"%(p))
-            parts.append(b)
+            if verbose: print("  parts[i]: %d"%(p))
+            parts.append(p)
 
         pointsxy = []
         for i in range(numPoints):
@@ -59,7 +59,7 @@ class PolygonZ(Shape):
         zmin = _read_little_double(b)
         zmax = _read_little_double(b)
         bbox = (xmin, xmax, ymin, ymax, zmin, zmax)
-        print( "  (xmin, xmax, ymin, ymax, zmin, zmax): (%g,%g,%g,%g,%g,%g)"%bbox)
+        if verbose: print( "  (xmin, xmax, ymin, ymax, zmin, zmax): (%g,%g,%g,%g,%g,%g)"%bbox)
         
         pointsz = []
         for i in range(numPoints):
@@ -78,7 +78,7 @@ class PolygonZ(Shape):
         points = []
         for i in range(len(pointsxy)):
             x, y, z = pointsxy[i][0], pointsxy[i][1], pointsz[i]
-            print("  (x,y,z): (%g,%g,%g)"%(x,y,z))
+            if verbose: print("  (x,y,z): (%g,%g,%g)"%(x,y,z))
             points.append((x,y,z))
             
         return PolygonZ(idx, points, parts, bbox, mm, mpoints)
@@ -5,8 +5,6 @@ class Shape:
         
     def add_attributes(self, attribs):
         for k, a in attribs.items():
-            print("key: " + a[0])
-            print("val: " + str(a[1]) )
             key = a[0]
             val = a[1]
             self.attribs[key] = val
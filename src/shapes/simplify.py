@@ -0,0 +1,197 @@
+# Simplification of lines and polygon rings with the Douglas-Peucker algorithm.
+#
+# The recursion of the algorithm is replaced by a loop over its levels: all the
+# segments that have to be examined at a given level, for all parts at once, are
+# stored in two arrays (first and last point of each segment). In each iteration
+# the distance of every interior point to the segment that contains it is computed
+# with vectorized operations, and segments whose farthest point is farther than the
+# tolerance are split at that point. The number of iterations is the depth of the
+# recursion, which for real data is about log2 of the number of points of a part.
+#
+# The first and last points of every part are always kept, so lines that share end
+# points remain connected, and rings keep at least 4 points (3 vertices and the
+# closing point), so they never collapse. Simplification is done in the (x, y) plane.
+#
+# The same loop gives the importance of every point: the largest tolerance for which
+# the point is kept, i.e. the minimum of its distance when it was selected and the
+# importance of the points that created its segment. Simplifying with any tolerance t
+# then only needs importance > t, so several levels of detail are computed with a
+# single pass over the points.
+#
+# Parts are simplified independently, so a simplified ring may cross itself or another
+# ring of its shape (e.g. a hole close to its shell). preserve_topology prevents it: each
+# run of removed points is replaced by a segment between the two points that are kept
+# (chord), and the run and the chord enclose a region. If no other point of the shape is
+# inside that region, no part can cross the chord after simplification (an edge that
+# crosses it must have an end point inside the region, or cross the original part). The
+# points of the runs that enclose another point of the shape are kept.
+# REFERENCE: Douglas and Peucker (1973), Algorithms for the reduction of the number of
+#            points required to represent a digitized line or its caricature.
+#            Saalfeld (1999), Topologically consistent line simplification with the
+#            Douglas-Peucker algorithm.
+########################################################################
+
+import numpy as np
+
+MAX_PAIRS = 1 << 22   # maximum number of (run, point) pairs tested at a time
+
+def _importance(x, y, part_offsets, tolerance, rings):
+    """ Returns the importance of every point (see above). Only segments whose farthest point is
+        farther than tolerance are split, points that are not reached get -1.
+    """
+    part_offsets = np.asarray(part_offsets, dtype = np.int64)
+    importance = np.full(len(x), -1.0)
+    a, b = part_offsets[:-1], part_offsets[1:] - 1
+    nonempty = b >= a
+    importance[a[nonempty]] = np.inf
+    importance[b[nonempty]] = np.inf
+    bound = np.full(len(a), np.inf)             # importance of the split that created each segment
+
+    level = 0
+    while True:
+        inner = b - a - 1                       # segments without interior points are final
+        a, b, bound, inner = a[inner > 0], b[inner > 0], bound[inner > 0], inner[inner > 0]
+        if len(a) == 0: break
+
+        first = np.zeros(len(a) + 1, dtype = np.int64)
+        np.cumsum(inner, out = first[1:])
+        seg = np.repeat(np.arange(len(a)), inner)
+        idx = a[seg] + 1 + (np.arange(first[-1], dtype = np.int64) - first[seg])
+
+        # distance from each interior point to its segment
+        dx, dy = x[b] - x[a], y[b] - y[a]
+        l2 = dx * dx + dy * dy
+        px, py = x[idx] - x[a][seg], y[idx] - y[a][seg]
+        with np.errstate(invalid = "ignore", divide = "ignore"):
+            t = np.where(l2[seg] > 0, (px * dx[seg] + py * dy[seg]) / l2[seg], 0.0)
+        t = np.clip(t, 0.0, 1.0)
+        d = np.hypot(px - t * dx[seg], py - t * dy[seg])
+
+        # farthest point of each segment (first one if there are ties)
+        dmax = np.maximum.reduceat(d, first[:-1])
+        at_max = np.nonzero(d == dmax[seg])[0]
+        s, pos = np.unique(seg[at_max], return_index = True)
+        far = idx[at_max[pos]]
+
+        value = np.minimum(dmax, bound)
+        if rings and level < 2:                 # first split gives the farthest point, the second a third vertex
+            value[:] = np.inf
+        split = value > tolerance
+        importance[far[split]] = value[split]
+        a = np.concatenate((a[split], far[split]))
+        b = np.concatenate((far[split], b[split]))
+        bound = np.concatenate((value[split], value[split]))
+        level = level + 1
+
+    return importance
+
+def douglas_peucker(x, y, part_offsets, tolerance, rings = False):
+    """ Returns a boolean array with the points that are kept.
+
+        :param x, y: coordinates of all points
+        :param part_offsets: (nparts + 1,) position of the first point of each part
+        :param tolerance: maximum distance between the removed points and the simplified part
+        :param rings: if True, parts are closed rings (polygons) and at least 4 points of each ring are kept
+    """
+    return _importance(x, y, part_offsets, tolerance, rings) > tolerance
+
+def importance(x, y, part_offsets, rings = False):
+    """ Returns the importance of every point: douglas_peucker(..., t) is the same as importance(...) > t.
+        End points of parts (and the first vertices of rings) have infinite importance.
+    """
+    return _importance(x, y, part_offsets, -1.0, rings)
+
+def preserve_topology(x, y, part_offsets, shape_offsets, keep, max_pairs = MAX_PAIRS):
+    """ Returns a copy of keep (see douglas_peucker) where the removed points of a run are kept again if
+        the region between the run and its chord contains another point of the same shape (see above).
+
+        :param shape_offsets: (nshapes + 1,) position of the first part of each shape
+    """
+    keep = np.array(keep, dtype = bool)
+    part_offsets = np.asarray(part_offsets, dtype = np.int64)
+    shape_offsets = np.asarray(shape_offsets, dtype = np.int64)
+    npoints = len(x)
+    if npoints == 0: return keep
+    part = np.repeat(np.arange(len(part_offsets) - 1), np.diff(part_offsets))
+    shape = np.repeat(np.arange(len(shape_offsets) - 1), np.diff(shape_offsets))[part]
+
+    # runs of removed points between two consecutive kept points a and b of the same part
+    k = np.nonzero(keep)[0]
+    a, b = k[:-1], k[1:]
+    run = (part[a] == part[b]) & (b - a > 1)
+    a, b = a[run], b[run]
+    if len(a) == 0: return keep
+    n = b - a + 1
+    first = np.zeros(len(a) + 1, dtype = np.int64)
+    np.cumsum(n, out = first[1:])
+    rid = np.repeat(np.arange(len(a)), n)
+    pts = a[rid] + np.arange(first[-1], dtype = np.int64) - first[rid]
+    xmin, xmax = np.minimum.reduceat(x[pts], first[:-1]), np.maximum.reduceat(x[pts], first[:-1])
+    ymin, ymax = np.minimum.reduceat(y[pts], first[:-1]), np.maximum.reduceat(y[pts], first[:-1])
+    # bounding box of the region in the direction of the chord and across it
+    dx, dy = x[b] - x[a], y[b] - y[a]
+    length = np.hypot(dx, dy)
+    zero = length == 0                          # chords of length zero use the x axis
+    length[zero], dx[zero] = 1.0, 1.0
+    ux, uy = dx / length, dy / length
+    def along(r, px, py):
+        return (px - x[a[r]]) * ux[r] + (py - y[a[r]]) * uy[r]
+    def across(r, px, py):
+        return (py - y[a[r]]) * ux[r] - (px - x[a[r]]) * uy[r]
+    t, d = along(rid, x[pts], y[pts]), across(rid, x[pts], y[pts])
+    tmin, tmax = np.minimum.reduceat(t, first[:-1]), np.maximum.reduceat(t, first[:-1])
+    dmin, dmax = np.minimum.reduceat(d, first[:-1]), np.maximum.reduceat(d, first[:-1])
+
+    # points sorted by shape + (x - xmin) / (2 * width), which is in [shape, shape + 0.5]
+    nshapes = len(shape_offsets) - 1
+    sxmin = np.full(nshapes, np.inf)
+    sxmax = np.full(nshapes, -np.inf)
+    np.minimum.at(sxmin, shape, x)
+    np.maximum.at(sxmax, shape, x)
+    scale = np.where(sxmax > sxmin, 0.5 / (sxmax - sxmin), 0.0)
+    eps = 1e-9 + 4 * np.spacing(float(nshapes))
+    def key(s, xx):
+        return s + (xx - sxmin[s]) * scale[s]
+    pkey = key(shape, x)
+    order = np.argsort(pkey, kind = "stable")
+    pkey = pkey[order]
+
+    s = shape[a]
+    lo = np.searchsorted(pkey, key(s, xmin) - eps, side = "left")
+    hi = np.searchsorted(pkey, key(s, xmax) + eps, side = "right")
+    counts = hi - lo
+    cost = np.cumsum(counts * n)      # pairs are tested against the n segments of the region
+    bad = np.zeros(len(a), dtype = bool)
+    i = 0
+    while i < len(a):
+        j = max(i + 1, int(np.searchsorted(cost, (cost[i - 1] if i > 0 else 0) + max_pairs, side = "right")))
+        cnt = counts[i:j]
+        r = np.repeat(np.arange(i, j), cnt)
+        start = np.zeros(len(cnt) + 1, dtype = np.int64)
+        np.cumsum(cnt, out = start[1:])
+        q = order[np.repeat(lo[i:j], cnt) + np.arange(start[-1], dtype = np.int64) - np.repeat(start[:-1], cnt)]
+        qx, qy = x[q], y[q]
+        # candidates: points in the bounding box of the region that are not on the run or at its ends
+        c = (qy >= ymin[r]) & (qy <= ymax[r]) & (qx >= xmin[r]) & (qx <= xmax[r]) & (shape[q] == s[r])
+        c &= ~((part[q] == part[a[r]]) & (q >= a[r]) & (q <= b[r]))
+        c &= ((qx != x[a[r]]) | (qy != y[a[r]])) & ((qx != x[b[r]]) | (qy != y[b[r]]))
+        r, qx, qy = r[c], qx[c], qy[c]
+        t, d = along(r, qx, qy), across(r, qx, qy)
+        c = (t >= tmin[r]) & (t <= tmax[r]) & (d >= dmin[r]) & (d <= dmax[r])
+        r, qx, qy = r[c], qx[c], qy[c]
+
+        # crossing number of each candidate with the segments of the run and the chord (b -> a)
+        m = n[r]
+        pair = np.repeat(np.arange(len(r)), m)
+        local = np.arange(m.sum(), dtype = np.int64) - np.repeat(np.cumsum(m) - m, m)
+        u = a[r][pair] + local
+        v = np.where(local == m[pair] - 1, a[r][pair], u + 1)
+        px, py = qx[pair], qy[pair]
+        with np.errstate(invalid = "ignore", divide = "ignore"):
+            cross = ((y[u] > py) != (y[v] > py)) & (px < x[u] + (py - y[u]) * (x[v] - x[u]) / (y[v] - y[u]))
+        inside = np.bincount(pair, weights = cross, minlength = len(r)) % 2 == 1
+        bad[r[inside]] = True
+        i = j
+
+    keep[pts[bad[rid]]] = True
+    return keep
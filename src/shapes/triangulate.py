@@ -0,0 +1,325 @@
+# Triangulation of polygons with holes by ear clipping.
+#
+# Rings follow the conventions of shape files: outer rings are clockwise and holes are
+# counter clockwise (shapes without clockwise rings are taken as outer rings with the
+# wrong orientation). Each hole is assigned to the outer ring of its shape that contains
+# it and is connected to it by a bridge, two coincident edges between the rightmost
+# vertex of the hole and a visible vertex of the ring, which gives a single (weakly)
+# simple polygon. Holes are bridged from right to left, so a hole may be connected to
+# a hole that was bridged before.
+#
+# Ears are clipped from all polygons at once with vectorized operations. In each
+# iteration every convex vertex is tested against the reflex vertices of its polygon
+# whose x is in the range of its triangle (reflex vertices are sorted by polygon and x,
+# so they are found with a binary search), and a set of ears with no two adjacent tips
+# is clipped. These ears do not overlap, so they can be clipped together. If an
+# invalid polygon (e.g. self-intersecting) has no ear, one of its vertices is clipped
+# anyway, so every polygon loses at least one vertex in each iteration.
+# REFERENCE: Eberly (2002), Triangulation by ear clipping.
+#            https://www.geometrictools.com/Documentation/TriangulationByEarClipping.pdf
+########################################################################
+
+import numpy as np
+
+MAX_PAIRS = 1 << 22   # maximum number of (ear, reflex vertex) pairs tested at a time
+
+def _cross(ax, ay, bx, by, cx, cy):
+    """ Cross product of (b - a) and (c - a): > 0 if c is to the left of a -> b. """
+    return (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+
+def _rings(x, y, part_offsets):
+    """ Returns (v, offsets): the positions of the points of every ring without repeated consecutive
+        points and without the closing point, and (nparts + 1,) offsets of each ring in v.
+    """
+    po = np.asarray(part_offsets, dtype = np.int64)
+    n = np.diff(po)
+    part = np.repeat(np.arange(len(n)), n)
+    v = np.arange(po[-1], dtype = np.int64)
+    keep = np.ones(len(v), dtype = bool)
+    keep[1:] = (x[1:] != x[:-1]) | (y[1:] != y[:-1]) | (part[1:] != part[:-1])
+    v, part = v[keep], part[keep]
+
+    offsets = np.zeros(len(n) + 1, dtype = np.int64)
+    np.cumsum(np.bincount(part, minlength = len(n)), out = offsets[1:])
+    first, last = offsets[:-1], offsets[1:] - 1
+    closed = last > first
+    f, l = v[first[closed]], v[last[closed]]
+    closed[closed] = (x[f] == x[l]) & (y[f] == y[l])
+    keep = np.ones(len(v), dtype = bool)
+    keep[last[closed]] = False
+    v, part = v[keep], part[keep]
+    np.cumsum(np.bincount(part, minlength = len(n)), out = offsets[1:])
+    return v, offsets
+
+def _signed_area(x, y, v, offsets):
+    """ Twice the signed area of each ring (> 0 if counter clockwise, 0 for empty rings). """
+    n = np.diff(offsets)
+    part = np.repeat(np.arange(len(n)), n)
+    nxt = np.arange(len(v), dtype = np.int64) + 1
+    nxt[offsets[1:][n > 0] - 1] = offsets[:-1][n > 0]
+    first = v[offsets[part]]
+    ax, ay = x[v] - x[first], y[v] - y[first]     # relative to the first point, to limit round off
+    bx, by = x[v[nxt]] - x[first], y[v[nxt]] - y[first]
+    return np.bincount(part, weights = ax * by - bx * ay, minlength = len(n))
+
+def _inside_ring(px, py, rx, ry):
+    """ Returns True if (px, py) is inside the ring (rx, ry) (crossing number). """
+    nx, ny = np.roll(rx, -1), np.roll(ry, -1)
+    with np.errstate(invalid = "ignore", divide = "ignore"):
+        crosses = ((ry > py) != (ny > py)) & (px < rx + (py - ry) * (nx - rx) / (ny - ry))
+    return np.count_nonzero(crosses) % 2 == 1
+
+def _in_sector(ax, ay, bx, by, cx, cy, px, py):
+    """ Returns True if p is in the interior angle at b of the counter clockwise polygon a -> b -> c. """
+    left1 = _cross(ax, ay, bx, by, px, py) >= 0
+    left2 = _cross(bx, by, cx, cy, px, py) >= 0
+    if _cross(ax, ay, bx, by, cx, cy) >= 0:
+        return left1 and left2
+    return left1 or left2
+
+def _bridge(ring, hole, x, y):
+    """ Returns the polygon made of ring (counter clockwise) and hole (clockwise) connected by a bridge
+        from the rightmost vertex of the hole, or None if no vertex of the ring is visible from it.
+    """
+    hx = x[hole]
+    k = int(np.argmax(hx))
+    mx, my = hx[k], y[hole[k]]
+    rx, ry = x[ring], y[ring]
+    nx, ny = np.roll(rx, -1), np.roll(ry, -1)
+
+    # nearest edge hit by the ray from M to the right
+    with np.errstate(invalid = "ignore", divide = "ignore"):
+        xi = rx + (my - ry) * (nx - rx) / (ny - ry)
+    hit = (np.minimum(ry, ny) <= my) & (np.maximum(ry, ny) >= my) & (ry != ny) & (xi >= mx)
+    if not hit.any():
+        return None
+    j = int(np.nonzero(hit)[0][np.argmin(xi[hit])])
+    ix = xi[j]
+    j1 = (j + 1) % len(ring)
+    if ix == rx[j] and my == ry[j]: p = j
+    elif ix == nx[j] and my == ny[j]: p = j1
+    else:
+        p = j if rx[j] >= rx[j1] else j1
+        # reflex vertices in the triangle (M, I, P) hide P, take the one closest in angle to the ray
+        px, py = rx[p], ry[p]
+        prx, pry = np.roll(rx, 1), np.roll(ry, 1)
+        reflex = _cross(prx, pry, rx, ry, nx, ny) <= 0
+        s = 1.0 if _cross(mx, my, ix, my, px, py) >= 0 else -1.0
+        inside = (s * _cross(mx, my, ix, my, rx, ry) >= 0) & (s * _cross(ix, my, px, py, rx, ry) >= 0) \
+                 & (s * _cross(px, py, mx, my, rx, ry) >= 0)
+        c = np.nonzero(reflex & inside & ((rx != px) | (ry != py)))[0]
+        if len(c) > 0:
+            angle = np.arctan2(np.abs(ry[c] - my), rx[c] - mx)
+            dist = np.hypot(rx[c] - mx, ry[c] - my)
+            p = int(c[np.lexsort((dist, angle))[0]])
+
+    # after other bridges, the vertex may appear more than once: use the one whose angle contains M
+    same = np.nonzero((rx == rx[p]) & (ry == ry[p]))[0]
+    if len(same) > 1:
+        for q in same:
+            a, b = (q - 1) % len(ring), (q + 1) % len(ring)
+            if _in_sector(rx[a], ry[a], rx[q], ry[q], rx[b], ry[b], mx, my):
+                p = int(q)
+                break
+    if rx[p] == mx and ry[p] == my:     # the hole touches the ring at M, no bridge is needed
+        return np.concatenate((ring[:p + 1], hole[k + 1:], hole[:k], ring[p:]))
+    return np.concatenate((ring[:p + 1], hole[k:], hole[:k + 1], ring[p:]))
+
+
+def _polygons(x, y, part_offsets, shape_offsets):
+    """ Returns (v, offsets, shape): the positions of the points of counter clockwise polygons (outer rings
+        with their holes bridged), (npolygons + 1,) offsets of each polygon in v and the shape of each polygon.
+        Rings with less than 3 vertices or no area and holes outside the outer rings are dropped.
+    """
+    v, ro = _rings(x, y, part_offsets)
+    n = np.diff(ro)
+    nshapes = len(shape_offsets) - 1
+    part = np.repeat(np.arange(len(n)), n)
+    ring_shape = np.repeat(np.arange(nshapes), np.diff(shape_offsets))
+    area = _signed_area(x, y, v, ro)
+    area[n < 3] = 0.0
+    cw = area < 0
+    has_cw = np.bincount(ring_shape[cw], minlength = nshapes) > 0
+    outer = cw | ((area > 0) & ~has_cw[ring_shape])
+    hole = (area > 0) & has_cw[ring_shape]
+
+    # outer rings counter clockwise, holes clockwise
+    flip = (outer & cw) | hole
+    pos = np.arange(len(v), dtype = np.int64)
+    v = np.where(flip[part], v[ro[part] + ro[part + 1] - 1 - pos], v)
+
+    # outer ring of each hole: the only one of its shape, or the smallest one that contains it
+    holes = np.nonzero(hole)[0]
+    outers = np.nonzero(outer)[0]
+    first_outer = np.full(nshapes, -1, dtype = np.int64)
+    first_outer[ring_shape[outers[::-1]]] = outers[::-1]
+    owner = first_outer[ring_shape[holes]]
+    nouter = np.bincount(ring_shape[outers], minlength = nshapes)
+    for i in np.nonzero(nouter[ring_shape[holes]] > 1)[0]:
+        h = holes[i]
+        s = ring_shape[h]
+        hx, hy = x[v[ro[h]]], y[v[ro[h]]]
+        owner[i] = -1
+        for o in range(shape_offsets[s], shape_offsets[s + 1]):
+            if not outer[o]: continue
+            r = v[ro[o]:ro[o + 1]]
+            if _inside_ring(hx, hy, x[r], y[r]) and (owner[i] < 0 or abs(area[o]) < abs(area[owner[i]])):
+                owner[i] = o
+    holes, owner = holes[owner >= 0], owner[owner >= 0]
+
+    # outer rings without holes are used as they are, the others are built one at a time
+    with_holes = np.zeros(len(n), dtype = bool)
+    with_holes[owner] = True
+    simple = outer & ~with_holes
+    polys = [v[simple[part]]]
+    sizes = [n[simple]]
+    shapes = [ring_shape[simple]]
+    by_owner = np.argsort(owner, kind = "stable")
+    holes, owner = holes[by_owner], owner[by_owner]
+    rings = np.nonzero(with_holes)[0]
+    starts = np.searchsorted(owner, rings, side = "left")
+    ends = np.searchsorted(owner, rings, side = "right")
+    for o, a, b in zip(rings, starts, ends):
+        ring = v[ro[o]:ro[o + 1]]
+        # holes from right to left
+        for h in sorted(holes[a:b], key = lambda h: -x[v[ro[h]:ro[h + 1]]].max()):
+            merged = _bridge(ring, v[ro[h]:ro[h + 1]], x, y)
+            if merged is not None: ring = merged
+        polys.append(ring)
+        sizes.append([len(ring)])
+        shapes.append([ring_shape[o]])
+
+    offsets = np.zeros(sum(len(s) for s in sizes) + 1, dtype = np.int64)
+    np.cumsum(np.concatenate(sizes), out = offsets[1:])
+    return np.concatenate(polys).astype(np.int64), offsets, np.concatenate(shapes).astype(np.int64)
+
+def _ear_clip(x, y, v, offsets, max_pairs = MAX_PAIRS):
+    """ Triangulates the counter clockwise polygons given by the positions of their points v and their
+        offsets in v. Returns (ntriangles, 3) positions of the points of each triangle (counter clockwise)
+        and (ntriangles,) polygon of each triangle.
+    """
+    npoly = len(offsets) - 1
+    n = np.diff(offsets)
+    pid = np.repeat(np.arange(npoly), n)
+    pos = np.arange(len(v), dtype = np.int64)
+    prev, nxt = pos - 1, pos + 1
+    nonempty = n > 0
+    prev[offsets[:-1][nonempty]] = offsets[1:][nonempty] - 1
+    nxt[offsets[1:][nonempty] - 1] = offsets[:-1][nonempty]
+    remaining = n.copy()
+    px, py = x[v], y[v]
+
+    # reflex vertices are sorted by pid + (x - xmin) / (2 * width), which is in [pid, pid + 0.5]
+    xmin = np.full(npoly, np.inf)
+    xmax = np.full(npoly, -np.inf)
+    np.minimum.at(xmin, pid, px)
+    np.maximum.at(xmax, pid, px)
+    scale = np.where(xmax > xmin, 0.5 / (xmax - xmin), 0.0)
+    eps = 1e-9 + 4 * np.spacing(float(npoly))
+    def key(p, xx):
+        return p + (xx - xmin[p]) * scale[p]
+
+    tri, owner = [], []
+    alive = pos[remaining[pid] >= 3]
+    it = 0
+    while len(alive) > 0:
+        # polygons reduced to a triangle
+        last = remaining[pid[alive]] == 3
+        if last.any():
+            p, i = np.unique(pid[alive[last]], return_index = True)
+            t = alive[last][i]
+            tri.append(np.column_stack((prev[t], t, nxt[t])))
+            owner.append(p)
+            remaining[p] = 0
+            alive = alive[~last]
+            if len(alive) == 0: break
+
+        a = alive
+        ia, ic = prev[a], nxt[a]
+        ax, ay, bx, by, cx, cy = px[ia], py[ia], px[a], py[a], px[ic], py[ic]
+        convex = _cross(ax, ay, bx, by, cx, cy) > 0
+
+        r = a[~convex]
+        rkey = key(pid[r], px[r])
+        order = np.argsort(rkey, kind = "stable")
+        r, rkey = r[order], rkey[order]
+
+        # convex vertices that have no reflex vertex in their triangle are ears
+        c = np.nonzero(convex)[0]
+        p = pid[a[c]]
+        tmin = np.minimum(np.minimum(ax[c], bx[c]), cx[c])
+        tmax = np.maximum(np.maximum(ax[c], bx[c]), cx[c])
+        lo = np.searchsorted(rkey, key(p, tmin) - eps, side = "left")
+        hi = np.searchsorted(rkey, key(p, tmax) + eps, side = "right")
+        counts = hi - lo
+        blocked = np.zeros(len(c), dtype = bool)
+        total = np.cumsum(counts)
+        i = 0
+        while i < len(c):
+            j = max(i + 1, int(np.searchsorted(total, (total[i - 1] if i > 0 else 0) + max_pairs, side = "right")))
+            cnt = counts[i:j]
+            k = np.repeat(np.arange(i, j), cnt)
+            first = np.zeros(len(cnt) + 1, dtype = np.int64)
+            np.cumsum(cnt, out = first[1:])
+            q = r[np.repeat(lo[i:j], cnt) + np.arange(first[-1], dtype = np.int64) - np.repeat(first[:-1], cnt)]
+            qx, qy = px[q], py[q]
+            ck = c[k]
+            tax, tay, tbx, tby, tcx, tcy = ax[ck], ay[ck], bx[ck], by[ck], cx[ck], cy[ck]
+            inside = (_cross(tax, tay, tbx, tby, qx, qy) >= 0) & (_cross(tbx, tby, tcx, tcy, qx, qy) >= 0) \
+                     & (_cross(tcx, tcy, tax, tay, qx, qy) >= 0)
+            # copies of the vertices of the triangle (e.g. at bridges) do not block it
+            inside &= ((qx != tax) | (qy != tay)) & ((qx != tbx) | (qy != tby)) & ((qx != tcx) | (qy != tcy))
+            blocked[k[inside]] = True
+            i = j
+        ears = a[c[~blocked]]
+
+        # ears whose tips are not adjacent: a pseudo random subset of the ears, without those that
+        # follow a selected ear
+        flag = np.zeros(len(v), dtype = bool)
+        flag[ears] = ((ears * 2654435761 + it * 40503) >> 16) & 1 == 1
+        chosen = ears[flag[ears] & ~flag[prev[ears]]]
+
+        # every polygon loses at least a vertex: its first ear, or its first convex vertex if it has no ear
+        # (invalid polygon), or its first vertex if it has no convex vertex
+        done = np.zeros(npoly, dtype = bool)
+        done[pid[chosen]] = True
+        extra = []
+        for cand in (ears, a[c], a):
+            cand = cand[~done[pid[cand]]]
+            if len(cand) == 0: continue
+            u, first = np.unique(pid[cand], return_index = True)
+            extra.append(cand[first])
+            done[u] = True
+        chosen = np.concatenate([chosen] + extra)
+
+        tri.append(np.column_stack((prev[chosen], chosen, nxt[chosen])))
+        owner.append(pid[chosen])
+        ip, inx = prev[chosen], nxt[chosen]
+        nxt[ip] = inx
+        prev[inx] = ip
+        remaining -= np.bincount(pid[chosen], minlength = npoly)
+        flag[:] = False
+        flag[chosen] = True
+        alive = alive[~flag[alive] & (remaining[pid[alive]] >= 3)]
+        it = it + 1
+
+    if len(tri) == 0:
+        return np.zeros((0, 3), dtype = np.int64), np.zeros(0, dtype = np.int64)
+    return v[np.concatenate(tri)], np.concatenate(owner)
+
+def triangulate(x, y, part_offsets, shape_offsets):
+    """ Triangulates polygons with holes (see above).
+
+        :param x, y: coordinates of all points
+        :param part_offsets: (nparts + 1,) position of the first point of each part (ring)
+        :param shape_offsets: (nshapes + 1,) position of the first part of each shape
+        :return: (ntriangles, 3) positions of the points of each triangle (counter clockwise) and
+                 (ntriangles,) shape of each triangle. Triangles are sorted by shape.
+    """
+    x = np.asarray(x, dtype = np.float64)
+    y = np.asarray(y, dtype = np.float64)
+    v, offsets, shape = _polygons(x, y, part_offsets, shape_offsets)
+    tri, poly = _ear_clip(x, y, v, offsets)
+    s = shape[poly]
+    order = np.argsort(s, kind = "stable")
+    return tri[order], s[order]
@@ -0,0 +1,103 @@
+# Polls a directory and reports the layers (.shp, .shx, .dbf and .prj files with the
+# same root) that changed and were completely written.
+#
+# GIS editors write the files of a layer one after the other and may take some time
+# to do it, so a layer is only reported when:
+#   1. the size and modification time of all its files did not change for at least
+#      debounce seconds, and
+#   2. the sizes of the .shp, .shx and .dbf files agree with the sizes stored in their
+#      headers (i.e. the files are not truncated).
+# Only the standard library is used: the directory is listed with os.scandir, which
+# is cheap even for thousands of files.
+########################################################################
+
+import os
+import time
+import struct
+
+# files of a layer that are watched, .shp and .dbf are required
+WATCH_EXT = [".shp", ".shx", ".dbf", ".prj"]
+
+def _size_from_header(path, ext):
+    """ Returns the size of the file in path according to its header, or None if the header cannot be read. """
+    try:
+        with open(path, "rb") as f:
+            h = f.read(32)
+    except OSError:
+        return None
+    if ext in (".shp", ".shx"):
+        if len(h) < 28: return None
+        return struct.unpack(">i", h[24:28])[0] * 2                 # 16-bit words
+    else:   # .dbf
+        if len(h) < 12: return None
+        num_records, size_header, size_record = struct.unpack("<I2H", h[4:12])
+        return size_header + num_records * size_record              # the end of file marker is optional
+
+def is_complete(root, state):
+    """ Returns True if the files of the layer root (path without extension) are not truncated.
+        state is the dictionary {ext: (size, mtime_ns)} returned by Watcher.scan.
+    """
+    if ".shp" not in state or ".dbf" not in state:
+        return False
+    for ext in (".shp", ".shx", ".dbf"):
+        if ext not in state: continue
+        expected = _size_from_header(root + ext, ext)
+        if expected is None or state[ext][0] < expected:
+            return False
+    return True
+
+class Watcher:
+
+    def __init__(self, directory, debounce = 2.0):
+        """
+        :param directory: directory with the shape files
+        :param debounce: time [s] the files of a layer must remain unchanged before it is reported
+        """
+        assert os.path.isdir(directory), "Path to watched directory must point to a directory"
+        self.directory = directory
+        self.debounce = debounce
+        self.seen = {}      # root: state of the layer when it was last reported
+        self.pending = {}   # root: (state, time when that state was first observed)
+
+    def __str__(self):
+        return "Watcher: %s (%d layers, %d pending)"%(self.directory, len(self.seen), len(self.pending))
+
+    def scan(self):
+        """ Returns a dictionary {root: {ext: (size, mtime_ns)}} with the files of every layer in the directory. """
+        layers = {}
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                root, ext = os.path.splitext(entry.name)
+                ext = ext.lower()
+                if ext not in WATCH_EXT or not entry.is_file(): continue
+                try:
+                    st = entry.stat()
+                except OSError:      # removed while listing
+                    continue
+                layers.setdefault(os.path.join(self.directory, root), {})[ext] = (st.st_size, st.st_mtime_ns)
+        return {root : state for root, state in layers.items() if ".shp" in state}
+
+    def poll(self, now = None):
+        """ Returns the sorted list of layers (paths without extension) that changed since they were last
+            reported and are ready to be exported. All layers are reported by the first calls.
+        """
+        now = time.monotonic() if now is None else now
+        layers = self.scan()
+        ready = []
+        for root, state in layers.items():
+            if self.seen.get(root) == state:
+                self.pending.pop(root, None)
+                continue
+            p = self.pending.get(root)
+            if p is None or p[0] != state:           # new change, wait until it settles
+                self.pending[root] = (state, now)
+            elif now - p[1] >= self.debounce and is_complete(root, state):
+                ready.append(root)
+                self.seen[root] = state
+                del self.pending[root]
+
+        for root in list(self.seen):                  # removed layers
+            if root not in layers: del self.seen[root]
+        for root in list(self.pending):
+            if root not in layers: del self.pending[root]
+        return sorted(ready)
@@ -0,0 +1,19 @@
+# Makes the gtv package importable when the tests are run from a checkout.
+# setup.py installs the src directory as the gtv package and shapeToVTK.py imports
+# version from its own directory, so both are done here if gtv is not installed.
+########################################################################
+
+import os, sys
+import importlib.util
+
+SRC = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+if SRC not in sys.path:
+    sys.path.append(SRC)
+
+if importlib.util.find_spec("gtv") is None:
+    spec = importlib.util.spec_from_file_location("gtv", os.path.join(SRC, "__init__.py"),
+                                                  submodule_search_locations = [SRC])
+    gtv = importlib.util.module_from_spec(spec)
+    sys.modules["gtv"] = gtv
+    spec.loader.exec_module(gtv)
@@ -0,0 +1,42 @@
+# Tests of the DEMs read by FileDem: values, bilinear interpolation and the NumPy cache of
+# ASCII grids.
+# Run with: python -m pytest tests (see conftest.py).
+########################################################################
+
+import os
+
+import numpy as np
+
+from gtv.files import dem as demfile
+from gtv.files.dem import FileDem, CACHE_EXT
+
+def write_grid(path, values, x0 = 0.0, y0 = 0.0, cellsize = 1.0, nodata = None):
+    nrows, ncols = values.shape
+    with open(path, "w") as f:
+        f.write("ncols %d\nnrows %d\nxllcorner %.17g\nyllcorner %.17g\ncellsize %.17g\n"%(ncols, nrows, x0, y0, cellsize))
+        if nodata is not None: f.write("NODATA_value %.17g\n"%nodata)
+        np.savetxt(f, values)
+
+def test_ascii_grid(tmp_path):
+    src = str(tmp_path / "dem.asc")
+    values = np.arange(12, dtype = np.float64).reshape(3, 4)
+    write_grid(src, values)
+    for cache in (True, False):
+        dem = FileDem.read(src, cache = cache)
+        assert np.array_equal(np.asarray(dem.data), values)
+        # centers of the cells, first row is the northern one
+        assert np.allclose(dem.sample([0.5, 1.0, 3.5], [2.5, 2.5, 0.5]), [0.0, 0.5, 11.0])
+    assert os.path.exists(src + CACHE_EXT)
+
+def test_cache_not_writable(tmp_path, monkeypatch):
+    src = str(tmp_path / "dem.asc")
+    values = np.arange(20, dtype = np.float64).reshape(4, 5)
+    write_grid(src, values)
+
+    # the conversion fails once the values were read (e.g. read-only directory)
+    def replace(a, b):
+        raise PermissionError(13, "Permission denied", b)
+    monkeypatch.setattr(demfile.os, "replace", replace)
+    dem = FileDem.read(src)
+    assert np.array_equal(np.asarray(dem.data), values)
+    assert not os.path.exists(src + CACHE_EXT) and not os.path.exists(src + CACHE_EXT + ".tmp")
@@ -0,0 +1,80 @@
+# Tests of the export of layers with shapeToVTK.export_files and of the manifest that
+# skips layers that did not change.
+# Run with: python -m pytest tests (see conftest.py).
+########################################################################
+
+import os, glob, shutil, struct
+
+import numpy as np
+
+from gtv.files.shp import FileShp
+from gtv.files.dem import FileDem
+from shapeToVTK import export_files
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), "..", "src", "examples", "ex1")
+
+def copy_layer(name, directory):
+    """ Copies the files of an example layer to directory, returns the path to the layer without extension. """
+    for f in glob.glob(os.path.join(EXAMPLES, name + ".*")):
+        shutil.copy(f, directory)
+    return os.path.join(str(directory), name)
+
+def write_dem(path, shp, value = 5.0):
+    """ Writes an ASCII grid with a constant elevation that covers the layer shp. """
+    g = FileShp.read(shp + ".shp").get_geometry()
+    x0, y0 = g.xyz[0].min() - 1.0, g.xyz[1].min() - 1.0
+    cs = max(g.xyz[0].max() - x0, g.xyz[1].max() - y0) / 8.0 + 1.0
+    with open(path, "w") as f:
+        f.write("ncols 10\nnrows 10\nxllcorner %.17g\nyllcorner %.17g\ncellsize %.17g\n"%(x0, y0, cs))
+        np.savetxt(f, np.full((10, 10), value))
+
+# the native writer is used, so the tests do not need evtk
+
+def test_dem_object_in_options(tmp_path):
+    shp = copy_layer("points", tmp_path)
+    dem = str(tmp_path / "dem.asc")
+    write_dem(dem, shp)
+    dst = str(tmp_path / "out" / "points")
+    os.makedirs(os.path.dirname(dst))
+
+    results = export_files([shp], [dst], 0.0, vtk_options = {"writer" : "native", "dem" : FileDem.read(dem)})
+    assert results.nfailed == 0 and len(results) == 1 and os.path.exists(dst + ".vtu")
+
+    # the manifest records the path of the DEM, so it is the same export as with the path
+    results = export_files([shp], [dst], 0.0, vtk_options = {"writer" : "native", "dem" : dem})
+    assert len(results) == 0 and len(results.skipped) == 1
+
+    # and the layer is exported again when the DEM changes
+    write_dem(dem, shp, value = 7.0)
+    results = export_files([shp], [dst], 0.0, vtk_options = {"writer" : "native", "dem" : FileDem.read(dem)})
+    assert results.nfailed == 0 and len(results) == 1
+
+def empty_layer(name, directory):
+    """ Copies an example layer to directory without its records, returns the path to the layer without extension. """
+    root = copy_layer(name, directory)
+    for ext in (".shp", ".shx"):
+        with open(root + ext, "r+b") as f:
+            f.truncate(100)
+            f.seek(24)
+            f.write(struct.pack(">i", 50))          # file length in 16-bit words
+    with open(root + ".dbf", "r+b") as f:
+        header = f.read(12)
+        f.seek(4)
+        f.write(struct.pack("<i", 0))               # number of records
+        f.truncate(struct.unpack("<h", header[8:10])[0])
+    return root
+
+def test_empty_layer_messages(tmp_path, capsys):
+    src = copy_layer("points", tmp_path)
+    dst = str(tmp_path / "points")
+    results = export_files([src], [dst + "_clip"], 0.0, clip = (-2.0, -2.0, -1.0, -1.0), vtk_options = {"writer" : "native"})
+    assert results.nfailed == 0
+    out = capsys.readouterr().out
+    assert "No shapes in clip window" in out
+
+    os.makedirs(str(tmp_path / "empty"))
+    src = empty_layer("points", tmp_path / "empty")
+    results = export_files([src], [dst + "_empty"], 0.0, vtk_options = {"writer" : "native"})
+    assert results.nfailed == 0
+    out = capsys.readouterr().out
+    assert "No shapes in layer" in out and "clip window" not in out
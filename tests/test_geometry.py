@@ -0,0 +1,61 @@
+# Tests of the per-shape views of GeometryArray (geometry[i]) for all the shape types
+# decoded by bulk.decode_records.
+# Run with: python -m pytest tests (see conftest.py).
+########################################################################
+
+import numpy as np
+import pytest
+
+from gtv.shapes.shape_types import TS
+from gtv.shapes.geometry import GeometryArray
+from gtv.shapes.point import Point
+from gtv.shapes.multipoint import Multipoint
+from gtv.shapes.polyline import Polyline
+from gtv.shapes.polygon import Polygon
+from gtv.shapes.polygonz import PolygonZ
+
+# shape type: (class of the views, points per shape, parts per shape)
+TYPES = { "POINT"       : (Point, 1, 1),
+          "POINTZ"      : (Point, 1, 1),
+          "MULTIPOINT"  : (Multipoint, 3, 1),
+          "MULTIPOINTZ" : (Multipoint, 3, 1),
+          "POLYLINE"    : (Polyline, 6, 2),
+          "POLYLINEZ"   : (Polyline, 6, 2),
+          "POLYGON"     : (Polygon, 8, 2),
+          "POLYGONZ"    : (PolygonZ, 8, 2) }
+
+def make_geometry(name, nshapes = 5):
+    cls, npoints, nparts = TYPES[name]
+    rng = np.random.default_rng(0)
+    xyz = rng.random((3, nshapes * npoints))
+    part_offsets = np.append(np.arange(nshapes * nparts) * (npoints // nparts), nshapes * npoints)
+    shape_offsets = np.arange(nshapes + 1) * nparts
+    bbox = np.column_stack([f(xyz[k].reshape(nshapes, npoints), axis = 1) for k in (0, 1) for f in (np.min, np.max)])
+    has_z = name.endswith("Z")
+    zrange = np.column_stack((xyz[2].reshape(nshapes, npoints).min(axis = 1), xyz[2].reshape(nshapes, npoints).max(axis = 1))) if has_z else None
+    m = rng.random(nshapes * npoints) if has_z else None
+    mrange = np.zeros((nshapes, 2)) if has_z else None
+    return GeometryArray(TS[name], np.arange(1, nshapes + 1), xyz, part_offsets, shape_offsets, bbox, zrange, m, mrange)
+
+@pytest.mark.parametrize("name", sorted(TYPES))
+def test_views(name):
+    cls, npoints, nparts = TYPES[name]
+    g = make_geometry(name)
+    has_z = name.endswith("Z")
+    shapes = list(g)
+    assert len(shapes) == len(g)
+    for i, s in enumerate(shapes):
+        assert isinstance(s, cls)
+        assert s.shape_type == TS[name]
+        assert s.idx == i + 1
+        pts = np.asarray(s.points, dtype = np.float64)
+        assert pts.shape == (npoints, 3 if has_z else 2)
+        assert np.array_equal(pts, g.xyz[:pts.shape[1], i * npoints:(i + 1) * npoints].T)
+        if has_z:
+            assert np.array_equal(s.mpoints, g.m[i * npoints:(i + 1) * npoints])
+    assert isinstance(g[-1], cls) and g[-1].idx == len(g)
+
+    # the views give back the same geometry
+    h = GeometryArray.from_shapes(TS[name], shapes)
+    assert np.array_equal(h.part_offsets, g.part_offsets) and np.array_equal(h.shape_offsets, g.shape_offsets)
+    assert np.array_equal(h.xyz[:3 if has_z else 2], g.xyz[:3 if has_z else 2])
@@ -0,0 +1,97 @@
+# Regression tests of the k nearest neighbors search (GridIndex) and of interpolate,
+# compared against a brute force search over all sample points.
+# Run with: python -m pytest tests (see conftest.py).
+########################################################################
+
+import os
+
+import numpy as np
+import pytest
+
+from gtv.interpolation import GridIndex, interpolate
+from gtv.files.shp import FileShp
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), "..", "src", "examples", "ex1")
+
+def brute_force(xp, yp, x, y, k):
+    """ Returns the sorted distances to the k nearest sample points of each query point. """
+    d = np.hypot(x[:, None] - xp[None, :], y[:, None] - yp[None, :])
+    return np.sort(d, axis = 1)[:, :k]
+
+def check_query(xp, yp, x, y, k):
+    index = GridIndex(xp, yp)
+    dist, idx = index.query(x, y, k)
+    k = min(k, len(xp))
+    assert dist.shape == idx.shape == (len(x), k)
+    assert np.allclose(dist, brute_force(xp, yp, x, y, k))
+    # positions point to sample points at those distances (ties may be returned in any order)
+    assert np.allclose(np.hypot(xp[idx] - x[:, None], yp[idx] - y[:, None]), dist)
+    assert np.all(np.diff(dist, axis = 1) >= 0)
+
+@pytest.mark.parametrize("k", [1, 4, 8])
+def test_uniform(k):
+    rng = np.random.default_rng(0)
+    xp, yp = rng.random(3000) * 1000, rng.random(3000) * 1000
+    x, y = rng.random(500) * 1200 - 100, rng.random(500) * 1200 - 100
+    check_query(xp, yp, x, y, k)
+
+def test_clustered():
+    rng = np.random.default_rng(1)
+    centers = rng.random((5, 2)) * 1e5
+    p = np.repeat(centers, 400, axis = 0) + rng.normal(scale = 10.0, size = (2000, 2))
+    q = rng.random((300, 2)) * 1e5
+    check_query(p[:, 0], p[:, 1], q[:, 0], q[:, 1], 8)
+
+def test_points_on_a_line():
+    rng = np.random.default_rng(2)
+    xp = rng.random(1000) * 1e4
+    yp = np.full(1000, 5.0)
+    x, y = rng.random(200) * 1e4, rng.random(200) * 100
+    check_query(xp, yp, x, y, 6)
+
+def test_duplicates_and_far_queries():
+    xp = np.array([0.0, 0.0, 0.0, 1.0, 1.0])
+    yp = np.array([0.0, 0.0, 0.0, 1.0, 1.0])
+    x, y = np.array([0.0, 1e6, -1e6]), np.array([0.0, 1e6, 3.0])
+    check_query(xp, yp, x, y, 3)
+
+def test_k_larger_than_samples():
+    xp, yp = np.array([0.0, 3.0]), np.array([0.0, 4.0])
+    dist, idx = GridIndex(xp, yp).query([0.0], [0.0], 5)
+    assert dist.shape == (1, 2)
+    assert np.allclose(dist, [[0.0, 5.0]])
+
+def test_interpolate_idw():
+    rng = np.random.default_rng(3)
+    xp, yp = rng.random(2000) * 100, rng.random(2000) * 100
+    zp = rng.random(2000)
+    x, y = rng.random(400) * 100, rng.random(400) * 100
+
+    d = np.hypot(x[:, None] - xp[None, :], y[:, None] - yp[None, :])
+    nearest = np.argsort(d, axis = 1)[:, :8]
+    w = 1.0 / np.take_along_axis(d, nearest, axis = 1)**2
+    expected = (w * zp[nearest]).sum(axis = 1) / w.sum(axis = 1)
+    assert np.allclose(interpolate(xp, yp, zp, x, y, k = 8), expected)
+
+    # sample points keep their values, constant fields remain constant
+    assert np.allclose(interpolate(xp, yp, zp, xp[:50], yp[:50]), zp[:50])
+    assert np.allclose(interpolate(xp, yp, np.full(2000, 7.0), x, y), 7.0)
+
+def test_interpolate_nearest():
+    rng = np.random.default_rng(4)
+    xp, yp, zp = rng.random(1000), rng.random(1000), rng.random(1000)
+    x, y = rng.random(300), rng.random(300)
+    d = np.hypot(x[:, None] - xp[None, :], y[:, None] - yp[None, :])
+    assert np.allclose(interpolate(xp, yp, zp, x, y, k = 1, method = "nearest"), zp[np.argmin(d, axis = 1)])
+
+def test_interpolateZ():
+    shp = FileShp.read(os.path.join(EXAMPLES, "polygons.shp"))
+    g = shp.get_geometry()
+    rng = np.random.default_rng(5)
+    xmin, xmax, ymin, ymax = g.xyz[0].min(), g.xyz[0].max(), g.xyz[1].min(), g.xyz[1].max()
+    xp, yp = xmin + rng.random(200) * (xmax - xmin), ymin + rng.random(200) * (ymax - ymin)
+    zp = rng.random(200)
+    z = shp.interpolateZ(xp, yp, zp, k = 1, method = "nearest")
+    d = np.hypot(g.xyz[0][:, None] - xp[None, :], g.xyz[1][:, None] - yp[None, :])
+    assert np.allclose(z, zp[np.argmin(d, axis = 1)])
+    assert np.allclose(shp.get_geometry().get_z(-1.0), z)
@@ -0,0 +1,78 @@
+# Tests of the spatial index of shape files (RTree) and of its sidecar file: queries are
+# compared against a linear scan of the bounding boxes, and sidecar files that cannot be
+# loaded must be rebuilt.
+# Run with: python -m pytest tests (see conftest.py).
+########################################################################
+
+import os, glob, shutil
+
+import numpy as np
+import pytest
+
+from gtv.files.shp import FileShp
+from gtv.files.rtree import RTree, SIDECAR_EXT
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), "..", "src", "examples", "ex1")
+
+def random_boxes(rng, n):
+    x, y = rng.random(n) * 1000, rng.random(n) * 1000
+    w, h = rng.random(n) * 20, rng.random(n) * 20
+    return np.column_stack((x, x + w, y, y + h))
+
+def scan(bbox, xmin, ymin, xmax, ymax):
+    hit = (bbox[:, 0] <= xmax) & (bbox[:, 1] >= xmin) & (bbox[:, 2] <= ymax) & (bbox[:, 3] >= ymin)
+    return np.nonzero(hit)[0]
+
+@pytest.mark.parametrize("n", [0, 1, 15, 16, 17, 5000])
+def test_query_bbox(n, tmp_path):
+    rng = np.random.default_rng(n)
+    bbox = random_boxes(rng, n)
+    tree = RTree.build(bbox, node_size = 16)
+    tree.save(str(tmp_path / "tree"))
+    loaded = RTree.load(str(tmp_path / "tree"))
+    for _ in range(50):
+        x, y = rng.random(2) * 1000
+        w = rng.random() * 200
+        expected = scan(bbox, x, y, x + w, y + w)
+        assert np.array_equal(tree.query_bbox(x, y, x + w, y + w), expected)
+        assert np.array_equal(loaded.query_bbox(x, y, x + w, y + w), expected)
+
+def corrupt_truncated(path):
+    with open(path, "rb") as f: b = f.read()
+    with open(path, "wb") as f: f.write(b[:len(b) // 2])
+
+def corrupt_garbage(path):
+    with open(path, "wb") as f: f.write(b"not a spatial index" * 10)
+
+def corrupt_old_format(path):
+    # same arrays without the version of the sidecar format
+    with np.load(path) as d:
+        arrays = {k : d[k] for k in d.files if k != "version"}
+    with open(path, "wb") as f: np.savez(f, **arrays)
+
+def corrupt_inconsistent(path):
+    with np.load(path) as d:
+        arrays = {k : d[k] for k in d.files}
+    arrays["ids"] = arrays["ids"] + len(arrays["ids"])
+    with open(path, "wb") as f: np.savez(f, **arrays)
+
+@pytest.mark.parametrize("corrupt", [corrupt_truncated, corrupt_garbage, corrupt_old_format, corrupt_inconsistent])
+def test_invalid_sidecar_is_rebuilt(corrupt, tmp_path):
+    for f in glob.glob(os.path.join(EXAMPLES, "polygons.*")):
+        shutil.copy(f, str(tmp_path))
+    src = str(tmp_path / "polygons.shp")
+    sidecar = str(tmp_path / ("polygons" + SIDECAR_EXT))
+
+    shp = FileShp.read(src)
+    expected = shp.get_index(save = False).query_bbox(-np.inf, -np.inf, np.inf, np.inf)
+    assert len(expected) > 0
+    shp.get_index(rebuild = True)
+    assert os.path.exists(sidecar)
+
+    corrupt(sidecar)
+    with pytest.raises(ValueError):
+        RTree.load(sidecar)
+    shp = FileShp.read(src)
+    assert np.array_equal(shp.query_bbox(-np.inf, -np.inf, np.inf, np.inf), expected)
+    # the sidecar was written again
+    assert np.array_equal(RTree.load(sidecar).query_bbox(-np.inf, -np.inf, np.inf, np.inf), expected)
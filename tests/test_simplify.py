@@ -0,0 +1,180 @@
+# Regression tests of the vectorized Douglas-Peucker simplification, compared against
+# the usual recursive version of the algorithm, and of the points kept to preserve the
+# topology of polygons (rings that do not cross after simplification).
+# Run with: python -m pytest tests (see conftest.py).
+########################################################################
+
+import numpy as np
+import pytest
+
+from gtv.shapes.simplify import douglas_peucker, importance, preserve_topology
+from gtv.shapes.shape_types import TS
+from gtv.shapes.geometry import GeometryArray
+from gtv.shapes.triangulate import triangulate
+
+def recursive(x, y, part_offsets, tolerance, rings = False):
+    """ Recursive Douglas-Peucker, part by part. Rings always keep their first two splits. """
+    keep = np.zeros(len(x), dtype = bool)
+
+    def split(a, b, depth):
+        if b - a < 2: return
+        dx, dy = x[b] - x[a], y[b] - y[a]
+        l2 = dx * dx + dy * dy
+        dmax, far = -1.0, -1
+        for i in range(a + 1, b):
+            px, py = x[i] - x[a], y[i] - y[a]
+            t = min(max((px * dx + py * dy) / l2, 0.0), 1.0) if l2 > 0 else 0.0
+            d = np.hypot(px - t * dx, py - t * dy)
+            if d > dmax: dmax, far = d, i
+        if dmax > tolerance or (rings and depth < 2):
+            keep[far] = True
+            split(a, far, depth + 1)
+            split(far, b, depth + 1)
+
+    for a, b in zip(part_offsets[:-1], np.asarray(part_offsets[1:]) - 1):
+        if b < a: continue
+        keep[a] = keep[b] = True
+        split(a, b, 0)
+    return keep
+
+def random_parts(rng, nparts, rings):
+    """ Random walks (lines) or noisy circles (closed rings) with varying numbers of points. """
+    xs, ys, offsets = [], [], [0]
+    for _ in range(nparts):
+        n = int(rng.integers(1, 300))
+        if rings:
+            n = max(n, 4)
+            angle = np.linspace(0.0, 2 * np.pi, n)
+            r = 100.0 + rng.normal(scale = 5.0, size = n)
+            r[-1] = r[0]
+            x, y = r * np.cos(angle), r * np.sin(angle)
+        else:
+            x, y = np.cumsum(rng.normal(size = n)), np.cumsum(rng.normal(size = n))
+        xs.append(x)
+        ys.append(y)
+        offsets.append(offsets[-1] + n)
+    return np.concatenate(xs), np.concatenate(ys), np.array(offsets)
+
+@pytest.mark.parametrize("rings", [False, True])
+@pytest.mark.parametrize("tolerance", [0.0, 0.5, 2.0, 10.0, 1e9])
+def test_against_recursive(rings, tolerance):
+    rng = np.random.default_rng(int(tolerance * 10) + rings)
+    x, y, offsets = random_parts(rng, 40, rings)
+    keep = douglas_peucker(x, y, offsets, tolerance, rings = rings)
+    assert np.array_equal(keep, recursive(x, y, offsets, tolerance, rings = rings))
+    assert np.all(keep[offsets[:-1]]) and np.all(keep[offsets[1:] - 1])
+    if rings:
+        assert np.all(np.add.reduceat(keep, offsets[:-1]) >= 4)
+
+@pytest.mark.parametrize("rings", [False, True])
+def test_importance(rings):
+    rng = np.random.default_rng(10 + rings)
+    x, y, offsets = random_parts(rng, 30, rings)
+    imp = importance(x, y, offsets, rings = rings)
+    for tolerance in [0.0, 0.1, 1.0, 3.0, 20.0, 1e9]:
+        assert np.array_equal(imp > tolerance, douglas_peucker(x, y, offsets, tolerance, rings = rings))
+
+def test_degenerate_parts():
+    # empty part, single point, repeated points and a closed segment of length zero
+    x = np.array([5.0, 1.0, 1.0, 1.0, 0.0, 1.0, 2.0, 0.0])
+    y = np.array([5.0, 1.0, 1.0, 1.0, 0.0, 3.0, 0.0, 0.0])
+    offsets = np.array([0, 0, 1, 4, 8])
+    for tolerance in [0.0, 1.0, 10.0]:
+        assert np.array_equal(douglas_peucker(x, y, offsets, tolerance), recursive(x, y, offsets, tolerance))
+    assert np.array_equal(douglas_peucker(x, y, offsets, 10.0, rings = True), recursive(x, y, offsets, 10.0, rings = True))
+
+def polygons(shapes):
+    """ GeometryArray with one polygon for each list of closed rings (n, 2). """
+    parts = [r for rings in shapes for r in rings]
+    xy = np.vstack(parts)
+    xyz = np.vstack((xy.T, np.zeros(len(xy))))
+    part_offsets = np.cumsum([0] + [len(r) for r in parts])
+    shape_offsets = np.cumsum([0] + [len(rings) for rings in shapes])
+    return GeometryArray(TS["POLYGON"], np.arange(1, len(shapes) + 1), xyz, part_offsets, shape_offsets)
+
+def subset(g, keep):
+    """ GeometryArray with the points of g that are kept. """
+    part_offsets = np.zeros(g.nparts + 1, dtype = np.int64)
+    np.cumsum(np.add.reduceat(keep, g.part_offsets[:-1]), out = part_offsets[1:])
+    return GeometryArray(g.shape_type, g.idx, g.xyz[:, keep], part_offsets, g.shape_offsets)
+
+def crossings(g):
+    """ Number of pairs of segments of the same shape that cross (brute force). """
+    x, y = g.xyz[0], g.xyz[1]
+    def side(px, py, qx, qy, rx, ry):
+        return np.sign((qx - px) * (ry - py) - (qy - py) * (rx - px))
+    total = 0
+    for i in range(len(g)):
+        po = g.part_offsets[g.shape_offsets[i]:g.shape_offsets[i + 1] + 1]
+        u = np.concatenate([np.arange(p, q - 1) for p, q in zip(po[:-1], po[1:])])
+        ax, ay, bx, by = x[u][:, None], y[u][:, None], x[u + 1][:, None], y[u + 1][:, None]
+        s1 = side(ax, ay, bx, by, ax.T, ay.T) * side(ax, ay, bx, by, bx.T, by.T)
+        s2 = side(ax.T, ay.T, bx.T, by.T, ax, ay) * side(ax.T, ay.T, bx.T, by.T, bx, by)
+        total += int(np.sum((s1 < 0) & (s2 < 0))) // 2
+    return total
+
+def area_error(g):
+    """ Largest difference between the area of the triangles of a shape and the area of its rings. """
+    x, y = g.xyz[0], g.xyz[1]
+    tri, shape = triangulate(x, y, g.part_offsets, g.shape_offsets)
+    a = 0.5 * ((x[tri[:, 1]] - x[tri[:, 0]]) * (y[tri[:, 2]] - y[tri[:, 0]]) -
+               (y[tri[:, 1]] - y[tri[:, 0]]) * (x[tri[:, 2]] - x[tri[:, 0]]))
+    po = g.part_offsets
+    rings = [-0.5 * np.sum(x[p:q - 1] * y[p + 1:q] - x[p + 1:q] * y[p:q - 1]) for p, q in zip(po[:-1], po[1:])]
+    expected = np.bincount(g.part_to_shape(), weights = rings, minlength = len(g))
+    return np.abs(np.bincount(shape, weights = a, minlength = len(g)) - expected).max()
+
+def test_hole_close_to_shell():
+    # with tolerance 1.5 the bump of the bottom edge of the shell is removed: its chord would leave
+    # the first hole outside the shell and cross the second one
+    shell = np.array([(0, 0), (0, 10), (10, 10), (10, 0), (5, -1), (0, 0)], dtype = float)
+    outside = np.array([(4.8, -0.3), (5.0, -0.6), (5.2, -0.3), (4.8, -0.3)], dtype = float)
+    across = np.array([(2.0, -0.2), (2.5, -0.3), (3.0, 0.5), (2.0, -0.2)], dtype = float)
+    for hole in (outside, across):
+        s, keep = polygons([[shell, hole]]).simplify(1.5)
+        assert keep[4]
+        assert crossings(s) == 0 and area_error(s) < 1e-9
+
+    # without holes the bump is removed
+    s, keep = polygons([[shell]]).simplify(1.5)
+    assert not keep[4] and s.npoints == 5
+
+@pytest.mark.parametrize("tolerance", [1.0, 2.0, 3.0])
+def test_rings_do_not_cross(tolerance):
+    rng = np.random.default_rng(int(tolerance * 10))
+    t = np.linspace(0.0, -2 * np.pi, 200)
+    shapes = []
+    for i in range(30):
+        r = 10.0 + rng.uniform(-0.5, 0.5, len(t))
+        r[-1] = r[0]
+        shell = np.column_stack((r * np.cos(t), r * np.sin(t))) + 30.0 * i
+        holes = []
+        for angle in (rng.random() + np.arange(4)) * np.pi / 2:
+            center = 30.0 * i + 9.0 * np.array([np.cos(angle), np.sin(angle)])
+            h = center + 0.4 * np.column_stack((np.cos(-t[::20]), np.sin(-t[::20])))
+            holes.append(np.vstack((h, h[:1])))
+        shapes.append([shell] + holes)
+    g = polygons(shapes)
+    assert crossings(g) == 0
+
+    # holes are close enough to their shells to cross them if parts are simplified independently
+    plain = douglas_peucker(g.xyz[0], g.xyz[1], g.part_offsets, tolerance, rings = True)
+    assert crossings(subset(g, plain)) > 0
+
+    s, keep = g.simplify(tolerance)
+    assert crossings(s) == 0 and area_error(s) < 1e-6
+    assert np.all(keep >= plain) and keep.sum() < g.npoints
+    # pairs tested in several batches
+    x, y = g.xyz[0], g.xyz[1]
+    assert np.array_equal(preserve_topology(x, y, g.part_offsets, g.shape_offsets, plain, max_pairs = 1000), keep)
+
+    # the same points are kept when simplifying with the importance of the points
+    g.compute_importance()
+    assert np.array_equal(g.simplify(tolerance)[1], keep)
+
+def test_preserve_topology_without_conflicts():
+    # a convex ring never encloses its own points
+    t = np.linspace(0.0, -2 * np.pi, 100)
+    x, y = np.cos(t), np.sin(t)
+    keep = douglas_peucker(x, y, [0, 100], 0.05, rings = True)
+    assert np.array_equal(preserve_topology(x, y, [0, 100], [0, 1], keep), keep)
@@ -0,0 +1,134 @@
+# Regression tests of the vectorized ear clipping: the triangles of each shape must have
+# positive area, cover the shape exactly (area and point containment compared with a
+# crossing number test on the rings) and, for simple polygons with holes, there must be
+# n + 2 * (holes - outer rings) of them (n vertices in all the rings).
+# Run with: python -m pytest tests (see conftest.py).
+########################################################################
+
+import numpy as np
+import pytest
+
+from gtv.shapes.triangulate import triangulate
+
+def close(p):
+    return np.vstack((p, p[:1]))
+
+def signed_area(r):
+    return 0.5 * np.sum(r[:-1, 0] * r[1:, 1] - r[1:, 0] * r[:-1, 1])
+
+def oriented(r, clockwise):
+    """ Returns the closed ring r with the given orientation (clockwise for outer rings). """
+    return r[::-1] if (signed_area(r) < 0) != clockwise else r
+
+def crossings(r, p):
+    """ Returns True for the points p (m, 2) inside the closed ring r (crossing number test). """
+    ax, ay, bx, by = r[:-1, 0], r[:-1, 1], r[1:, 0], r[1:, 1]
+    px, py = p[:, 0:1], p[:, 1:2]
+    with np.errstate(all = "ignore"):
+        return (((ay > py) != (by > py)) & (px < ax + (py - ay) * (bx - ax) / (by - ay))).sum(axis = 1) % 2 == 1
+
+def star(rng, cx, cy, r0, r1, n, clockwise):
+    """ Random star shaped ring around (cx, cy) with n vertices at distances between r0 and r1. """
+    t = (np.arange(n) + rng.uniform(0, 1, n)) * 2 * np.pi / n
+    r = rng.uniform(r0, r1, n)
+    return oriented(close(np.column_stack((cx + r * np.cos(t), cy + r * np.sin(t)))), clockwise)
+
+def run(shapes):
+    """ Triangulates a list of shapes (lists of closed rings), returns (x, y, triangles, shape, areas). """
+    parts = [r for s in shapes for r in s]
+    xy = np.vstack(parts)
+    x, y = xy[:, 0].copy(), xy[:, 1].copy()
+    part_offsets = np.cumsum([0] + [len(r) for r in parts])
+    shape_offsets = np.cumsum([0] + [len(s) for s in shapes])
+    tri, shape = triangulate(x, y, part_offsets, shape_offsets)
+    assert tri.shape == (len(shape), 3)
+    assert np.all(np.diff(shape) >= 0)
+    a = 0.5 * ((x[tri[:, 1]] - x[tri[:, 0]]) * (y[tri[:, 2]] - y[tri[:, 0]]) -
+               (y[tri[:, 1]] - y[tri[:, 0]]) * (x[tri[:, 2]] - x[tri[:, 0]]))
+    return x, y, tri, shape, a
+
+def check(shapes, rng, npoints = 500, count = True):
+    x, y, tri, shape, a = run(shapes)
+    assert np.all(a > 0)
+    for k, rings in enumerate(shapes):
+        # area of the outer rings minus the area of the holes
+        assert np.isclose(a[shape == k].sum(), -sum(signed_area(r) for r in rings), rtol = 1e-9)
+        if count:
+            n = sum(len(r) - 1 for r in rings)
+            holes = sum(signed_area(r) > 0 for r in rings)
+            outers = len(rings) - holes
+            assert np.sum(shape == k) == n + 2 * holes - 2 * outers
+
+        # every sample point is inside as many triangles as the shape contains it (0 or 1)
+        allr = np.vstack(rings)
+        p = rng.uniform(allr.min(axis = 0), allr.max(axis = 0), (npoints, 2))
+        inside = np.zeros(len(p), dtype = int)
+        for r in rings:
+            inside ^= crossings(r, p)
+        t = tri[shape == k]
+        ax, ay, bx, by, cx, cy = x[t[:, 0]], y[t[:, 0]], x[t[:, 1]], y[t[:, 1]], x[t[:, 2]], y[t[:, 2]]
+        px, py = p[:, 0:1], p[:, 1:2]
+        def left(ux, uy, vx, vy):
+            return (vx - ux) * (py - uy) - (vy - uy) * (px - ux) > 0
+        hits = (left(ax, ay, bx, by) & left(bx, by, cx, cy) & left(cx, cy, ax, ay)).sum(axis = 1)
+        assert np.array_equal(hits, inside)
+
+@pytest.mark.parametrize("seed", range(4))
+def test_random_stars_with_holes(seed):
+    rng = np.random.default_rng(seed)
+    shapes = []
+    for i in range(60):
+        cx, cy = (i % 10) * 30.0, (i // 10) * 30.0
+        rings = []
+        nout = int(rng.integers(1, 3))
+        for o in range(nout):
+            ox = cx + o * 12 - 6 * (nout - 1)
+            R = 5 if nout > 1 else 12
+            rings.append(star(rng, ox, cy, R * 0.6, R, int(rng.integers(16, 80)), True))
+            nh = int(rng.integers(0, 4))
+            for h in range(nh):
+                angle, d = 2 * np.pi * h / nh, R * 0.3 if nh > 1 else 0.0
+                rmax = R * 0.12 if nh > 1 else R * 0.3
+                rings.append(star(rng, ox + d * np.cos(angle), cy + d * np.sin(angle), R * 0.05, rmax,
+                                  int(rng.integers(3, 30)), False))
+        shapes.append(rings)
+    check(shapes, rng, npoints = 200)
+
+def test_comb():
+    n = 200
+    teeth = [(2 * i + dx, h) for i in range(n) for dx, h in ((0, 10), (1, 10), (1, 1), (2, 1))]
+    comb = close(np.array([(0, 0)] + teeth[:-1] + [(2 * n - 1, 0)], dtype = float))
+    check([[oriented(comb, True)]], np.random.default_rng(0), npoints = 2000)
+
+def test_grid_of_holes():
+    outer = oriented(close(np.array([(0, 0), (0, 100), (100, 100), (100, 0)], dtype = float)), True)
+    holes = [oriented(close(np.array([(i * 5 + 1, j * 5 + 1), (i * 5 + 3, j * 5 + 1), (i * 5 + 3, j * 5 + 3),
+                                      (i * 5 + 1, j * 5 + 3)], dtype = float)), False)
+             for i in range(20) for j in range(20)]
+    check([[outer] + holes], np.random.default_rng(1), npoints = 2000)
+
+def test_hole_touching_outer_vertex():
+    outer = oriented(close(np.array([(0, 0), (0, 10), (10, 10), (10, 0)], dtype = float)), True)
+    hole = oriented(close(np.array([(5, 5), (10, 10), (5, 8)], dtype = float)), False)
+    check([[outer, hole]], np.random.default_rng(2), npoints = 2000, count = False)
+
+def test_large_rings():
+    rng = np.random.default_rng(3)
+    t = np.linspace(0, 2 * np.pi, 5000, endpoint = False)
+    circle = oriented(close(np.column_stack((np.cos(t), np.sin(t)))), True)
+    check([[circle], [star(rng, 3.0, 0.0, 0.5, 1.0, 5000, True)]], rng, npoints = 300)
+
+def test_counter_clockwise_outer_ring():
+    # shapes without clockwise rings are outer rings with the wrong orientation
+    square = oriented(close(np.array([(0, 0), (0, 1), (1, 1), (1, 0)], dtype = float)), False)
+    x, y, tri, shape, a = run([[square]])
+    assert len(tri) == 2 and np.all(a > 0) and np.isclose(a.sum(), 1.0)
+
+def test_empty_and_degenerate():
+    tri, shape = triangulate(np.zeros(0), np.zeros(0), [0], [0])
+    assert tri.shape == (0, 3) and len(shape) == 0
+
+    # repeated points are removed, the triangle remains
+    ring = oriented(close(np.array([(0, 0), (0, 0), (0, 1), (0, 1), (1, 0)], dtype = float)), True)
+    x, y, tri, shape, a = run([[ring]])
+    assert len(tri) == 1 and np.isclose(a.sum(), 0.5)